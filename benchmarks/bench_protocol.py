@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+from typing import Callable, Dict, List
+
+from benchmarks.traces import steady_trace, sync_trace
+from wspr.channel import Channel
+from wspr.columnar import ColumnarState
+from wspr.control.converter import PacketConverter
+from wspr.control.framing import FrameBuffer
+from wspr.control.sink import EventSink
+from wspr.protocol.mumble_pb2 import ChannelState, UserState
+from wspr.protocol.packet_type import PacketType
+from wspr.state import ServerState
+from wspr.user import User
+
+# Every benchmark prepares its input outside of the measurement and returns a function which processes it and
+# returns the number of frames it processed.
+
+# Bytes handed to the frame buffer at a time, what a single read from the socket returns at most
+READ_SIZE = 64 * 1024
+
+
+class BenchConnection:
+    """Just enough of a connection for the packet handlers."""
+
+    def __init__(self):
+        """"""
+        self.authenticating = True
+
+    def is_authenticating(self) -> bool:
+        """"""
+        return self.authenticating
+
+    def set_connected(self) -> None:
+        """"""
+        self.authenticating = False
+
+    def set_bandwidth_limit(self, bandwidth: int) -> None:
+        """"""
+
+    def crypt_setup(self, message) -> None:
+        """"""
+
+    def send_ping(self) -> None:
+        """"""
+
+    def incoming_ping(self) -> None:
+        """"""
+
+
+class BenchClient:
+    """Just enough of a client for the packet handlers."""
+
+    def __init__(self, state: ServerState):
+        """"""
+        self.state = state
+        self.blobs = None
+        self.voice = None
+        self.recorder = None
+
+
+def read(trace: bytes) -> List:
+    """Split a trace into packets the way the connection does, a read at a time."""
+    converter = PacketConverter()
+    buffer = FrameBuffer()
+    packets = []
+    for offset in range(0, len(trace), READ_SIZE):
+        buffer.feed(trace[offset:offset + READ_SIZE])
+        packets.extend(converter.buffer_to_packets(buffer))
+    return packets
+
+
+def pipeline(trace: bytes, state: ServerState, events: list) -> int:
+    """Read, handle and apply every packet of a trace, like the main loop does."""
+    connection = BenchConnection()
+    client = BenchClient(state)
+    sink = EventSink(events.append)
+    converter = PacketConverter()
+    buffer = FrameBuffer()
+    frames = 0
+    for offset in range(0, len(trace), READ_SIZE):
+        buffer.feed(trace[offset:offset + READ_SIZE])
+        for packet in converter.buffer_to_packets(buffer):
+            if hasattr(packet, 'update'):
+                packet.update(connection, sink, client)
+            else:
+                packet.handle(connection, sink)
+            frames += 1
+    return frames
+
+
+def bench_framing(users: int) -> Callable[[], int]:
+    """FrameBuffer and PacketConverter.buffer_to_packets only, payloads stay undecoded."""
+    trace = sync_trace(users)
+    return lambda: len(read(trace))
+
+
+def bench_sync(users: int) -> Callable[[], int]:
+    """A client connecting: every packet is decoded, handled and applied to the server state."""
+    trace = sync_trace(users)
+    return lambda: pipeline(trace, ServerState(), [])
+
+
+def bench_sync_columnar(users: int) -> Callable[[], int]:
+    """Same as sync, with users stored in columns."""
+    trace = sync_trace(users)
+    return lambda: pipeline(trace, ColumnarState(), [])
+
+
+def bench_steady(users: int) -> Callable[[], int]:
+    """A connected client: state changes, text messages, pings and voice, after the sync."""
+    state = ServerState()
+    pipeline(sync_trace(users), state, [])
+    trace = steady_trace(users, max(users, 1000))
+    return lambda: pipeline(trace, state, [])
+
+
+def bench_models(users: int) -> Callable[[], int]:
+    """User and Channel records applying decoded messages, protobuf decoding isn't measured."""
+    messages = [packet.payload.message for packet in read(sync_trace(users))
+                if packet.packet_type in (PacketType.USERSTATE, PacketType.CHANNELSTATE)]
+
+    def run() -> int:
+        """"""
+        records = {}
+        for message in messages:
+            if isinstance(message, UserState):
+                record = records.get(('user', message.session))
+                if record is None:
+                    record = records[('user', message.session)] = User()
+            elif isinstance(message, ChannelState):
+                record = records.get(('channel', message.channel_id))
+                if record is None:
+                    record = records[('channel', message.channel_id)] = Channel()
+            record.update(message)
+        return len(messages)
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[int], Callable[[], int]]] = {
+    "framing": bench_framing,
+    "sync": bench_sync,
+    "sync_columnar": bench_sync_columnar,
+    "steady": bench_steady,
+    "models": bench_models,
+}
+
+
+def bench_replay(trace: bytes) -> Callable[[], int]:
+    """A recorded trace through the whole pipeline."""
+    return lambda: pipeline(trace, ServerState(), [])
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+Connects many bots to a mock Murmur (or any server) at once and measures the client side.
+
+    python -m benchmarks.load --bots 200 --users 10000 --text-rate 20 --voice-rate 250 --duration 10
+
+Reports how long connecting took, CPU use of this process while connected, and the latency of text messages the
+bots send each other in pairs. Without --address the mock server runs in this process and its CPU time counts as
+well, run python -m benchmarks.murmur separately to leave it out.
+"""
+
+import argparse
+import asyncio
+import resource
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.murmur import MockMurmur
+from wspr.containers.address import Address
+from wspr.containers.credentials import Credentials
+from wspr.control.events import ServerSyncReceivedEvent, TextMessageReceivedEvent
+from wspr.control.filters import EventFilter, Subscription
+from wspr.hub import MumbleHub
+from wspr.protocol.packet_type import PacketType
+
+# Text messages carrying this prefix and the time they were sent are used to measure latency
+PROBE = "probe "
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def cpu_time() -> float:
+    """Seconds of CPU this process used, in user and system mode."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class LoadTest:
+    """Bots in a hub, every bot's events are counted and probes are timed."""
+
+    def __init__(self, address: Address, bots: int, interval: float = 1.0, concurrency: int = 32):
+        """Every bot sends its partner a probe every interval seconds, at most concurrency bots connect at a time."""
+        self.address: Address = address
+        self.bots: int = bots
+        self.interval: float = interval
+        self.hub: MumbleHub = MumbleHub(max_concurrent_connects=concurrency)
+        self.events: int = 0
+        # Seconds from starting to connect until ServerSync, by bot
+        self.connect_times: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        # Session the server gave every bot
+        self.sessions: Dict[int, int] = {}
+        self._started: Dict[int, float] = {}
+        self._synced: Optional[asyncio.Event] = None
+
+    async def __collect(self) -> None:
+        """"""
+        async for key, event in self.hub:
+            self.events += 1
+            now = time.perf_counter()
+            if isinstance(event, ServerSyncReceivedEvent):
+                self.connect_times[key] = now - self._started[key]
+                self.sessions[key] = event.get_payload().session
+                if len(self.connect_times) == self.bots:
+                    self._synced.set()
+            elif isinstance(event, TextMessageReceivedEvent):
+                text = event.get_payload().message
+                if text.startswith(PROBE):
+                    self.latencies.append(now - float(text[len(PROBE):]))
+
+    async def __connect(self, key: int) -> None:
+        """"""
+        # Made up text and voice are counted, but never decoded into events
+        event_filter = EventFilter([Subscription(PacketType.SERVERSYNC), Subscription(PacketType.TEXTMESSAGE)])
+        self._started[key] = time.perf_counter()
+        await self.hub.add(key, self.address, Credentials("Bot {}".format(key)), event_filter=event_filter)
+
+    def partner(self, key: int) -> int:
+        """Bot the given bot probes, the server never sends messages back to their sender. An odd one out probes 0."""
+        partner = key ^ 1
+        return partner if partner < self.bots else 0
+
+    async def __probe(self, key: int) -> None:
+        """"""
+        client = self.hub[key]
+        session = self.sessions[self.partner(key)]
+        while True:
+            await asyncio.sleep(self.interval)
+            await client.send_text_message(PROBE + repr(time.perf_counter()), sessions=[session])
+
+    async def run(self, duration: float) -> Dict[str, float]:
+        """Connect every bot, stay connected for duration seconds and disconnect."""
+        self._synced = asyncio.Event()
+        collector = asyncio.get_event_loop().create_task(self.__collect())
+        start = time.perf_counter()
+        await asyncio.gather(*(self.__connect(key) for key in range(self.bots)))
+        await self._synced.wait()
+        connected = time.perf_counter() - start
+
+        probes = [asyncio.get_event_loop().create_task(self.__probe(key)) for key in range(self.bots)]
+        events, cpu, wall = self.events, cpu_time(), time.perf_counter()
+        await asyncio.sleep(duration)
+        cpu, wall, events = cpu_time() - cpu, time.perf_counter() - wall, self.events - events
+        for probe in probes:
+            probe.cancel()
+        await self.hub.close()
+        collector.cancel()
+
+        connect_times = list(self.connect_times.values())
+        return {
+            "connect_all_s": connected,
+            "connect_p50_ms": statistics.median(connect_times) * 1000,
+            "connect_max_ms": max(connect_times) * 1000,
+            "cpu_percent": cpu / wall * 100,
+            "events_per_s": events / wall,
+            "latency_p50_ms": percentile(self.latencies, 0.5) * 1000,
+            "latency_p99_ms": percentile(self.latencies, 0.99) * 1000,
+            "probes": len(self.latencies),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """"""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", type=Address.from_string, help="host:port of a running server")
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to stay connected")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds in between probes of a bot")
+    parser.add_argument("--concurrency", type=int, default=32, help="bots connecting at the same time")
+    parser.add_argument("--channels", type=int, default=10, help="made up channels of the in process server")
+    parser.add_argument("--users", type=int, default=0, help="made up users of the in process server")
+    parser.add_argument("--text-rate", type=float, default=0.0, help="made up text messages per second per bot")
+    parser.add_argument("--voice-rate", type=float, default=0.0, help="made up voice packets per second per bot")
+    arguments = parser.parse_args(argv)
+
+    async def run():
+        """"""
+        server = None
+        address = arguments.address
+        if address is None:
+            server = MockMurmur(arguments.channels, arguments.users, arguments.text_rate, arguments.voice_rate)
+            address = await server.start()
+        try:
+            results = await LoadTest(address, arguments.bots, arguments.interval, arguments.concurrency).run(
+                arguments.duration)
+        finally:
+            if server is not None:
+                await server.close()
+        for name, value in results.items():
+            print("{:<16} {:>12.2f}".format(name, value))
+        if server is not None:
+            print("{:<16} {:>12}".format("server_dropped", server.dropped))
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+
+"""
+Stand-in for a Murmur server, to connect clients to without a network or a real server.
+
+    python -m benchmarks.murmur --port 64738 --users 10000 --text-rate 20 --voice-rate 500
+
+Speaks the control protocol over TLS: the handshake, the channel tree, users, pings, text messages and tunnelled
+voice. Besides the clients connected to it, it can make up a large tree with idle users, and flood every client
+with text messages and voice from those users at a fixed rate. There is no UDP, clients tunnel their voice.
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import random
+import ssl
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.traces import frame
+from wspr.containers.address import Address
+from wspr.control.framing import FrameBuffer
+from wspr.protocol.mumble_pb2 import (
+    Authenticate,
+    ChannelState,
+    CodecVersion,
+    CryptSetup,
+    Ping,
+    Reject,
+    ServerConfig,
+    ServerSync,
+    TextMessage,
+    UserRemove,
+    UserState,
+    Version,
+)
+from wspr.protocol.packet_type import PacketType
+from wspr.protocol.varint import encode_varint
+from wspr.voice.packet import VoiceType
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+# Messages clients send which the server understands, everything else is ignored
+MESSAGES = {
+    PacketType.VERSION: Version,
+    PacketType.AUTHENTICATE: Authenticate,
+    PacketType.PING: Ping,
+    PacketType.TEXTMESSAGE: TextMessage,
+    PacketType.USERSTATE: UserState,
+}
+
+# Seconds in between two rounds of made up text messages and voice
+TICK = 0.02
+# Made up voice is sent in 20 ms frames, sequence numbers count 10 ms
+SEQUENCE_STEP = 2
+
+
+def create_server_context(certificate_file: Optional[Path] = None, key_file: Optional[Path] = None) -> ssl.SSLContext:
+    """Server side TLS settings, with a new self-signed certificate unless one is given."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    if certificate_file is not None:
+        context.load_cert_chain(str(certificate_file), str(key_file) if key_file is not None else None)
+        return context
+    if x509 is None:
+        raise RuntimeError("Generating a certificate requires the cryptography package, pass one instead")
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Mock Murmur")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder()
+                   .subject_name(name)
+                   .issuer_name(name)
+                   .public_key(key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(days=1))
+                   .not_valid_after(now + datetime.timedelta(days=30))
+                   .sign(key, hashes.SHA256()))
+    # The ssl module only loads certificates from files
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "murmur.pem"
+        path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM) + key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+        context.load_cert_chain(str(path))
+    return context
+
+
+class MurmurSession(asyncio.Protocol):
+    """One connected client, as seen by the server."""
+
+    def __init__(self, server: 'MockMurmur'):
+        """"""
+        self._server: MockMurmur = server
+        self._buffer: FrameBuffer = FrameBuffer()
+        self.transport: Optional[asyncio.Transport] = None
+        # Assigned once authenticated
+        self.session: Optional[int] = None
+        self.state: UserState = UserState()
+        self.version: Optional[Version] = None
+        # Frames which weren't sent because the client didn't keep up
+        self.dropped: int = 0
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        """"""
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        """"""
+        self._buffer.feed(data)
+        next_frame = self._buffer.next_frame()
+        while next_frame is not None:
+            packet_type, view = next_frame
+            with view:
+                payload = bytes(view)
+            self._server.received += 1
+            try:
+                packet_type = PacketType(packet_type)
+            except ValueError:
+                packet_type = None
+            if packet_type == PacketType.UDPTUNNEL:
+                self._server.voice(self, payload)
+            elif packet_type in MESSAGES:
+                message = MESSAGES[packet_type]()
+                message.ParseFromString(payload)
+                self._server.dispatch(self, packet_type, message)
+            next_frame = self._buffer.next_frame()
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        """"""
+        self.transport = None
+        self._server.leave(self)
+
+    def write(self, data: bytes, frames: int = 1, droppable: bool = False) -> None:
+        """Send framed data, droppable data is skipped while the client is behind."""
+        if self.transport is None or self.transport.is_closing():
+            return
+        if droppable and self.transport.get_write_buffer_size() > self._server.max_backlog:
+            self.dropped += frames
+            self._server.dropped += frames
+            return
+        self.transport.write(data)
+        self._server.sent += frames
+
+    def send(self, packet_type: PacketType, message) -> None:
+        """"""
+        self.write(frame(packet_type, message))
+
+    def close(self) -> None:
+        """"""
+        if self.transport is not None:
+            self.transport.close()
+
+
+class MockMurmur:
+    """
+    Accepts clients, authenticates everyone (unless a password is set) and relays what they send to each other.
+    Text messages and voice from the made up users are sent to every authenticated client.
+    """
+
+    def __init__(self, channels: int = 10, users: int = 0, text_rate: float = 0.0, voice_rate: float = 0.0,
+                 speakers: int = 4, password: str = "", welcome_text: str = "Mock Murmur", max_bandwidth: int = 558000,
+                 max_backlog: int = 4 * 1024 * 1024, ssl_context: Optional[ssl.SSLContext] = None, seed: int = 0):
+        """
+        Users is the amount of made up, idle users spread over the made up channels.
+        Text rate is in messages per second, voice rate in packets per second, both sent to every client.
+        Voice packets come from the first speakers made up users, without made up users there is no voice.
+        Made up traffic for a client is dropped while more than max backlog bytes are waiting to be sent to it.
+        """
+        self._logger: logging.Logger = logging.getLogger('whisper')
+        self._rng: random.Random = random.Random(seed)
+        self.channel_count: int = channels
+        self.user_count: int = users
+        self.text_rate: float = text_rate
+        self.voice_rate: float = voice_rate
+        self.speakers: int = min(speakers, users)
+        self.password: str = password
+        self.welcome_text: str = welcome_text
+        self.max_bandwidth: int = max_bandwidth
+        self.max_backlog: int = max_backlog
+        self._ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._ticker: Optional[asyncio.TimerHandle] = None
+        self._ticked: float = 0.0
+        self._text_credit: float = 0.0
+        self._voice_credit: float = 0.0
+        self._sequences: List[int] = [0] * self.speakers
+
+        # Made up users come first, connected clients get the sessions after them
+        self._next_session: int = users + 1
+        self.clients: Dict[int, MurmurSession] = {}
+        self._tree: bytes = self.__make_tree()
+
+        # Frames sent, received and not sent because clients were behind, over all clients
+        self.sent: int = 0
+        self.received: int = 0
+        self.dropped: int = 0
+
+    def __make_tree(self) -> bytes:
+        """Channel and user states of everything made up, the same for every client."""
+        frames = [frame(PacketType.CHANNELSTATE, ChannelState(channel_id=0, name="Root", position=0))]
+        for channel_id in range(1, self.channel_count + 1):
+            frames.append(frame(PacketType.CHANNELSTATE, ChannelState(
+                channel_id=channel_id,
+                parent=self._rng.randrange(channel_id),
+                name="Channel {}".format(channel_id),
+                position=channel_id,
+            )))
+        for session in range(1, self.user_count + 1):
+            state = UserState(session=session, user_id=session, name="User {}".format(session))
+            channel_id = self._rng.randrange(self.channel_count + 1)
+            # Like Murmur, the channel is left out for users in the root channel
+            if channel_id:
+                state.channel_id = channel_id
+            frames.append(frame(PacketType.USERSTATE, state))
+        return b"".join(frames)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> Address:
+        """Start accepting clients, port 0 picks a free one. Returns the address to connect to."""
+        if self._ssl_context is None:
+            self._ssl_context = create_server_context()
+        loop = asyncio.get_event_loop()
+        self._server = await loop.create_server(lambda: MurmurSession(self), host, port, ssl=self._ssl_context)
+        port = self._server.sockets[0].getsockname()[1]
+        self._ticked = time.monotonic()
+        if self.text_rate or self.voice_rate:
+            self._ticker = loop.call_later(TICK, self.__tick)
+        self._logger.debug("Mock Murmur listening on %s:%s", host, port)
+        return Address(host, port)
+
+    async def close(self) -> None:
+        """Stop accepting clients and disconnect everyone."""
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        if self._server is not None:
+            self._server.close()
+        for client in list(self.clients.values()):
+            client.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+
+    def dispatch(self, client: MurmurSession, packet_type: PacketType, message) -> None:
+        """Handle a control message from a client."""
+        if packet_type == PacketType.VERSION:
+            client.version = message
+        elif packet_type == PacketType.AUTHENTICATE:
+            self.__authenticate(client, message)
+        elif client.session is None:
+            # Nothing else is allowed before authenticating
+            return
+        elif packet_type == PacketType.PING:
+            client.send(PacketType.PING, Ping(timestamp=message.timestamp, good=message.good, late=message.late,
+                                              lost=message.lost))
+        elif packet_type == PacketType.TEXTMESSAGE:
+            self.__text_message(client, message)
+        elif packet_type == PacketType.USERSTATE:
+            self.__user_state(client, message)
+
+    def __authenticate(self, client: MurmurSession, message: Authenticate) -> None:
+        """Send the whole server state, and let everyone else know about the new user."""
+        if client.session is not None:
+            return
+        if self.password and message.password != self.password:
+            client.send(PacketType.REJECT, Reject(type=Reject.WrongServerPW, reason="Wrong server password"))
+            client.close()
+            return
+        client.session = self._next_session
+        self._next_session += 1
+        # New users are in the root channel, which goes without saying
+        client.state = UserState(session=client.session, name=message.username or "Anonymous")
+        announcement = frame(PacketType.USERSTATE, client.state)
+        for other in self.clients.values():
+            other.write(announcement)
+        self.clients[client.session] = client
+
+        frames = [
+            frame(PacketType.VERSION, Version(version=0x010204, release="1.2.4", os="Mock", os_version="Murmur")),
+            frame(PacketType.CRYPTSETUP, CryptSetup(key=os.urandom(16), client_nonce=os.urandom(16),
+                                                    server_nonce=os.urandom(16))),
+            frame(PacketType.CODECVERSION, CodecVersion(alpha=-2147483637, beta=0, prefer_alpha=True, opus=True)),
+            self._tree,
+        ]
+        frames.extend(frame(PacketType.USERSTATE, other.state) for other in self.clients.values())
+        frames.append(frame(PacketType.SERVERSYNC, ServerSync(session=client.session, max_bandwidth=self.max_bandwidth,
+                                                              welcome_text=self.welcome_text, permissions=0xF07FF)))
+        frames.append(frame(PacketType.SERVERCONFIG, ServerConfig(allow_html=True, message_length=5000,
+                                                                  image_message_length=131072)))
+        client.write(b"".join(frames), frames=self.channel_count + self.user_count + len(self.clients) + 5)
+
+    def __text_message(self, client: MurmurSession, message: TextMessage) -> None:
+        """Relay to the sessions and the users in the channels it's meant for, trees aren't followed or the sender."""
+        message.actor = client.session
+        data = frame(PacketType.TEXTMESSAGE, message)
+        channels = set(message.channel_id)
+        for other in self.clients.values():
+            if other is not client and (other.session in message.session or other.state.channel_id in channels):
+                other.write(data)
+
+    def __user_state(self, client: MurmurSession, message: UserState) -> None:
+        """Users may change their own state, changes to others are ignored."""
+        if message.HasField('session') and message.session != client.session:
+            return
+        message.session = client.session
+        message.actor = client.session
+        client.state.MergeFrom(message)
+        data = frame(PacketType.USERSTATE, message)
+        for other in self.clients.values():
+            other.write(data)
+
+    def voice(self, client: MurmurSession, payload: bytes) -> None:
+        """Relay voice to everyone else in the channel, with the session of the speaker added. Pings are echoed."""
+        if client.session is None or not payload:
+            return
+        if payload[0] >> 5 == VoiceType.PING:
+            client.write(frame(PacketType.UDPTUNNEL, payload))
+            return
+        data = frame(PacketType.UDPTUNNEL, payload[:1] + encode_varint(client.session) + payload[1:])
+        for other in self.clients.values():
+            if other is not client and other.state.channel_id == client.state.channel_id:
+                other.write(data, droppable=True)
+
+    def leave(self, client: MurmurSession) -> None:
+        """"""
+        if client.session is None or self.clients.pop(client.session, None) is None:
+            return
+        data = frame(PacketType.USERREMOVE, UserRemove(session=client.session))
+        for other in self.clients.values():
+            other.write(data)
+
+    def __tick(self) -> None:
+        """Send the made up traffic which is due since the last tick to every client."""
+        now = time.monotonic()
+        elapsed = now - self._ticked
+        self._ticked = now
+        self._text_credit += elapsed * self.text_rate
+        self._voice_credit += elapsed * self.voice_rate
+        texts, voices = int(self._text_credit), int(self._voice_credit)
+        self._text_credit -= texts
+        self._voice_credit -= voices
+        if not self.speakers:
+            # Voice needs made up users to come from
+            voices = 0
+        frames = [self.__made_up_text() for _ in range(texts)] + [self.__made_up_voice() for _ in range(voices)]
+        if frames and self.clients:
+            data = b"".join(frames)
+            for client in self.clients.values():
+                client.write(data, frames=len(frames), droppable=True)
+        self._ticker = asyncio.get_event_loop().call_later(TICK, self.__tick)
+
+    def __made_up_text(self) -> bytes:
+        """"""
+        actor = self._rng.randrange(1, self.user_count + 1) if self.user_count else 0
+        return frame(PacketType.TEXTMESSAGE, TextMessage(
+            actor=actor, channel_id=[0], message="Flood {}".format(self._rng.getrandbits(32))))
+
+    def __made_up_voice(self) -> bytes:
+        """A 20 ms Opus frame of one of the speakers, which take turns."""
+        speaker = self._rng.randrange(self.speakers)
+        sequence = self._sequences[speaker]
+        self._sequences[speaker] = sequence + SEQUENCE_STEP
+        data = b"\xF8" + bytes(self._rng.getrandbits(8) for _ in range(59))
+        header = bytes((VoiceType.OPUS << 5,)) + encode_varint(speaker + 1) + encode_varint(sequence)
+        return frame(PacketType.UDPTUNNEL, header + encode_varint(len(data)) + data)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """"""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.murmur", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=64738)
+    parser.add_argument("--channels", type=int, default=10, help="made up channels")
+    parser.add_argument("--users", type=int, default=0, help="made up idle users")
+    parser.add_argument("--text-rate", type=float, default=0.0, help="text messages per second to every client")
+    parser.add_argument("--voice-rate", type=float, default=0.0, help="voice packets per second to every client")
+    parser.add_argument("--speakers", type=int, default=4, help="made up users the voice comes from")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--certificate", type=Path, help="PEM certificate, a self-signed one is made without")
+    parser.add_argument("--key", type=Path, help="PEM key, when it isn't in the certificate file")
+    arguments = parser.parse_args(argv)
+
+    async def serve():
+        """"""
+        server = MockMurmur(arguments.channels, arguments.users, arguments.text_rate, arguments.voice_rate,
+                            arguments.speakers, arguments.password,
+                            ssl_context=create_server_context(arguments.certificate, arguments.key)
+                            if arguments.certificate else None)
+        address = await server.start(arguments.host, arguments.port)
+        print("Listening on {}".format(address))
+        try:
+            while True:
+                await asyncio.sleep(10)
+                print("{} clients, {} frames sent, {} received, {} dropped".format(
+                    len(server.clients), server.sent, server.received, server.dropped))
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""
+Replays control streams through the packet pipeline and the state models.
+
+    python -m benchmarks                        # every benchmark with 10 up to 50,000 users
+    python -m benchmarks --save baseline.json   # keep the results
+    python -m benchmarks --compare baseline.json  # exit with 1 when a result regressed
+
+Every benchmark runs in a fresh process, so peak RSS belongs to that benchmark alone.
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.bench_protocol import BENCHMARKS, bench_replay
+from benchmarks.traces import load_traces
+
+SIZES = [10, 100, 1000, 10000, 50000]
+QUICK_SIZES = [10, 1000]
+
+
+def measure(name: str, size: int, repeat: int) -> Dict:
+    """Best throughput out of repeat runs, and allocations and peak RSS of a run. Runs in a worker process."""
+    if name in BENCHMARKS:
+        run = BENCHMARKS[name](size)
+    else:
+        run = bench_replay(load_traces()[name])
+    # Warm up caches, lazily built tables and the like
+    frames = run()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    # Tracing allocations slows everything down, so it gets a run of its own
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss //= 1024
+    return {
+        "frames": frames,
+        "frames_per_second": frames / best if best else float("inf"),
+        "allocated_kb": peak // 1024,
+        "peak_rss_kb": rss,
+    }
+
+
+def run_isolated(context, name: str, size: int, repeat: int) -> Dict:
+    """"""
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(measure, (name, size, repeat))
+
+
+def regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Descriptions of every result which is more than tolerance (a fraction) worse than the baseline."""
+    found = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if result["frames_per_second"] < previous["frames_per_second"] * (1 - tolerance):
+            found.append("{}: {:.0f} frames/s, was {:.0f}".format(
+                key, result["frames_per_second"], previous["frames_per_second"]))
+        if result["allocated_kb"] > previous["allocated_kb"] * (1 + tolerance) + 64:
+            found.append("{}: {} KiB allocated, was {}".format(key, result["allocated_kb"], previous["allocated_kb"]))
+    return found
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """"""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=lambda text: [int(size) for size in text.split(",")], default=None,
+                        help="comma separated numbers of users, default {}".format(",".join(map(str, SIZES))))
+    parser.add_argument("--quick", action="store_true",
+                        help="only {} users".format(" and ".join(map(str, QUICK_SIZES))))
+    parser.add_argument("--only", action="append", default=None, help="benchmark to run, can be repeated")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark, the best one counts")
+    parser.add_argument("--save", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="fail when results are worse than the ones in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression, 0.25 being 25%%")
+    arguments = parser.parse_args(argv)
+
+    sizes = arguments.sizes or (QUICK_SIZES if arguments.quick else SIZES)
+    jobs = [(name, size) for name in BENCHMARKS for size in sizes]
+    # Recorded traces have a fixed size
+    jobs += [(name, None) for name in load_traces()]
+    if arguments.only:
+        jobs = [(name, size) for name, size in jobs if name in arguments.only]
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    print("{:<28} {:>10} {:>14} {:>14} {:>14}".format("benchmark", "frames", "frames/s", "allocated KiB",
+                                                      "peak RSS KiB"))
+    for name, size in jobs:
+        key = name if size is None else "{}[{}]".format(name, size)
+        result = results[key] = run_isolated(context, name, size, arguments.repeat)
+        print("{:<28} {:>10} {:>14.0f} {:>14} {:>14}".format(key, result["frames"], result["frames_per_second"],
+                                                             result["allocated_kb"], result["peak_rss_kb"]))
+
+    if arguments.save is not None:
+        arguments.save.write_text(json.dumps(results, indent=2, sort_keys=True))
+    if arguments.compare is not None:
+        found = regressions(results, json.loads(arguments.compare.read_text()), arguments.tolerance)
+        for regression in found:
+            print("REGRESSION {}".format(regression))
+        if found:
+            return 1
+    return 0
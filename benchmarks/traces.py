@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import random
+import struct
+from pathlib import Path
+from typing import Dict, Optional
+
+from wspr.control.framing import FrameBuffer
+from wspr.protocol.mumble_pb2 import (
+    ChannelState,
+    CodecVersion,
+    CryptSetup,
+    Ping,
+    ServerConfig,
+    ServerSync,
+    TextMessage,
+    UserState,
+    Version,
+)
+from wspr.protocol.packet_type import PacketType
+from wspr.protocol.varint import encode_varint
+
+# Control streams as the server sends them, after TLS: what a client reads from the socket
+
+TRACES_DIRECTORY = Path(__file__).parent / "traces"
+
+
+def frame(packet_type: PacketType, message) -> bytes:
+    """A control message with its header, message can be a protobuf message or raw bytes."""
+    payload = message if isinstance(message, bytes) else message.SerializeToString()
+    return struct.pack("!HL", packet_type.value, len(payload)) + payload
+
+
+def voice_packet(session: int, sequence: int, size: int, rng: random.Random) -> bytes:
+    """Tunnelled Opus voice packet of a 20 ms frame."""
+    data = b"\xF8" + bytes(rng.getrandbits(8) for _ in range(size - 1))
+    return b"\x80" + encode_varint(session) + encode_varint(sequence) + encode_varint(len(data)) + data
+
+
+def sync_trace(users: int, channels: Optional[int] = None, seed: int = 0) -> bytes:
+    """Everything a server sends while a client connects: version, keys, the channel tree, every user and sync."""
+    rng = random.Random(seed)
+    channels = channels if channels is not None else max(users // 20, 1)
+    frames = [
+        frame(PacketType.VERSION, Version(version=0x010400, release="1.4.0", os="Linux", os_version="bench")),
+        frame(PacketType.CRYPTSETUP, CryptSetup(key=bytes(16), client_nonce=bytes(16), server_nonce=bytes(16))),
+        frame(PacketType.CODECVERSION, CodecVersion(alpha=-2147483637, beta=0, prefer_alpha=True, opus=True)),
+        frame(PacketType.CHANNELSTATE, ChannelState(channel_id=0, name="Root", position=0)),
+    ]
+    for channel_id in range(1, channels + 1):
+        frames.append(frame(PacketType.CHANNELSTATE, ChannelState(
+            channel_id=channel_id,
+            parent=rng.randrange(channel_id) if channel_id > 1 else 0,
+            name="Channel {}".format(channel_id),
+            description_hash=bytes(rng.getrandbits(8) for _ in range(20)),
+            position=channel_id,
+        )))
+    for session in range(1, users + 1):
+        message = UserState(
+            session=session,
+            actor=session,
+            name="user-{}".format(session),
+            user_id=session if rng.random() < 0.5 else None,
+            channel_id=rng.randrange(channels + 1),
+            hash="{:040x}".format(rng.getrandbits(160)),
+            self_mute=rng.random() < 0.3,
+            self_deaf=rng.random() < 0.1,
+        )
+        if rng.random() < 0.3:
+            message.comment_hash = bytes(rng.getrandbits(8) for _ in range(20))
+        if rng.random() < 0.2:
+            message.texture_hash = bytes(rng.getrandbits(8) for _ in range(20))
+        frames.append(frame(PacketType.USERSTATE, message))
+    frames.append(frame(PacketType.SERVERSYNC, ServerSync(
+        session=users + 1, max_bandwidth=558000, welcome_text="Welcome", permissions=0xF07FF)))
+    frames.append(frame(PacketType.SERVERCONFIG, ServerConfig(
+        allow_html=True, message_length=5000, image_message_length=131072, max_users=users + 1)))
+    return b"".join(frames)
+
+
+def steady_trace(users: int, messages: int, seed: int = 0) -> bytes:
+    """What a connected client reads afterwards: state changes, text messages, pings and voice."""
+    rng = random.Random(seed)
+    channels = max(users // 20, 1)
+    sequences = {}
+    frames = []
+    for _ in range(messages):
+        kind = rng.random()
+        session = rng.randrange(1, users + 1)
+        if kind < 0.3:
+            frames.append(frame(PacketType.USERSTATE, UserState(
+                session=session, actor=session, self_mute=rng.random() < 0.5)))
+        elif kind < 0.4:
+            frames.append(frame(PacketType.USERSTATE, UserState(
+                session=session, actor=session, channel_id=rng.randrange(channels + 1))))
+        elif kind < 0.55:
+            frames.append(frame(PacketType.TEXTMESSAGE, TextMessage(
+                actor=session, channel_id=[rng.randrange(channels + 1)], message="hello " * rng.randrange(1, 20))))
+        elif kind < 0.6:
+            frames.append(frame(PacketType.PING, Ping(timestamp=rng.getrandbits(32), good=100, late=1, lost=2)))
+        else:
+            sequence = sequences[session] = sequences.get(session, -2) + 2
+            frames.append(frame(PacketType.UDPTUNNEL, voice_packet(session, sequence, rng.randrange(40, 120), rng)))
+    return b"".join(frames)
+
+
+def load_traces(directory: Path = TRACES_DIRECTORY) -> Dict[str, bytes]:
+    """Recorded traces by name, see RecordingFrameBuffer. Files ending with .gz are decompressed."""
+    traces = {}
+    for path in sorted(Path(directory).glob("*.trace*")):
+        data = path.read_bytes()
+        if path.suffix == ".gz":
+            data = gzip.decompress(data)
+        traces[path.name.split(".")[0]] = data
+    return traces
+
+
+class RecordingFrameBuffer(FrameBuffer):
+    """
+    Frame buffer which also writes everything read from the server to a file, to record a trace of a real server.
+    Swap it in for the receive buffer of a connection: connection.receive_buffer = RecordingFrameBuffer(path).
+    """
+
+    def __init__(self, path: Path, capacity: int = 64 * 1024):
+        """Traces are gzip compressed when the path ends with .gz."""
+        super().__init__(capacity)
+        path = Path(path)
+        self._trace = gzip.open(str(path), "wb") if path.suffix == ".gz" else open(str(path), "wb")
+
+    def feed(self, data: bytes) -> None:
+        """"""
+        self._trace.write(data)
+        super().feed(data)
+
+    def recv_from(self, sock, size: int) -> int:
+        """"""
+        data = sock.recv(size)
+        self.feed(data)
+        return len(data)
+
+    def close(self) -> None:
+        """"""
+        self._trace.close()
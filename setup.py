@@ -17,6 +17,11 @@ setup_requirements = [ ]
 
 test_requirements = [ ]
 
+extras_requirements = {
+    # UDP voice encryption and Opus, which also needs libopus
+    'voice': ['cryptography', 'opuslib'],
+}
+
 setup(
     author="Arkadiusz Michal Rys",
     author_email='Arkadiusz.Michal.Rys@gmail.com',
@@ -30,6 +35,7 @@ setup(
     ],
     description="Mumble client library.",
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
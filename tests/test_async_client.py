@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import asyncio
+import struct
+import unittest
+
+from wspr.async_client import AsyncMumble, MumbleProtocol
+from wspr.containers.address import Address
+from wspr.containers.credentials import Credentials
+from wspr.control.events import TextMessageReceivedEvent
+from wspr.protocol.mumble_pb2 import ServerSync, TextMessage, UserState
+from wspr.protocol.packet_type import PacketType
+
+
+class FakeTransport(asyncio.Transport):
+    """Keeps everything the client writes."""
+
+    def __init__(self):
+        """"""
+        super().__init__()
+        self.written = b""
+        self.closed = False
+
+    def write(self, data):
+        """"""
+        self.written += data
+
+    def close(self):
+        """"""
+        self.closed = True
+
+
+def frame(packet_type: PacketType, message) -> bytes:
+    """Serialize a message with its control header."""
+    return struct.pack("!HL", packet_type.value, message.ByteSize()) + message.SerializeToString()
+
+
+class AsyncMumbleCase(unittest.TestCase):
+    """Tests for the asyncio client."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.client = AsyncMumble(Address(), Credentials("Whisp"))
+        self.transport = FakeTransport()
+        self.protocol = MumbleProtocol(self.client)
+        self.client._protocol = self.protocol
+        self.protocol.connection_made(self.transport)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_authenticate(self):
+        """Test version and authentication are sent on connect."""
+        packet_type, _ = struct.unpack_from("!HL", self.transport.written)
+        self.assertEqual(packet_type, PacketType.VERSION.value)
+        self.assertTrue(self.protocol.is_authenticating())
+
+    def test_events(self):
+        """Test incoming packets update the state and end up as events."""
+        user = UserState()
+        user.session = 3
+        user.name = "Ogurek"
+        message = TextMessage()
+        message.message = "Hello"
+        data = frame(PacketType.USERSTATE, user) + frame(PacketType.SERVERSYNC, ServerSync())
+        data += frame(PacketType.TEXTMESSAGE, message)
+        self.protocol.data_received(data[:10])
+        self.protocol.data_received(data[10:])
+        self.protocol.connection_lost(None)
+
+        async def collect():
+            return [event async for event in self.client]
+
+        events = self.loop.run_until_complete(collect())
+        self.assertEqual(len(events), 3)
+        self.assertIsInstance(events[-1], TextMessageReceivedEvent)
+        self.assertEqual(self.client.users[3].name, "Ogurek")
+
+    def test_send(self):
+        """Test sending a text message."""
+        self.transport.written = b""
+        self.loop.run_until_complete(self.client.send_text_message("Hi", channel_ids=[0]))
+        packet_type, size = struct.unpack_from("!HL", self.transport.written)
+        self.assertEqual(packet_type, PacketType.TEXTMESSAGE.value)
+        message = TextMessage()
+        message.ParseFromString(self.transport.written[6:6 + size])
+        self.assertEqual(message.message, "Hi")
+
+    def test_reconnect(self):
+        """Test events flow again after reconnecting, the end of the last connection doesn't carry over."""
+        self.protocol.connection_lost(ConnectionResetError())
+        transport = FakeTransport()
+
+        async def create_connection(factory, *args, **kwargs):
+            protocol = factory()
+            protocol.connection_made(transport)
+            return transport, protocol
+
+        self.loop.create_connection = create_connection
+        self.loop.run_until_complete(self.client.connect())
+        self.client._protocol.data_received(frame(PacketType.SERVERSYNC, ServerSync()))
+        self.client._protocol.connection_lost(None)
+
+        async def collect():
+            return [event async for event in self.client]
+
+        events = self.loop.run_until_complete(collect())
+        self.assertEqual(len(events), 1)
+        self.loop.run_until_complete(self.client.close())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import gzip
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.bench_protocol import BENCHMARKS, pipeline, read
+from benchmarks.runner import regressions
+from benchmarks.traces import RecordingFrameBuffer, load_traces, steady_trace, sync_trace
+from wspr.state import ServerState
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Benchmarks have to keep working as the code they measure changes."""
+
+    def setUp(self):
+        """"""
+        self.directory = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        """"""
+        shutil.rmtree(str(self.directory))
+
+    def test_sync_trace(self):
+        """"""
+        state = ServerState()
+        frames = pipeline(sync_trace(50, channels=5), state, [])
+        self.assertEqual(len(read(sync_trace(50, channels=5))), frames)
+        self.assertEqual(50, len(state.users))
+        self.assertEqual(6, len(state.channels))
+
+    def test_steady_trace(self):
+        """"""
+        state = ServerState()
+        pipeline(sync_trace(20), state, [])
+        events = []
+        self.assertEqual(200, pipeline(steady_trace(20, 200), state, events))
+        self.assertEqual(20, len(state.users))
+
+    def test_benchmarks_run(self):
+        """"""
+        for name, prepare in BENCHMARKS.items():
+            with self.subTest(name):
+                self.assertGreater(prepare(10)(), 0)
+
+    def test_recorded_trace(self):
+        """"""
+        trace = sync_trace(10)
+        buffer = RecordingFrameBuffer(self.directory / "server.trace.gz")
+        buffer.feed(trace[:100])
+        buffer.feed(trace[100:])
+        buffer.close()
+        self.assertEqual(trace, gzip.decompress((self.directory / "server.trace.gz").read_bytes()))
+        self.assertEqual({"server": trace}, load_traces(self.directory))
+
+    def test_regressions(self):
+        """"""
+        baseline = {"sync[10]": {"frames_per_second": 1000.0, "allocated_kb": 100}}
+        self.assertEqual([], regressions({"sync[10]": {"frames_per_second": 800.0, "allocated_kb": 150}}, baseline,
+                                         0.25))
+        self.assertEqual(2, len(regressions({"sync[10]": {"frames_per_second": 700.0, "allocated_kb": 300}},
+                                            baseline, 0.25)))
+        self.assertEqual([], regressions({"steady[10]": {"frames_per_second": 1.0, "allocated_kb": 1}}, baseline,
+                                         0.25))
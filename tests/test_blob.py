@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import tempfile
+import unittest
+
+from wspr.blob import Blob, BlobKind, BlobScheduler, BlobStore, blob_hash
+from wspr.protocol.mumble_pb2 import ChannelState, UserState
+from wspr.protocol.packet_type import PacketType
+from wspr.protocol.packets import UserStatePacket
+from wspr.state import ServerState
+
+
+class FakeConnection:
+    """Remembers what would have been sent."""
+
+    def __init__(self):
+        """"""
+        self.sent = []
+
+    def send(self, message_type, content):
+        """"""
+        self.sent.append((message_type, content))
+
+
+class FakeEvents(list):
+    """Collects events."""
+
+    def put(self, event):
+        """"""
+        self.append(event)
+
+
+class BlobStoreCase(unittest.TestCase):
+    """Tests for the memory and disk tiers."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.directory.cleanup()
+
+    def test_memory(self):
+        """Test the least recently used blobs are forgotten first."""
+        store = BlobStore(memory_size=8)
+        first = store.put(b"1234")
+        second = store.put(b"5678")
+        self.assertEqual(store.get(first), b"1234")
+        store.put(b"abcd")
+        self.assertEqual(store.get(first), b"1234")
+        self.assertIsNone(store.get(second))
+        self.assertEqual(first, blob_hash(b"1234"))
+
+    def test_disk(self):
+        """Test blobs survive the store."""
+        item_hash = BlobStore(directory=self.directory.name).put("comment")
+        store = BlobStore(directory=self.directory.name)
+        self.assertIn(item_hash, store)
+        self.assertEqual(store.get(item_hash), b"comment")
+        self.assertNotIn(blob_hash(b"other"), store)
+
+
+class BlobCase(unittest.TestCase):
+    """Tests for filling in and requesting blobs."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.blobs = Blob()
+        self.connection = FakeConnection()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_miss(self):
+        """Test only missing blobs are requested."""
+        self.blobs.store.put(b"texture")
+        message = UserState(session=3, texture_hash=blob_hash(b"texture"), comment_hash=blob_hash("comment"))
+        self.assertTrue(self.blobs.user_state(message))
+        self.assertEqual(message.texture, b"texture")
+        self.assertEqual(len(self.blobs.scheduler), 1)
+        self.assertFalse(self.blobs.channel_state(ChannelState(channel_id=1, description="hi")))
+        self.assertIn(blob_hash("hi"), self.blobs.store)
+
+    def test_packet(self):
+        """Test events and state see the filled in blob."""
+        self.blobs.store.put("comment")
+        packet = UserStatePacket(UserState(session=3, comment_hash=blob_hash("comment")).SerializeToString())
+        events = FakeEvents()
+        whisper = type("Whisper", (), {"state": ServerState(), "blobs": self.blobs})()
+        packet.update(self.connection, events, whisper)
+        self.assertEqual(whisper.state.users[3].comment, "comment")
+        message = UserState()
+        message.ParseFromString(events[0].payload.raw)
+        self.assertEqual(message.comment, "comment")
+        self.assertEqual(len(self.blobs.scheduler), 0)
+
+    def test_shared_hash(self):
+        """Test everyone with the same blob gets it, although it's only asked for once."""
+        self.blobs = Blob(scheduler=BlobScheduler(delay=0.0))
+        events = FakeEvents()
+        whisper = type("Whisper", (), {"state": ServerState(), "blobs": self.blobs})()
+        for session in (1, 2):
+            packet = UserStatePacket(UserState(session=session, comment_hash=blob_hash("comment")))
+            packet.update(self.connection, events, whisper)
+        self.blobs.poll(self.connection)
+        self.assertEqual(len(self.connection.sent), 1)
+        self.assertEqual(list(self.connection.sent[0][1].session_comment), [1])
+        UserStatePacket(UserState(session=1, comment="comment")).update(self.connection, events, whisper)
+        self.assertEqual([whisper.state.users[session].comment for session in (1, 2)], ["comment", "comment"])
+        self.assertEqual([event.get_payload().session for event in events[2:]], [1, 2])
+        self.assertEqual(events[3].get_payload().comment, "comment")
+
+
+class BlobSchedulerCase(unittest.TestCase):
+    """Tests for batching blob requests."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.scheduler = BlobScheduler(delay=0.0, max_batch_size=3, rate=1.0, burst=2)
+        self.connection = FakeConnection()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_batch(self):
+        """Test requests share messages, and no more messages are sent than the rate allows."""
+        for session in range(1, 8):
+            self.assertTrue(self.scheduler.add(BlobKind.COMMENT, session, blob_hash(str(session))))
+        self.scheduler.add(BlobKind.DESCRIPTION, 0, blob_hash("root"))
+        self.assertEqual(self.scheduler.poll(self.connection), 2)
+        self.assertEqual([t for t, _ in self.connection.sent], [PacketType.REQUESTBLOB] * 2)
+        self.assertEqual(list(self.connection.sent[0][1].session_comment), [1, 2, 3])
+        self.assertEqual(list(self.connection.sent[1][1].session_comment), [4, 5, 6])
+        self.assertEqual(len(self.scheduler), 2)
+        self.assertGreater(self.scheduler.time_until_flush(), 0.5)
+        self.assertEqual(self.scheduler.poll(self.connection), 0)
+
+    def test_once(self):
+        """Test the same hash is only asked for once, until it arrives."""
+        item_hash = blob_hash(b"avatar")
+        self.assertTrue(self.scheduler.add(BlobKind.TEXTURE, 1, item_hash))
+        self.assertFalse(self.scheduler.add(BlobKind.TEXTURE, 2, item_hash))
+        self.scheduler.poll(self.connection)
+        self.assertFalse(self.scheduler.add(BlobKind.TEXTURE, 1, item_hash))
+        self.assertEqual(self.scheduler.done(item_hash), {(BlobKind.TEXTURE, 1), (BlobKind.TEXTURE, 2)})
+        self.assertTrue(self.scheduler.add(BlobKind.TEXTURE, 1, item_hash))
+        self.scheduler.clear()
+        self.assertIsNone(self.scheduler.time_until_flush())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import unittest
+from unittest import mock
+
+from benchmarks.murmur import MockMurmur
+from wspr.client import Mumble
+from wspr.containers.address import Address
+from wspr.containers.credentials import Credentials
+from wspr.containers.ping import Ping
+from wspr.control.connection import Connection, ConnectionState
+from wspr.control.events import FullTreeEvent, ServerSyncReceivedEvent
+from wspr.control.tasks import FullTreeTask, StopTask
+
+
+class BrokenSocket:
+    """Fails every read like a reset connection."""
+
+    session = None
+
+    def __init__(self):
+        """"""
+        self.closed = False
+
+    def recv_into(self, buffer, size):
+        """"""
+        raise ConnectionResetError()
+
+    def close(self):
+        """"""
+        self.closed = True
+
+
+class ClientCase(unittest.TestCase):
+    """Tests for the main loop of the client and what drives it."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.loop = asyncio.new_event_loop()
+        self.server = MockMurmur(channels=2, users=3)
+        self.address = asyncio.run_coroutine_threadsafe(self.server.start(), self.loop)
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+    def next_event(self, events, kind):
+        """"""
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            event = events.get(timeout=5)
+            if isinstance(event, kind):
+                return event
+        self.fail("No {}".format(kind.__name__))
+
+    def test_ping_schedule(self):
+        """Test the loop sleeps until the next ping is due."""
+        ping = Ping()
+        self.assertEqual(ping.time_until_needed(), 0)
+        self.assertTrue(ping.is_needed())
+        ping.update()
+        self.assertAlmostEqual(ping.time_until_needed(), ping.delay_milliseconds / 1000, delta=0.01)
+        self.assertFalse(ping.is_needed())
+
+    def test_read_error(self):
+        """Test a failing read closes the connection instead of leaving the socket readable."""
+        connection = Connection(Address(), Credentials(), logging.getLogger('whisper'))
+        connection.control_socket = BrokenSocket()
+        connection.state = ConnectionState.CONNECTED
+        self.assertEqual(connection.incoming_packets(), [])
+        self.assertTrue(connection.control_socket.closed)
+        self.assertFalse(connection.is_alive())
+
+    def test_reactor(self):
+        """Test the main loop handles the server and submitted tasks, and stops when asked to."""
+        tasks, events = multiprocessing.Queue(), queue.Queue()
+        client = Mumble(self.address.result(5), Credentials("Reactor"), tasks, events, logging.getLogger('whisper'))
+        # Run the loop in this process, it's the same loop that runs in the client process
+        runner = threading.Thread(target=client.run, daemon=True)
+        runner.start()
+        self.next_event(events, ServerSyncReceivedEvent)
+        client.submit(FullTreeTask())
+        tree = self.next_event(events, FullTreeEvent)
+        self.assertEqual(len(tree.users), 4)
+        client.submit(StopTask())
+        runner.join(5)
+        self.assertFalse(runner.is_alive())
+
+    def test_late_delivery(self):
+        """Test a task the queue delivers after the doorbell rang is handled as soon as it's there."""
+        tasks, events = multiprocessing.Queue(), queue.Queue()
+        client = Mumble(self.address.result(5), Credentials("Late"), tasks, events, logging.getLogger('whisper'))
+        runner = threading.Thread(target=client.run, daemon=True)
+        runner.start()
+        self.next_event(events, ServerSyncReceivedEvent)
+        # Ring without a task, like the queue's feeder thread lagging behind
+        with mock.patch.object(tasks, 'put'):
+            client.submit(FullTreeTask())
+        time.sleep(0.1)
+        started = time.monotonic()
+        tasks.put(FullTreeTask())
+        self.next_event(events, FullTreeEvent)
+        # Long before the next ping would wake the loop up
+        self.assertLess(time.monotonic() - started, 1.0)
+        client.submit(StopTask())
+        runner.join(5)
+        self.assertFalse(runner.is_alive())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import unittest
+
+from wspr.channel import Channel
+from wspr.columnar import ColumnarState, UserFlag
+from wspr.protocol.mumble_pb2 import ChannelState, UserState
+from wspr.user import User
+
+
+class RecordCase(unittest.TestCase):
+    """Tests for the slotted user and channel records."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_update(self):
+        """Test only fields in the message are set, and repeated fields become lists."""
+        user = User()
+        user.update(UserState(session=1, name="user", self_mute=True, hash="abc"))
+        user.update(UserState(session=1, channel_id=3))
+        self.assertEqual((user.name, user.channel_id, user.self_mute, user.hash), ("user", 3, True, "abc"))
+        self.assertIsNone(user.deaf)
+        self.assertFalse(hasattr(user, '__dict__'))
+        channel = Channel()
+        channel.update(ChannelState(channel_id=2, links=[1, 4]))
+        self.assertEqual(channel.links, [1, 4])
+        self.assertIsInstance(channel.links, list)
+
+
+class ColumnarStateCase(unittest.TestCase):
+    """Tests for the users stored as columns."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.state = ColumnarState()
+        self.state.update_channel(ChannelState(channel_id=0, name="Root"))
+        for session in range(1, 5):
+            # Users in the root channel come without a channel
+            self.state.update_user(UserState(session=session, name="user{}".format(session)))
+            if session % 2:
+                self.state.update_user(UserState(session=session, channel_id=1))
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_lookups(self):
+        """Test lookups stay correct when rows move around on removal."""
+        self.state.update_user(UserState(session=4, user_id=42, self_mute=True, deaf=True))
+        self.state.update_user(UserState(session=3, self_mute=True))
+        self.state.remove_user(1)
+        self.assertNotIn(1, self.state.users)
+        self.assertEqual(len(self.state.users), 3)
+        self.assertEqual(sorted(self.state.users.sessions_in_channel(0)), [2, 4])
+        self.assertEqual(sorted(self.state.users.sessions_with_flag(UserFlag.SELF_MUTE)), [3, 4])
+        self.assertEqual(self.state.users.sessions_with_flag(UserFlag.SELF_MUTE | UserFlag.DEAF), [4])
+        user = self.state.user_by_id(42)
+        self.assertEqual((user.session, user.name, user.channel_id, user.deaf), (4, "user4", 0, True))
+        self.assertEqual(self.state.user_by_name("user3").session, 3)
+        self.assertIsNone(self.state.user_by_name("user1"))
+        self.state.update_user(UserState(session=3, self_mute=False))
+        self.assertFalse(self.state.users.has_flag(3, UserFlag.SELF_MUTE))
+
+    def test_delta(self):
+        """Test deltas work the same as with records."""
+        sequence = self.state.sequence
+        self.state.update_user(UserState(session=2, channel_id=1))
+        self.state.remove_user(3)
+        delta = self.state.delta(sequence)
+        self.assertEqual(list(delta.users), [2])
+        self.assertEqual(delta.users[2].channel_id, 1)
+        self.assertEqual(delta.removed_users, [3])
+        self.assertEqual(sorted(self.state.snapshot().users), [1, 2, 4])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import socket
+import unittest
+
+from wspr.protocol.mumble_pb2 import CryptSetup
+from wspr.protocol.packet_type import PacketType
+from wspr.voice import crypt
+from wspr.voice.crypt import OCB2, CryptState
+from wspr.voice.udp import MediaChannel
+
+KEY = bytes(range(16))
+CLIENT_NONCE = bytes(range(16, 32))
+SERVER_NONCE = bytes(range(32, 48))
+
+
+class FakeConnection:
+    """Remembers what would have been sent."""
+
+    def __init__(self):
+        """"""
+        self.sent = []
+
+    def send(self, message_type, content):
+        """"""
+        self.sent.append((message_type, content))
+
+    def send_raw(self, message_type, payload):
+        """"""
+        self.sent.append((message_type, payload))
+
+
+@unittest.skipIf(not crypt.is_available(), "cryptography is not installed")
+class CryptCase(unittest.TestCase):
+    """Tests for OCB2-AES128 voice encryption."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.client = CryptState()
+        self.client.set_key(KEY, CLIENT_NONCE, SERVER_NONCE)
+        self.server = CryptState()
+        self.server.set_key(KEY, SERVER_NONCE, CLIENT_NONCE)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_vectors(self):
+        """Test against the vectors from the OCB2 paper."""
+        ocb = OCB2(KEY)
+        self.assertEqual(ocb.encrypt(b"", KEY), (b"", bytes.fromhex("BF3108130773AD5EC70EC69E7875A7B0")))
+        crypted, tag = ocb.encrypt(bytes(range(40)), KEY)
+        self.assertEqual(crypted, bytes.fromhex(
+            "F75D6BC8B4DC8D66B836A2B08B32A6369F1CD3C5228D79FD6C267F5F6AA7B231C7DFB9D59951AE9C"
+        ))
+        self.assertEqual(tag, bytes.fromhex("9DB0CDF880F73E3E10D4EB3217766688"))
+        self.assertEqual(ocb.decrypt(crypted, KEY), (bytes(range(40)), tag))
+
+    def test_order(self):
+        """Test late packets are accepted once, replays and forgeries never."""
+        packets = [self.server.encrypt(bytes([i]) * i) for i in range(1, 40)]
+        self.assertEqual(self.client.decrypt(packets[0]), b"\x01")
+        self.assertEqual(self.client.decrypt(packets[3]), b"\x04" * 4)
+        self.assertEqual(self.client.lost, 2)
+        self.assertEqual(self.client.decrypt(packets[1]), b"\x02" * 2)
+        self.assertEqual(self.client.late, 1)
+        self.assertIsNone(self.client.decrypt(packets[1]))
+        self.assertIsNone(self.client.decrypt(packets[3]))
+        forged = bytearray(packets[4])
+        forged[-1] ^= 1
+        self.assertIsNone(self.client.decrypt(bytes(forged)))
+        for packet in packets[4:]:
+            self.assertIsNotNone(self.client.decrypt(packet))
+        # Wrapping around the first byte of the nonce
+        for i in range(600):
+            self.assertEqual(self.client.decrypt(self.server.encrypt(b"voice")), b"voice")
+
+    def test_media(self):
+        """Test UDP pings, and tunnelling through the control connection while UDP doesn't work."""
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        ours.setblocking(False)
+        connection = FakeConnection()
+        media = MediaChannel(connection, ours)
+        media.setup(CryptSetup(key=KEY, client_nonce=CLIENT_NONCE, server_nonce=SERVER_NONCE))
+        media.send(b"\x80voice")
+        self.assertEqual(connection.sent, [(PacketType.UDPTUNNEL, b"\x80voice")])
+        media.send_ping()
+        ping = self.server.decrypt(theirs.recv(2048))
+        self.assertEqual(ping[0] >> 5, 1)
+        theirs.send(self.server.encrypt(ping))
+        theirs.send(self.server.encrypt(b"\x80voice"))
+        packets = media.incoming_packets()
+        self.assertTrue(media.is_udp_available())
+        self.assertEqual([packet.payload.raw for packet in packets], [b"\x80voice"])
+        media.send(b"\x80voice")
+        self.assertEqual(self.server.decrypt(theirs.recv(2048)), b"\x80voice")
+        media.setup(CryptSetup())
+        self.assertEqual(connection.sent[-1][1].client_nonce, bytes([CLIENT_NONCE[0] + 2]) + CLIENT_NONCE[1:])
+        ours.close()
+        theirs.close()
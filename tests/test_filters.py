@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import unittest
+
+from wspr.control.events import TextMessageReceivedEvent, PingReceivedEvent
+from wspr.control.filters import EventFilter, Subscription
+from wspr.control.sink import EventSink
+from wspr.protocol.mumble_pb2 import TextMessage, Ping
+from wspr.protocol.packet_type import PacketType
+from wspr.protocol.packets import TextMessagePacket, PingPacket, UDPTunnelPacket
+
+
+def text_packet(channel_id: int) -> TextMessagePacket:
+    """Incoming text message for a channel."""
+    message = TextMessage()
+    message.channel_id.append(channel_id)
+    message.message = "Hello"
+    return TextMessagePacket(message.SerializeToString())
+
+
+class EventFilterCase(unittest.TestCase):
+    """Tests for only delivering interesting events."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.events = []
+        self.sink = EventSink(self.events.append)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_everything(self):
+        """Test every packet becomes an event without subscriptions."""
+        PingPacket(Ping().SerializeToString()).emit(self.sink)
+        self.assertIsInstance(self.events[0], PingReceivedEvent)
+
+    def test_by_kind(self):
+        """Test filtering by packet type and by event type."""
+        self.sink.filter.subscribe(Subscription(PacketType.TEXTMESSAGE))
+        self.sink.filter.subscribe(Subscription(PingReceivedEvent))
+        UDPTunnelPacket(b"\x80voice").handle(None, self.sink)
+        text_packet(1).handle(None, self.sink)
+        self.assertEqual(len(self.events), 1)
+        self.assertIsInstance(self.events[0], TextMessageReceivedEvent)
+        self.sink.filter.unsubscribe(PacketType.TEXTMESSAGE)
+        text_packet(1).handle(None, self.sink)
+        self.assertEqual(len(self.events), 1)
+
+    def test_fields(self):
+        """Test filtering on message content, without decoding packets of other kinds."""
+        self.sink.filter = EventFilter([Subscription(TextMessageReceivedEvent, channel_id=2)])
+        ping = PingPacket(Ping().SerializeToString())
+        ping.emit(self.sink)
+        self.assertFalse(ping.payload.is_decoded())
+        text_packet(1).handle(None, self.sink)
+        text_packet(2).handle(None, self.sink)
+        self.assertEqual(len(self.events), 1)
+        self.assertEqual(list(self.events[0].get_payload().channel_id), [2])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import struct
+import unittest
+
+from wspr.control.converter import PacketConverter
+from wspr.control.framing import FrameBuffer
+from wspr.protocol.mumble_pb2 import TextMessage
+from wspr.protocol.packets import TextMessagePacket
+
+
+def frame(packet_type: int, payload: bytes) -> bytes:
+    """Add a control header to the payload."""
+    return struct.pack("!HL", packet_type, len(payload)) + payload
+
+
+class FrameBufferCase(unittest.TestCase):
+    """Tests for splitting the control stream into frames."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.buffer = FrameBuffer(capacity=16)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_partial_frame(self):
+        """Test a frame split over several reads."""
+        data = frame(11, b"hello world")
+        self.buffer.feed(data[:4])
+        self.assertIsNone(self.buffer.next_frame())
+        self.buffer.feed(data[4:10])
+        self.assertIsNone(self.buffer.next_frame())
+        self.buffer.feed(data[10:])
+        packet_type, payload = self.buffer.next_frame()
+        self.assertEqual(packet_type, 11)
+        self.assertEqual(bytes(payload), b"hello world")
+        payload.release()
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_many_frames(self):
+        """Test a burst of frames growing the buffer."""
+        payloads = [bytes([i]) * i for i in range(100)]
+        self.buffer.feed(b"".join(frame(i % 26, p) for i, p in enumerate(payloads)))
+        for i, expected in enumerate(payloads):
+            packet_type, payload = self.buffer.next_frame()
+            self.assertEqual(packet_type, i % 26)
+            self.assertEqual(bytes(payload), expected)
+            payload.release()
+        self.assertIsNone(self.buffer.next_frame())
+
+    def test_compaction(self):
+        """Test the unfinished frame is kept when the buffer is compacted."""
+        self.buffer.feed(frame(3, b"a" * 4) + frame(3, b"b" * 8)[:5])
+        _, payload = self.buffer.next_frame()
+        payload.release()
+        self.buffer.feed(frame(3, b"b" * 8)[5:] + frame(3, b"c" * 30))
+        _, payload = self.buffer.next_frame()
+        self.assertEqual(bytes(payload), b"b" * 8)
+        payload.release()
+        _, payload = self.buffer.next_frame()
+        self.assertEqual(bytes(payload), b"c" * 30)
+        payload.release()
+
+    def test_converter(self):
+        """Test converting buffered frames to packets."""
+        message = TextMessage()
+        message.message = "hi"
+        self.buffer.feed(frame(11, message.SerializeToString()) * 3 + b"\x00")
+        packets = PacketConverter().buffer_to_packets(self.buffer)
+        self.assertEqual(len(packets), 3)
+        self.assertTrue(all(isinstance(p, TextMessagePacket) for p in packets))
+        self.assertEqual(len(self.buffer), 1)
+
+    def test_unknown_type(self):
+        """Test frames of unknown packet types are skipped without losing the frames around them."""
+        message = TextMessage()
+        message.message = "hi"
+        payload = message.SerializeToString()
+        self.buffer.feed(frame(11, payload) + frame(99, b"\x01\x02") + frame(11, payload))
+        with self.assertLogs('whisper', level='WARNING'):
+            packets = PacketConverter().buffer_to_packets(self.buffer)
+        self.assertEqual(len(packets), 2)
+        self.assertTrue(all(isinstance(p, TextMessagePacket) for p in packets))
+        self.assertEqual(len(self.buffer), 0)
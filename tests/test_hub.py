@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import asyncio
+import unittest
+from unittest import mock
+
+from tests.test_async_client import FakeTransport, frame
+from wspr.async_client import AsyncMumble, MumbleProtocol
+from wspr.containers.address import Address
+from wspr.containers.credentials import Credentials
+from wspr.control.events import TextMessageReceivedEvent, FullTreeEvent
+from wspr.control.tasks import FullTreeTask, StopTask
+from wspr.hub import MumbleHub
+from wspr.protocol.mumble_pb2 import TextMessage
+from wspr.protocol.packet_type import PacketType
+
+
+async def fake_connect(client: AsyncMumble) -> None:
+    """Connect to nothing."""
+    client._protocol = MumbleProtocol(client)
+    client._protocol.connection_made(FakeTransport())
+
+
+class MumbleHubCase(unittest.TestCase):
+    """Tests for multiplexing sessions."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.hub = MumbleHub()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    @mock.patch.object(AsyncMumble, 'connect', fake_connect)
+    def test_routing(self):
+        """Test events and tasks are routed by session key."""
+        async def scenario():
+            for key in ("a", "b"):
+                await self.hub.add(key, Address(), Credentials(key))
+            message = TextMessage()
+            message.message = "to b"
+            self.hub["b"]._protocol.data_received(frame(PacketType.TEXTMESSAGE, message))
+            key, event = await self.hub.__anext__()
+            self.assertEqual(key, "b")
+            self.assertIsInstance(event, TextMessageReceivedEvent)
+            await self.hub.submit("a", FullTreeTask())
+            key, event = await self.hub.__anext__()
+            self.assertEqual(key, "a")
+            self.assertIsInstance(event, FullTreeEvent)
+            await self.hub.submit("a", StopTask())
+            self.assertNotIn("a", self.hub)
+            self.assertEqual(len(self.hub), 1)
+            await self.hub.close()
+
+        self.loop.run_until_complete(scenario())
+
+    @mock.patch.object(AsyncMumble, 'connect', fake_connect)
+    def test_disconnected(self):
+        """Test sessions which lost their connection are dropped, so their key can be used again."""
+        async def scenario():
+            client = await self.hub.add("a", Address(), Credentials("a"))
+            client._protocol.connection_lost(ConnectionResetError())
+            for _ in range(3):
+                await asyncio.sleep(0)
+            self.assertNotIn("a", self.hub)
+            self.assertEqual(len(self.hub), 0)
+            await self.hub.add("a", Address(), Credentials("a"))
+            self.assertEqual(len(self.hub), 1)
+            await self.hub.close()
+
+        self.loop.run_until_complete(scenario())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import pickle
+import unittest
+
+from wspr.protocol.message import LazyMessage
+from wspr.protocol.mumble_pb2 import ChannelState
+from wspr.protocol.packets import ChannelStatePacket
+from wspr.state import ServerState
+
+
+class EventQueue(list):
+    """Collects events."""
+
+    def put(self, event):
+        """"""
+        self.append(event)
+
+
+class LazyMessageCase(unittest.TestCase):
+    """Tests for decoding payloads only when needed."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        state = ChannelState()
+        state.channel_id = 4
+        state.name = "Lobby"
+        self.raw = state.SerializeToString()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_decode_once(self):
+        """Test the handler, the state update and the event share a single decoded message."""
+        packet = ChannelStatePacket(self.raw)
+        self.assertFalse(packet.payload.is_decoded())
+        repr(packet)
+        self.assertFalse(packet.payload.is_decoded())
+        events = EventQueue()
+        whisper = type("Whisper", (), {"state": ServerState(), "blobs": None, "voice": None, "recorder": None})()
+        packet.update(None, events, whisper)
+        self.assertEqual(whisper.state.channels[4].name, "Lobby")
+        self.assertIs(events[0].get_payload(), packet.payload.message)
+
+    def test_pickle(self):
+        """Test only the raw payload crosses process boundaries."""
+        message = LazyMessage(ChannelState, self.raw)
+        self.assertEqual(message.message.name, "Lobby")
+        copy = pickle.loads(pickle.dumps(message))
+        self.assertFalse(copy.is_decoded())
+        self.assertEqual(copy.message.channel_id, 4)
+
+    def test_modified(self):
+        """Test a payload marked as modified before it was decoded keeps its content."""
+        message = LazyMessage(ChannelState, self.raw)
+        message.modified()
+        self.assertTrue(message.is_decoded())
+        self.assertEqual(ChannelState.FromString(message.raw).name, "Lobby")
+
+    def test_from_message(self):
+        """Test wrapping a message we are about to send."""
+        state = ChannelState()
+        state.name = "Games"
+        message = LazyMessage.from_message(state)
+        self.assertIs(message.message, state)
+        self.assertEqual(message.raw, state.SerializeToString())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import asyncio
+import unittest
+
+from benchmarks.murmur import MockMurmur, create_server_context
+from wspr.async_client import AsyncMumble
+from wspr.containers.credentials import Credentials
+from wspr.control.events import (
+    RejectReceivedEvent,
+    ServerSyncReceivedEvent,
+    TextMessageReceivedEvent,
+    UDPTunnelReceivedEvent,
+)
+from wspr.exceptions.connection import ConnectionRejectedError
+
+
+class MockMurmurCase(unittest.TestCase):
+    """Clients connected to the mock server over TLS on localhost."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Making a certificate takes a while, share it."""
+        cls.context = create_server_context()
+
+    def setUp(self):
+        """"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        """"""
+        # Let the clients notice they are disconnected
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_async(self, coroutine):
+        """"""
+        return self.loop.run_until_complete(asyncio.wait_for(coroutine, 10))
+
+    @staticmethod
+    async def next_event(client, kind):
+        """"""
+        async for event in client:
+            if isinstance(event, kind):
+                return event
+
+    def test_sync_and_relay(self):
+        """"""
+        async def scenario():
+            server = MockMurmur(channels=3, users=20, ssl_context=self.context)
+            address = await server.start()
+            first = AsyncMumble(address, Credentials("First"))
+            second = AsyncMumble(address, Credentials("Second"))
+            try:
+                await first.connect()
+                sync = await self.next_event(first, ServerSyncReceivedEvent)
+                await second.connect()
+                await self.next_event(second, ServerSyncReceivedEvent)
+                self.assertEqual(21, sync.get_payload().session)
+                self.assertEqual(22, len(second.users))
+                self.assertEqual(4, len(second.channels))
+                self.assertTrue(first.is_connected())
+
+                await first.send_text_message("Hello", channel_ids=[0])
+                text = await self.next_event(second, TextMessageReceivedEvent)
+                self.assertEqual("Hello", text.get_payload().message)
+                self.assertEqual(21, text.get_payload().actor)
+                # Neither the sender gets its own message back, nor the root channel is sent for users in it
+                await second.send_text_message("Hi", channel_ids=[0])
+                text = await self.next_event(first, TextMessageReceivedEvent)
+                self.assertEqual(22, text.get_payload().actor)
+                self.assertEqual([21, 22], sorted(user.session for user in second.state.users_in_channel(0))[-2:])
+            finally:
+                await first.close()
+                await second.close()
+                await server.close()
+
+        self.run_async(scenario())
+
+    def test_flood(self):
+        """"""
+        async def scenario():
+            server = MockMurmur(channels=1, users=5, text_rate=100, voice_rate=200, ssl_context=self.context)
+            address = await server.start()
+            client = AsyncMumble(address, Credentials())
+            try:
+                await client.connect()
+                await self.next_event(client, UDPTunnelReceivedEvent)
+                await self.next_event(client, TextMessageReceivedEvent)
+            finally:
+                await client.close()
+                await server.close()
+
+        self.run_async(scenario())
+
+    def test_password(self):
+        """"""
+        async def scenario():
+            server = MockMurmur(password="secret", ssl_context=self.context)
+            address = await server.start()
+            client = AsyncMumble(address, Credentials("Guest", "wrong"))
+            try:
+                await client.connect()
+                events = []
+                with self.assertRaises(ConnectionRejectedError):
+                    async for event in client:
+                        events.append(event)
+                self.assertIsInstance(events[-1], RejectReceivedEvent)
+            finally:
+                await client.close()
+                await server.close()
+
+        self.run_async(scenario())
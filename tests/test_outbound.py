@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import ssl
+import struct
+import unittest
+
+from wspr.control.outbound import OutboundBuffer, OutboundQueue
+from wspr.protocol.packet_type import PacketType
+
+
+class FakeSocket:
+    """Accepts a limited amount of bytes per write, or none at all."""
+
+    def __init__(self, limit: int):
+        """"""
+        self.limit = limit
+        self.written = bytearray()
+        self.sizes = []
+        self.blocked = False
+
+    def send(self, data) -> int:
+        """"""
+        self.sizes.append(len(data))
+        if self.blocked:
+            raise ssl.SSLWantWriteError()
+        sent = min(len(data), self.limit)
+        self.written += data[:sent]
+        return sent
+
+
+class OutboundBufferCase(unittest.TestCase):
+    """Tests for the outgoing control stream."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.buffer = OutboundBuffer()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_coalesce(self):
+        """Test queued messages are framed back to back and written together."""
+        self.buffer.append(PacketType.PING, b"")
+        self.buffer.append(PacketType.TEXTMESSAGE, b"hello")
+        sock = FakeSocket(1024)
+        self.assertTrue(self.buffer.write_to(sock))
+        self.assertEqual(sock.sizes, [17])
+        self.assertEqual(bytes(sock.written), struct.pack("!HL", 3, 0) + struct.pack("!HL", 11, 5) + b"hello")
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_partial(self):
+        """Test partial and blocked writes continue where they left off, with the same size after a blocked one."""
+        payload = bytes(range(256)) * 100
+        self.buffer.append(PacketType.TEXTMESSAGE, payload)
+        sock = FakeSocket(10000)
+        sock.blocked = True
+        self.assertFalse(self.buffer.write_to(sock))
+        self.assertEqual(sock.sizes, [OutboundBuffer.MAX_WRITE])
+        sock.blocked = False
+        self.buffer.append(PacketType.PING, b"")
+        self.assertTrue(self.buffer.write_to(sock))
+        self.assertEqual(sock.sizes[1], OutboundBuffer.MAX_WRITE)
+        self.assertEqual(bytes(sock.written), struct.pack("!HL", 11, len(payload)) + payload + struct.pack("!HL", 3, 0))
+
+
+class OutboundQueueCase(unittest.TestCase):
+    """Tests for priorities, shaping and backpressure."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.queue = OutboundQueue(bulk_rate=1.0, bulk_burst=2, high_watermark=100, low_watermark=20)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    @staticmethod
+    def types(written: bytes) -> list:
+        """Message types of the frames written, in order."""
+        types = []
+        while written:
+            message_type, size = struct.unpack_from("!HL", written)
+            types.append(PacketType(message_type))
+            written = written[6 + size:]
+        return types
+
+    def test_priority(self):
+        """Test control messages jump the queue and bulk messages are shaped."""
+        for _ in range(4):
+            self.queue.append(PacketType.TEXTMESSAGE, b"spam")
+        self.queue.append(PacketType.CHANNELSTATE, b"")
+        self.queue.append(PacketType.PING, b"")
+        sock = FakeSocket(1024)
+        self.assertTrue(self.queue.write_to(sock))
+        self.assertEqual(self.types(bytes(sock.written)), [
+            PacketType.PING, PacketType.CHANNELSTATE, PacketType.TEXTMESSAGE, PacketType.TEXTMESSAGE,
+        ])
+        self.assertEqual(len(self.queue), 2 * 10)
+        self.assertGreater(self.queue.time_until_ready(), 0.5)
+
+    def test_watermarks(self):
+        """Test producers are paused above the high watermark until the queue drained below the low one."""
+        for _ in range(10):
+            self.queue.append(PacketType.CHANNELSTATE, b"0123456789")
+        self.assertTrue(self.queue.paused)
+        sock = FakeSocket(1024)
+        sock.blocked = True
+        self.assertFalse(self.queue.write_to(sock))
+        self.assertTrue(self.queue.paused and self.queue.blocked)
+        sock.blocked = False
+        self.assertTrue(self.queue.write_to(sock))
+        self.assertFalse(self.queue.paused)
+        self.assertEqual(len(self.queue), 0)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import queue
+import unittest
+
+from wspr.control.events import EventBatch, FullTreeEvent
+from wspr.control.receiver import EventReceiver
+from wspr.control.sink import EventSink
+
+
+class BatchCase(unittest.TestCase):
+    """Tests for sending events in batches."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.queue = queue.Queue()
+        self.receiver = EventReceiver(self.queue)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_unbatched(self):
+        """Test events are put one by one by default."""
+        sink = EventSink(self.queue.put)
+        sink.put(FullTreeEvent({}, {}))
+        self.assertIsInstance(self.queue.get_nowait(), FullTreeEvent)
+
+    def test_batch_size(self):
+        """Test a full batch is sent right away and the rest when the pass ends."""
+        sink = EventSink(self.queue.put, max_batch_size=3)
+        for i in range(5):
+            sink.put(FullTreeEvent(i, i))
+        self.assertEqual(self.queue.qsize(), 1)
+        self.assertIsNotNone(sink.time_until_flush())
+        sink.poll()
+        self.assertEqual(self.queue.qsize(), 2)
+        self.assertIsNone(sink.time_until_flush())
+        self.assertEqual([e.users for e in self.receiver.get_batch()], [0, 1, 2])
+        self.assertEqual(self.receiver.get().users, 3)
+        self.assertEqual(self.receiver.get().users, 4)
+        self.assertRaises(queue.Empty, self.receiver.get, timeout=0)
+
+    def test_delay(self):
+        """Test a batch waits for the max delay."""
+        sink = EventSink(self.queue.put, max_batch_size=100, max_delay=60)
+        sink.put(FullTreeEvent({}, {}))
+        sink.poll()
+        self.assertTrue(self.queue.empty())
+        sink.flush()
+        self.assertIsInstance(self.queue.get_nowait(), EventBatch)
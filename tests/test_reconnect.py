@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import random
+import unittest
+
+from wspr.control.reconnect import ReconnectPolicy
+
+
+class ReconnectPolicyCase(unittest.TestCase):
+    """Tests for the backoff between reconnects."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.policy = ReconnectPolicy(initial_delay=1.0, max_delay=10.0, jitter=0.5, max_attempts=6,
+                                      rng=random.Random(4))
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_backoff(self):
+        """Test delays grow up to the maximum, with at most the jitter taken off, until we give up."""
+        delays = [self.policy.next_delay() for _ in range(6)]
+        for delay, expected in zip(delays, [1, 2, 4, 8, 10, 10]):
+            self.assertGreaterEqual(delay, expected / 2)
+            self.assertLessEqual(delay, expected)
+        self.assertNotEqual(delays[4], delays[5])
+        self.assertIsNone(self.policy.next_delay())
+        self.policy.reset()
+        self.assertLessEqual(self.policy.next_delay(), 1)
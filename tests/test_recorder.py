@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import shutil
+import struct
+import tempfile
+import unittest
+import wave
+from pathlib import Path
+
+from wspr.control.events import VoiceReceivedEvent
+from wspr.protocol.mumble_pb2 import ChannelState, UserState
+from wspr.protocol.varint import encode_varint
+from wspr.state import ServerState
+from wspr.voice.ogg import PAGE_HEADER, ogg_crc
+from wspr.voice.packet import VoiceType
+from wspr.voice.recorder import Recorder, RecordingFormat
+
+# 20 ms CELT only Opus frame
+FRAME = b"\xF8abc"
+
+
+def opus(session, sequence, frame, terminator=False):
+    """"""
+    size = encode_varint(len(frame) | (0x2000 if terminator else 0))
+    return bytes((VoiceType.OPUS << 5,)) + encode_varint(session) + encode_varint(sequence) + size + frame
+
+
+def crc(data):
+    """Bit by bit, the way the Ogg specification describes it."""
+    value = 0
+    for byte in data:
+        value ^= byte << 24
+        for _ in range(8):
+            value = ((value << 1) ^ 0x04C11DB7 if value & 0x80000000 else value << 1) & 0xFFFFFFFF
+    return value
+
+
+def pages(data):
+    """Flags, granule position and packets of every page."""
+    offset = 0
+    while offset < len(data):
+        _, _, flags, granule, _, _, checksum, count = PAGE_HEADER.unpack_from(data, offset)
+        segments = data[offset + PAGE_HEADER.size:offset + PAGE_HEADER.size + count]
+        end = offset + PAGE_HEADER.size + count + sum(segments)
+        page = bytearray(data[offset:end])
+        page[22:26] = bytes(4)
+        assert checksum == crc(page), "Bad checksum"
+        packets, packet, position = [], b"", offset + PAGE_HEADER.size + count
+        for segment in segments:
+            packet += data[position:position + segment]
+            position += segment
+            if segment < 255:
+                packets.append(packet)
+                packet = b""
+        yield flags, granule, packets
+        offset = end
+
+
+class RecorderCase(unittest.TestCase):
+    """Tests for recording voice."""
+
+    def setUp(self):
+        """"""
+        self.directory = Path(tempfile.mkdtemp())
+        self.state = ServerState()
+        self.state.update_channel(ChannelState(channel_id=3, name="Lobby"))
+        self.state.update_user(UserState(session=7, name="Alice", user_id=12, channel_id=3))
+
+    def tearDown(self):
+        """"""
+        shutil.rmtree(str(self.directory))
+
+    def test_crc(self):
+        """"""
+        for data in (b"", b"OggS", bytes(range(256)) * 3):
+            self.assertEqual(crc(data), ogg_crc(data))
+
+    def test_ogg(self):
+        """"""
+        recorder = Recorder(self.directory, self.state)
+        recorder.add_packet(opus(7, 10, FRAME))
+        # 14 is lost and filled with silence, 12 comes too late
+        recorder.add_packet(opus(7, 16, FRAME))
+        recorder.add_packet(opus(7, 12, FRAME))
+        recorder.add_packet(opus(7, 18, FRAME, terminator=True))
+        recorder.add_packet(bytes((VoiceType.SPEEX << 5,)) + b"\x07\x00\x01z")
+        recorder.close()
+        files = list(self.directory.iterdir())
+        self.assertEqual(1, len(files))
+        self.assertIn("session-7-Alice", files[0].name)
+        result = list(pages(files[0].read_bytes()))
+        self.assertEqual(b"OpusHead", result[0][2][0][:8])
+        self.assertEqual(2, result[0][0])
+        tags = result[1][2][0]
+        for tag in (b"ARTIST=Alice", b"USER_ID=12", b"CHANNEL=Lobby", b"SESSION=7"):
+            self.assertIn(tag, tags)
+        audio = [packet for _, _, packets in result[2:] for packet in packets]
+        self.assertEqual([FRAME, b"\xF8", b"\xF8", FRAME, FRAME], audio)
+        self.assertEqual(4, result[-1][0] & 4)
+        self.assertEqual(5 * 960, result[-1][1])
+
+    def test_sequence_jump(self):
+        """Test a sequence number far ahead doesn't fill the recording with silence."""
+        recorder = Recorder(self.directory, self.state)
+        recorder.add_packet(opus(7, 10, FRAME))
+        recorder.add_packet(opus(7, 1 << 40, FRAME))
+        recorder.add_packet(opus(7, (1 << 40) + 4, FRAME))
+        recorder.close()
+        files = list(self.directory.iterdir())
+        audio = [packet for _, _, packets in list(pages(files[0].read_bytes()))[2:] for packet in packets]
+        self.assertEqual([FRAME, FRAME, b"\xF8", FRAME], audio)
+
+    def test_wav_rotation(self):
+        """"""
+        recorder = Recorder(self.directory, self.state, RecordingFormat.WAV, max_size=4000)
+        for sequence in range(3):
+            recorder.voice_received(VoiceReceivedEvent(7, sequence, bytes([sequence, 0]) * 960))
+        recorder.add_mixed(3, b"\1\0" * 10)
+        recorder.add_packet(opus(7, 1, FRAME))
+        recorder.close()
+        files = sorted(self.directory.iterdir(), key=lambda path: int(path.stem.rsplit("-", 1)[1]))
+        # The third frame no longer fits in the first file
+        self.assertEqual(["session", "session", "channel"], [path.name.split("-")[0] for path in files])
+        frames = b""
+        for path in files[:2]:
+            with wave.open(str(path)) as recording:
+                self.assertEqual((1, 2, 48000), (recording.getnchannels(), recording.getsampwidth(),
+                                                 recording.getframerate()))
+                frames += recording.readframes(recording.getnframes())
+        self.assertEqual(b"".join(bytes([sequence, 0]) * 960 for sequence in range(3)), frames)
+        self.assertIn(b"INAM" + struct.pack("<I", 6) + b"Lobby\0", files[2].read_bytes())
+
+    def test_reconnect(self):
+        """Test a session the server hands out again after a reconnect gets a recording of its own."""
+        recorder = Recorder(self.directory, self.state)
+        recorder.add_packet(opus(7, 10, FRAME))
+        recorder.clear()
+        self.state.update_user(UserState(session=7, name="Bob", user_id=13))
+        recorder.add_packet(opus(7, 0, FRAME))
+        recorder.close()
+        files = sorted(self.directory.iterdir(), key=lambda path: int(path.stem.rsplit("-", 1)[1]))
+        self.assertEqual(["Alice", "Bob"], [path.name.split("-")[2] for path in files])
+        for path in files:
+            audio = [packet for _, _, packets in list(pages(path.read_bytes()))[2:] for packet in packets]
+            self.assertEqual([FRAME], audio)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import pickle
+import unittest
+
+from wspr.control.events import TextMessageReceivedEvent, FullTreeEvent
+from wspr.control.ring import RingTransport, SharedRingBuffer, shared_memory
+from wspr.control.sink import RingSink
+from wspr.protocol.mumble_pb2 import TextMessage
+from wspr.protocol.packet_type import PacketType
+from wspr.protocol.packets import TextMessagePacket
+
+
+@unittest.skipIf(shared_memory is None, "Shared memory requires Python 3.8")
+class RingCase(unittest.TestCase):
+    """Tests for passing raw frames through shared memory."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.transport = RingTransport(capacity=64)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.transport.close()
+        self.transport.unlink()
+
+    def test_wrap_around(self):
+        """Test frames wrapping around the end of the ring."""
+        for i in range(20):
+            payload = bytes([i]) * (i % 7 + 20)
+            self.assertTrue(self.transport.put_event(PacketType.UDPTUNNEL, payload))
+            self.assertEqual(self.transport.get_event(timeout=0), (PacketType.UDPTUNNEL, payload))
+        self.assertIsNone(self.transport.get_event(timeout=0))
+
+    def test_full(self):
+        """Test frames are dropped when the ring is full."""
+        self.assertTrue(self.transport.put_event(PacketType.PING, b"a" * 40))
+        self.assertFalse(self.transport.put_event(PacketType.PING, b"b" * 40))
+        self.assertEqual(self.transport.dropped, 1)
+        self.assertFalse(self.transport.send(PacketType.PING, b"c" * 70, timeout=0))
+
+    def test_attach(self):
+        """Test another process attaching to the same ring."""
+        other: SharedRingBuffer = pickle.loads(pickle.dumps(self.transport.tasks))
+        self.transport.send(PacketType.TEXTMESSAGE, b"hello")
+        self.assertEqual(other.get(), (PacketType.TEXTMESSAGE.value, b"hello"))
+        self.assertIsNone(self.transport.get_task())
+        other.close()
+
+    def test_sink(self):
+        """Test packets go through the ring and other events through the queue."""
+        queue = []
+        sink = RingSink(self.transport, queue.append)
+        message = TextMessage()
+        message.message = "hi"
+        TextMessagePacket(message.SerializeToString()).handle(None, sink)
+        sink.put(FullTreeEvent({}, {}))
+        packet_type, payload = self.transport.get_event(timeout=0)
+        self.assertEqual(packet_type, PacketType.TEXTMESSAGE)
+        self.assertEqual(payload, message.SerializeToString())
+        self.assertEqual(len(queue), 1)
+        self.assertNotIsInstance(queue[0], TextMessageReceivedEvent)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import unittest
+
+from wspr.protocol.mumble_pb2 import ChannelState, UserState
+from wspr.state import ServerState
+
+
+def user_state(session: int, **fields) -> UserState:
+    """"""
+    return UserState(session=session, **fields)
+
+
+class ServerStateCase(unittest.TestCase):
+    """Tests for the versioned channels and users."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.state = ServerState(max_removals=2)
+        self.state.update_channel(ChannelState(channel_id=0, name="Root"))
+        for session in range(1, 4):
+            self.state.update_user(user_state(session, name="user{}".format(session), channel_id=0))
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_delta(self):
+        """Test only changes since the given sequence number are returned."""
+        sequence = self.state.delta(0).sequence
+        self.state.update_user(user_state(2, self_mute=True))
+        self.state.remove_user(3)
+        self.state.update_channel(ChannelState(channel_id=1, parent=0, name="Games"))
+        delta = self.state.delta(sequence)
+        self.assertFalse(delta.full)
+        self.assertEqual(list(delta.users), [2])
+        self.assertEqual(list(delta.channels), [1])
+        self.assertEqual(delta.removed_users, [3])
+        self.assertEqual(self.state.delta(delta.sequence).users, {})
+
+    def test_snapshot(self):
+        """Test a snapshot is returned when removals were forgotten."""
+        sequence = self.state.sequence
+        for session in (1, 2, 3):
+            self.state.remove_user(session)
+        delta = self.state.delta(sequence)
+        self.assertTrue(delta.full)
+        self.assertEqual(delta.users, {})
+        self.assertEqual(list(delta.channels), [0])
+        self.assertTrue(self.state.delta(self.state.sequence + 10).full)
+
+    def test_indexes(self):
+        """Test lookups stay correct when users and channels move around."""
+        self.state.update_channel(ChannelState(channel_id=1, parent=0, name="Games"))
+        self.state.update_channel(ChannelState(channel_id=2, parent=1, name="Chess"))
+        self.state.update_user(user_state(1, channel_id=2, user_id=42))
+        self.state.update_user(user_state(2, name="renamed"))
+        self.assertIs(self.state.channel_by_path("Games/Chess"), self.state.channels[2])
+        self.assertIs(self.state.user_by_id(42), self.state.users[1])
+        self.assertIsNone(self.state.user_by_name("user2"))
+        self.assertEqual(self.state.user_by_name("renamed").session, 2)
+        self.assertEqual(sorted(u.session for u in self.state.users_in_channel(0)), [2, 3])
+        self.assertEqual([u.session for u in self.state.users_in_channel(2)], [1])
+        self.state.update_channel(ChannelState(channel_id=2, parent=0))
+        self.assertEqual([c.name for c in self.state.children_of(1)], [])
+        self.assertIs(self.state.channel_by_path("Chess"), self.state.channels[2])
+        self.state.remove_user(1)
+        self.state.remove_channel(2)
+        self.assertIsNone(self.state.user_by_id(42))
+        self.assertEqual(self.state.users_in_channel(2), [])
+        self.assertIsNone(self.state.channel_by_path("Chess"))
+
+    def test_resync(self):
+        """Test a reconnect replaces what the server sent again and removes the rest."""
+        self.state.update_user(user_state(1, self_mute=True))
+        sequence = self.state.sequence
+        self.state.mark_stale()
+        self.state.update_channel(ChannelState(channel_id=0, name="Root"))
+        self.state.update_user(user_state(1, name="user1", channel_id=0))
+        self.state.update_user(user_state(4, name="user4", channel_id=0))
+        self.assertTrue(self.state.is_stale())
+        self.state.sweep()
+        self.assertFalse(self.state.is_stale())
+        self.assertEqual(sorted(self.state.users), [1, 4])
+        self.assertIsNone(self.state.users[1].self_mute)
+        delta = self.state.delta(sequence)
+        self.assertFalse(delta.full)
+        self.assertEqual(sorted(delta.removed_users), [2, 3])
+        self.assertEqual(self.state.user_by_name("user4").session, 4)
+
+    def test_root_channel(self):
+        """Test users without a channel in their first user state are in the root channel."""
+        self.state.update_user(user_state(4, name="user4"))
+        self.assertEqual(self.state.users[4].channel_id, 0)
+        self.assertIn(4, [user.session for user in self.state.users_in_channel(0)])
+        self.state.update_user(user_state(4, self_mute=True))
+        self.assertEqual(self.state.users[4].channel_id, 0)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import unittest
+
+from wspr.containers.address import Address
+from wspr.containers.credentials import Credentials
+from wspr.control.tls import SessionCache, get_ssl_context
+
+
+class TLSCase(unittest.TestCase):
+    """Tests for shared TLS contexts and sessions."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.sessions = SessionCache(max_size=2)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+
+    def test_context(self):
+        """Test clients without certificate share a context."""
+        self.assertIs(get_ssl_context(Credentials("first")), get_ssl_context(Credentials("second")))
+
+    def test_sessions(self):
+        """Test sessions are kept per server and identity, and the oldest are forgotten first."""
+        anonymous = Credentials("bot")
+        registered = Credentials("bot", certificate_file="bot.pem", key_file="bot.key")
+        first, second = object(), object()
+        self.sessions.put(Address("a"), anonymous, first)
+        self.sessions.put(Address("a"), registered, second)
+        self.sessions.put(Address("a"), anonymous, None)
+        self.assertIs(self.sessions.get(Address("a"), Credentials("other")), first)
+        self.assertIs(self.sessions.get(Address("a"), registered), second)
+        self.assertIsNone(self.sessions.get(Address("a", 1234), anonymous))
+        self.sessions.put(Address("b"), anonymous, object())
+        self.sessions.put(Address("a"), anonymous, first)
+        self.sessions.put(Address("c"), anonymous, object())
+        self.assertIsNone(self.sessions.get(Address("b"), anonymous))
+        self.assertIs(self.sessions.get(Address("a"), anonymous), first)
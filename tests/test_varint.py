@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import unittest
+from unittest import mock
+
+from wspr.exceptions.exceptions import InvalidFormatError, InvalidVarInt
+from wspr.protocol import varint
+from wspr.protocol.varint import decode_varint, decode_varints, encode_varint
+from wspr.voice import packet
+from wspr.voice.packet import VoiceHeaders, VoiceType, parse_voice_packet
+
+VALUES = [0, 1, 0x7F, 0x80, 0x3FFF, 0x4000, 0x1FFFFF, 0x200000, 0xFFFFFFF, 0x10000000, 0xFFFFFFFF, 1 << 40,
+          -1, -4, -5, -0x80, -0x12345]
+
+
+def voice(voice_type, session, sequence, frame, terminator=False, target=0):
+    """"""
+    if voice_type == VoiceType.OPUS:
+        prefix = encode_varint(len(frame) | (0x2000 if terminator else 0))
+    else:
+        prefix = bytes((len(frame) | (0 if terminator else 0x80),))
+    return bytes((voice_type << 5 | target,)) + encode_varint(session) + encode_varint(sequence) + prefix + frame
+
+
+class VarIntCase(unittest.TestCase):
+    """Tests for variable length integers and voice packet headers."""
+
+    def setUp(self):
+        """"""
+        self.data = b"".join(encode_varint(value) for value in VALUES)
+        self.offsets = []
+        offset = 0
+        for value in VALUES:
+            self.offsets.append(offset)
+            offset += len(encode_varint(value))
+
+    def tearDown(self):
+        """"""
+
+    def test_round_trip(self):
+        """"""
+        for value, offset in zip(VALUES, self.offsets):
+            self.assertEqual((value, offset + len(encode_varint(value))), decode_varint(self.data, offset))
+        self.assertEqual(b"\xFC", encode_varint(-1))
+        self.assertRaises(InvalidVarInt, decode_varint, b"\xE0\x01", 0)
+
+    def test_batch(self):
+        """"""
+        for numpy in (varint.numpy, None):
+            with mock.patch.object(varint, "numpy", numpy):
+                values, ends = decode_varints(self.data, self.offsets)
+                self.assertEqual(VALUES, [int(value) for value in values])
+                self.assertEqual(self.offsets[1:] + [len(self.data)], [int(end) for end in ends])
+                # Truncated values end past the data instead of raising
+                _, ends = decode_varints(b"\x80", [0])
+                self.assertGreater(ends[0], 1)
+
+    def test_voice_packet(self):
+        """"""
+        parsed = parse_voice_packet(voice(VoiceType.OPUS, 300, 70000, b"abc", terminator=True, target=31))
+        self.assertEqual((VoiceType.OPUS, 31, 300, 70000, 3, True),
+                         (parsed.type, parsed.target, parsed.session, parsed.sequence, parsed.length,
+                          parsed.terminator))
+        self.assertRaises(InvalidFormatError, parse_voice_packet, voice(VoiceType.OPUS, 1, 1, b"abc")[:-1])
+        self.assertRaises(InvalidFormatError, parse_voice_packet, b"\x20\x01")
+
+    def test_voice_headers(self):
+        """"""
+        packets = [
+            voice(VoiceType.OPUS, 5, 1, b"x" * 200),
+            voice(VoiceType.SPEEX, 6, 2, b"yy", terminator=True),
+            b"\x20\x01",
+            voice(VoiceType.OPUS, 7, 3, b"zzz")[:-1],
+            b"",
+            voice(VoiceType.OPUS, 1 << 20, 1 << 30, b"", terminator=True, target=1),
+        ]
+        for numpy in (packet.numpy, None):
+            with mock.patch.object(packet, "numpy", numpy), mock.patch.object(varint, "numpy", numpy):
+                headers = VoiceHeaders(capacity=2)
+                self.assertEqual(6, headers.decode(packets))
+                self.assertGreaterEqual(headers.capacity, 6)
+                self.assertEqual([True, True, False, False, False, True], [bool(valid) for valid in headers.valid[:6]])
+                for row in (0, 1, 5):
+                    expected = parse_voice_packet(packets[row])
+                    actual = headers[row]
+                    self.assertEqual(
+                        (expected.type, expected.target, expected.session, expected.sequence, expected.length,
+                         expected.terminator, expected.offset),
+                        (actual.type, actual.target, actual.session, actual.sequence, actual.length,
+                         actual.terminator, actual.offset))
+                self.assertIsNone(headers[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
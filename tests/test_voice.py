@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wspr` package."""
+
+
+import time
+import unittest
+from array import array
+from unittest import mock
+
+from wspr.exceptions.client import InvalidSoundDataError
+from wspr.protocol.mumble_pb2 import UserState
+from wspr.protocol.varint import decode_varint, encode_varint
+from wspr.state import ServerState
+from wspr.voice import mixer
+from wspr.voice.jitter import JitterBuffer
+from wspr.voice.mixer import Mixer
+from wspr.voice.packet import VoiceType
+from wspr.voice.receiver import VoiceReceiver
+from wspr.voice.transmitter import VoiceTransmitter, bitrate_for_bandwidth
+
+# Table of contents byte of a 20 ms CELT only Opus packet
+OPUS_20MS = bytes((31 << 3,))
+
+
+def opus(session, sequence, frame, terminator=False):
+    """"""
+    size = encode_varint(len(frame) | (0x2000 if terminator else 0))
+    return bytes((VoiceType.OPUS << 5,)) + encode_varint(session) + encode_varint(sequence) + size + frame
+
+
+class FakeDecoder:
+    """PCM tells which packet it came from."""
+
+    def decode(self, data):
+        """"""
+        return b"pcm:" + data[1:]
+
+    def conceal(self, samples, next_data=None):
+        """"""
+        return b"plc:" + (next_data[1:] if next_data else b"") + b"/%d" % samples
+
+    def reset(self):
+        """"""
+
+
+class FakeEncoder:
+    """Encodes to the first byte of every frame."""
+
+    def __init__(self):
+        """"""
+        self.bitrate = None
+        self.frames = []
+
+    def set_bitrate(self, bitrate):
+        """"""
+        self.bitrate = bitrate
+
+    def encode(self, pcm):
+        """"""
+        self.frames.append(pcm)
+        return pcm[:1]
+
+    def reset(self):
+        """"""
+
+
+class FakeConnection:
+    """"""
+
+    def __init__(self):
+        """"""
+        self.bandwidth = 72000
+        self.media = type("Media", (), {"is_udp_available": lambda media: True})()
+        self.sent = []
+
+    def send_voice(self, packet):
+        """"""
+        self.sent.append(packet)
+
+
+class FakeEvents(list):
+    """"""
+
+    def put(self, event):
+        """"""
+        self.append(event)
+
+
+class VoiceCase(unittest.TestCase):
+    """Tests for receiving voice."""
+
+    def setUp(self):
+        """"""
+        self.buffer = JitterBuffer(delay=0.05, max_packets=4, max_concealed=2)
+
+    def tearDown(self):
+        """"""
+
+    def test_jitter_order(self):
+        """"""
+        self.assertTrue(self.buffer.push(2, b"b", 960, False, 0.0))
+        self.assertTrue(self.buffer.push(0, b"a", 960, False, 0.01))
+        self.assertFalse(self.buffer.push(0, b"a", 960, False, 0.01))
+        self.assertEqual([], self.buffer.pop(0.04))
+        self.assertAlmostEqual(0.01, self.buffer.time_until_ready(0.04))
+        # 6 is there, 4 is concealed from it
+        self.buffer.push(6, b"d", 960, True, 0.05)
+        packets = self.buffer.pop(0.2)
+        self.assertEqual([(0, b"a", 960, None), (2, b"b", 960, None), (4, None, 960, b"d"), (6, b"d", 960, None)],
+                         packets)
+        self.assertEqual(1, self.buffer.lost)
+        # Silent after the terminator, late packets are dropped until the speaker starts over
+        self.assertIsNone(self.buffer.time_until_ready(0.2))
+
+    def test_jitter_late_and_skip(self):
+        """"""
+        self.buffer.push(1000, b"a", 960, False, 0.0)
+        self.buffer.pop(0.05)
+        self.assertFalse(self.buffer.push(998, b"x", 960, False, 0.06))
+        self.assertEqual(1, self.buffer.late)
+        for sequence in range(1002, 1014, 2):
+            self.buffer.push(sequence, b"x", 960, False, 0.06)
+        self.assertEqual(4, len(self.buffer))
+        self.assertEqual(2, self.buffer.skipped)
+        # A speaker who started over is played right away
+        self.buffer.push(0, b"new", 960, False, 0.07)
+        self.assertEqual(1, len(self.buffer))
+
+    def test_jitter_underrun(self):
+        """"""
+        self.buffer.push(0, b"a", 960, False, 0.0)
+        packets = self.buffer.pop(1.0)
+        # Two packets are concealed before the speaker is considered silent
+        self.assertEqual([b"a", None, None], [data for _, data, _, _ in packets])
+        self.assertIsNone(self.buffer.time_until_ready(1.0))
+
+    def test_receiver(self):
+        """"""
+        events = FakeEvents()
+        receiver = VoiceReceiver(workers=2, delay=0.0, decoder_factory=FakeDecoder)
+        try:
+            receiver.add(opus(5, 0, OPUS_20MS + b"1"))
+            receiver.add(opus(6, 0, OPUS_20MS + b"x", terminator=True))
+            receiver.add(opus(5, 4, OPUS_20MS + b"3", terminator=True))
+            receiver.add(bytes((VoiceType.SPEEX << 5,)) + b"\x07\x00\x01z")
+            receiver.poll(events)
+            deadline = time.monotonic() + 5
+            while len(events) < 4 and time.monotonic() < deadline:
+                time.sleep(receiver.time_until_poll() or 0.001)
+                receiver.poll(events)
+            voice = {(event.session, event.sequence): (event.pcm, event.concealed) for event in events}
+            self.assertEqual({
+                (5, 0): (b"pcm:1", False),
+                (5, 2): (b"plc:3/960", True),
+                (5, 4): (b"pcm:3", False),
+                (6, 0): (b"pcm:x", False),
+            }, voice)
+            receiver.remove(5)
+            self.assertNotIn(5, receiver.buffers)
+        finally:
+            receiver.close()
+
+    def test_transmitter(self):
+        """"""
+        encoder = FakeEncoder()
+        connection = FakeConnection()
+        transmitter = VoiceTransmitter(frame_duration=0.02, encoder_factory=lambda: encoder)
+        # 20 ms frames of 960 samples, the last one is 200 samples short
+        transmitter.add(array('h', [1] * 960))
+        transmitter.add(bytes([2, 0]) * 960)
+        transmitter.add(bytes([3, 0]) * 760)
+        # That's all, the short frame ends it without waiting for more
+        transmitter.flush()
+        self.assertRaises(InvalidSoundDataError, transmitter.add, b"\0")
+        self.assertRaises(InvalidSoundDataError, transmitter.add, array('i', [0]))
+        with mock.patch("wspr.voice.transmitter.time.monotonic", return_value=100.0):
+            self.assertEqual(0.0, transmitter.time_until_send())
+            self.assertEqual(1, transmitter.poll(connection))
+            self.assertAlmostEqual(0.02, transmitter.time_until_send())
+        with mock.patch("wspr.voice.transmitter.time.monotonic", return_value=100.045):
+            self.assertEqual(2, transmitter.poll(connection))
+        self.assertIsNone(transmitter.time_until_send())
+        self.assertEqual(bitrate_for_bandwidth(72000, 0.02), encoder.bitrate)
+        self.assertEqual([1920] * 3, [len(frame) for frame in encoder.frames])
+        self.assertEqual(bytes(400), encoder.frames[2][-400:])
+        headers = []
+        for packet in connection.sent:
+            sequence, offset = decode_varint(packet, 1)
+            size, offset = decode_varint(packet, offset)
+            headers.append((packet[0] >> 5, sequence, size & 0x1FFF, bool(size & 0x2000), packet[offset:]))
+        self.assertEqual([(VoiceType.OPUS, 0, 1, False, b"\1"), (VoiceType.OPUS, 2, 1, False, b"\2"),
+                          (VoiceType.OPUS, 4, 1, True, b"\3")], headers)
+        # Tunnelled packets cost more, so there's less left for the audio
+        self.assertLess(bitrate_for_bandwidth(72000, 0.02, tunnelled=True), encoder.bitrate)
+
+    def test_transmitter_late_audio(self):
+        """Test audio streamed in real time and coming in a little late doesn't end what is said."""
+        encoder = FakeEncoder()
+        connection = FakeConnection()
+        transmitter = VoiceTransmitter(frame_duration=0.02, encoder_factory=lambda: encoder)
+        clock = mock.patch("wspr.voice.transmitter.time.monotonic")
+        with clock as monotonic:
+            monotonic.return_value = 100.0
+            transmitter.add(bytes([1, 0]) * 960)
+            self.assertEqual(1, transmitter.poll(connection))
+            # The next frame is due, but comes 15 ms late
+            monotonic.return_value = 100.025
+            self.assertEqual(0, transmitter.poll(connection))
+            self.assertAlmostEqual(0.035, transmitter.time_until_send())
+            monotonic.return_value = 100.035
+            transmitter.add(bytes([2, 0]) * 960)
+            self.assertEqual(1, transmitter.poll(connection))
+            # Nothing comes any more, what was said ends once the grace period is over
+            monotonic.return_value = 100.079
+            self.assertEqual(0, transmitter.poll(connection))
+            monotonic.return_value = 100.081
+            self.assertEqual(1, transmitter.poll(connection))
+        self.assertIsNone(transmitter.time_until_send())
+        terminators = []
+        for packet in connection.sent:
+            sequence, offset = decode_varint(packet, 1)
+            size, _ = decode_varint(packet, offset)
+            terminators.append((sequence, bool(size & 0x2000)))
+        self.assertEqual([(0, False), (2, False), (4, True)], terminators)
+        self.assertEqual(bytes(1920), encoder.frames[2])
+
+    @unittest.skipIf(mixer.numpy is None, "numpy is not installed")
+    def test_mixer(self):
+        """"""
+        import numpy
+        state = ServerState()
+        for session, channel_id in ((1, 0), (3, 7), (4, 8)):
+            state.update_user(UserState(session=session, channel_id=channel_id))
+        # Users in the root channel come without a channel
+        state.update_user(UserState(session=2))
+        frames = []
+        mix = Mixer(state, lambda channel_id, frame: frames.append((channel_id, frame.copy())), frame_duration=0.01,
+                    channels=[0, 7])
+        mix.set_gain(3, 0.5)
+        mix.add(1, numpy.full(480, 30000, dtype=numpy.int16).tobytes())
+        mix.add(2, numpy.full(960, 10000, dtype=numpy.int16).tobytes())
+        mix.add(3, numpy.full(480, -1000, dtype=numpy.int16).tobytes())
+        mix.add(4, numpy.full(480, 5, dtype=numpy.int16).tobytes())
+        with mock.patch("wspr.voice.mixer.time.monotonic", return_value=time.monotonic() + 0.015):
+            self.assertEqual(2, mix.poll())
+        self.assertEqual([0, 7, 0, 7], [channel_id for channel_id, _ in frames])
+        # Clipped, scaled, the rest of the second speaker and silence
+        self.assertEqual([32767, -500, 10000, 0], [int(frame[0]) for _, frame in frames])
+        self.assertTrue(all(len(frame) == 480 and frame.dtype == numpy.int16 for _, frame in frames))
+
+
+if __name__ == '__main__':
+    unittest.main()
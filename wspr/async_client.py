@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from typing import Dict, Optional, List, Type, Union
+
+from google.protobuf.message import Message
+
+from wspr.blob import Blob
+from wspr.channel import Channel
+from wspr.containers.address import Address
+from wspr.containers.credentials import Credentials
+from wspr.containers.ping import Ping
+from wspr.control.connection import ConnectionState, get_authentication_packets
+from wspr.control.converter import PacketConverter
+from wspr.control.events import Event
+from wspr.control.filters import EventFilter, Subscription
+from wspr.control.framing import FrameBuffer
+from wspr.control.outbound import OutboundQueue
+from wspr.control.sink import EventSink
+from wspr.control.tasks import Task
+from wspr.control.tls import get_ssl_context
+from wspr.exceptions.exceptions import WhisperException
+from wspr.protocol.mumble_pb2 import CryptSetup, TextMessage
+from wspr.protocol.packet_type import PacketType
+from wspr.protocol.packets import Packet, PingPacket
+from wspr.state import ServerState
+from wspr.user import User
+from wspr.voice.receiver import VoiceReceiver
+from wspr.voice.recorder import Recorder
+
+
+class TransportWriter:
+    """Lets the outbound queue write to an asyncio transport as if it was a non-blocking socket."""
+
+    def __init__(self, protocol: 'MumbleProtocol'):
+        """"""
+        self._protocol: MumbleProtocol = protocol
+
+    def send(self, data: memoryview) -> int:
+        """"""
+        if self._protocol.transport is None or self._protocol._paused:
+            raise BlockingIOError()
+        self._protocol.transport.write(bytes(data))
+        return len(data)
+
+
+class MumbleProtocol(asyncio.Protocol):
+    """Asyncio counterpart of Connection, all traffic of one client passes through here."""
+
+    def __init__(self, client: 'AsyncMumble'):
+        """"""
+        self._client: AsyncMumble = client
+        self._logger: logging.Logger = client._logger
+
+        # Convert raw packets to easily usable formats
+        self.converter: PacketConverter = PacketConverter()
+        self.receive_buffer: FrameBuffer = FrameBuffer()
+        # Messages wait here by priority before they are handed to the transport
+        self.outbound: OutboundQueue = OutboundQueue()
+        self._writer: TransportWriter = TransportWriter(self)
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+
+        # State of the connection
+        self.state: ConnectionState = ConnectionState.NOT_CONNECTED
+        self.transport: Optional[asyncio.Transport] = None
+        self.ping: Ping = Ping()
+        # Most the server lets us send, in bit/s
+        self.bandwidth_limit: Optional[int] = None
+
+        # Producers waiting for the outgoing messages to drain
+        self._paused: bool = False
+        self._drain_waiters: List[asyncio.Future] = []
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        """Perform Mumble authentication as soon as the TLS tunnel is up."""
+        self.transport = transport
+        self._logger.debug("Authenticating")
+        for pack in get_authentication_packets(self._client.credentials, self._client.tokens):
+            self.send(*pack)
+        # We still need to receive a message whether we are actually authenticated
+        self.state = ConnectionState.AUTHENTICATING
+
+    def data_received(self, data: bytes) -> None:
+        """"""
+        self.receive_buffer.feed(data)
+        for packet in self.converter.buffer_to_packets(self.receive_buffer):
+            self._client._handle_packet(self, packet)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        """"""
+        self._logger.debug("Disconnected")
+        self.state = ConnectionState.NOT_CONNECTED
+        self.transport = None
+        self.outbound.clear()
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_exception(ConnectionResetError("Connection lost"))
+        self._drain_waiters.clear()
+        self._client._connection_lost(exc)
+
+    def pause_writing(self) -> None:
+        """The transport buffer went over its high-water mark."""
+        self._paused = True
+
+    def resume_writing(self) -> None:
+        """The transport buffer drained below its low-water mark."""
+        self._paused = False
+        self.flush()
+
+    def flush(self) -> None:
+        """Hand queued messages to the transport, as far as it and the bulk rate allow."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self.transport is None:
+            return
+        self.outbound.write_to(self._writer)
+        # Bulk messages held back by the rate are handed over later
+        delay = self.outbound.time_until_ready()
+        if delay is not None:
+            self._flush_timer = asyncio.get_event_loop().call_later(delay, self.flush)
+        if not self.is_paused():
+            for waiter in self._drain_waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._drain_waiters.clear()
+
+    def is_paused(self) -> bool:
+        """Whether producers should hold off until the queued messages drained."""
+        return self._paused or self.outbound.paused
+
+    async def drain(self) -> None:
+        """Wait until we are willing to accept more messages."""
+        if self.transport is None:
+            raise ConnectionResetError("Connection lost")
+        if not self.is_paused():
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        self._drain_waiters.append(waiter)
+        await waiter
+
+    def send(self, message_type: PacketType, content: Message) -> None:
+        """Queue control message for the server."""
+        if self.transport is None:
+            raise ConnectionResetError("Connection lost")
+        self._logger.debug("Sending message %s", message_type)
+        self.outbound.append(message_type, content.SerializeToString())
+        self.flush()
+
+    def send_ping(self) -> None:
+        """Send keep-alive packet."""
+        if not self.ping.is_needed():
+            return
+        pack = PingPacket.from_info(self.ping.average, self.ping.variance, self.ping.amount_of_data_points).get_full()
+        self.send(*pack)
+        self.ping.update()
+        # We might have lost connection to the server if we didn't receive a ping for a minute
+        if self.ping.has_timed_out():
+            self._logger.warning("Disconnecting because of ping timeout")
+            self.close()
+
+    def incoming_ping(self) -> None:
+        """Handle incoming ping packets."""
+        self.ping.received()
+
+    def crypt_setup(self, message: CryptSetup) -> None:
+        """Voice is tunnelled through this connection, we don't need the keys for UDP."""
+
+    def set_bandwidth_limit(self, bandwidth: int) -> None:
+        """"""
+        self.bandwidth_limit = bandwidth
+
+    def close(self) -> None:
+        """"""
+        if self.transport is not None:
+            self.transport.close()
+
+    def is_alive(self) -> bool:
+        """"""
+        return self.state in (ConnectionState.CONNECTED, ConnectionState.AUTHENTICATING)
+
+    def is_connected(self) -> bool:
+        """"""
+        return self.state == ConnectionState.CONNECTED
+
+    def set_connected(self) -> None:
+        """"""
+        self.state = ConnectionState.CONNECTED
+
+    def is_authenticating(self) -> bool:
+        """"""
+        return self.state == ConnectionState.AUTHENTICATING
+
+
+class AsyncMumble:
+    """Mumble client library running on an asyncio event loop, many clients can share one process."""
+
+    def __init__(self, address: Address, credentials: Credentials, logger: Optional[logging.Logger] = None,
+                 event_filter: Optional[EventFilter] = None, state: Optional[ServerState] = None,
+                 blobs: Optional[Blob] = None, voice: Optional[VoiceReceiver] = None,
+                 recorder: Optional[Recorder] = None):
+        """
+        Create a new whisper client, ready to connect to the server.
+        Pass a ColumnarState to keep many users in little memory.
+        With blobs, textures, comments and descriptions the server only sent the hash of are filled in.
+        With voice, what people say is decoded and comes in as VoiceReceivedEvent objects.
+        With a recorder, voice is recorded to disk.
+        """
+        # Basic logging
+        self._logger: logging.Logger = logger or logging.getLogger('whisper')
+
+        # Login information
+        self.address: Address = address
+        self.credentials: Credentials = credentials
+        self.tokens: List = []
+
+        self._events: asyncio.Queue = asyncio.Queue()
+        # Packets we aren't interested in are never turned into events
+        self._sink: EventSink = EventSink(self._events.put_nowait, event_filter)
+        self._protocol: Optional[MumbleProtocol] = None
+        self._keep_alive: Optional[asyncio.Task] = None
+        self._blob_timer: Optional[asyncio.TimerHandle] = None
+        self._voice_timer: Optional[asyncio.TimerHandle] = None
+        self._error: Optional[Exception] = None
+
+        # Channels and users, versioned so consumers can ask for what changed
+        self.state: ServerState = state if state is not None else ServerState()
+        self.blobs: Optional[Blob] = blobs
+        self.voice: Optional[VoiceReceiver] = voice
+        self.recorder: Optional[Recorder] = recorder
+        if recorder is not None and recorder.state is None:
+            recorder.state = self.state
+
+    async def connect(self) -> None:
+        """Connect to the server and start keeping the connection alive."""
+        self._logger.debug("Connecting")
+        # Events and errors of the last connection, including the sentinel which ended it, don't carry over
+        self._error = None
+        self._events = asyncio.Queue()
+        self._sink = EventSink(self._events.put_nowait, self._sink.filter)
+        # When connecting again, whatever we knew is checked against what the server sends this time
+        self.state.mark_stale()
+        if self.blobs is not None:
+            self.blobs.reset()
+        if self.voice is not None:
+            self.voice.clear()
+        if self.recorder is not None:
+            self.recorder.clear()
+        loop = asyncio.get_event_loop()
+        _, self._protocol = await loop.create_connection(
+            lambda: MumbleProtocol(self),
+            self.address.host,
+            self.address.port,
+            ssl=get_ssl_context(self.credentials),
+        )
+        self._keep_alive = loop.create_task(self.__keep_alive())
+
+    async def __keep_alive(self) -> None:
+        """Send a ping whenever one is due, for as long as we are connected."""
+        protocol = self._protocol
+        while protocol.is_alive():
+            protocol.send_ping()
+            await asyncio.sleep(protocol.ping.time_until_needed())
+
+    def _handle_packet(self, protocol: MumbleProtocol, packet: Packet) -> None:
+        """Take action depending on incoming packet type."""
+        self._logger.debug("Incoming: %s", packet)
+        try:
+            if hasattr(packet, 'update'):
+                packet.update(protocol, self._sink, self)
+            else:
+                packet.handle(protocol, self._sink)
+        except WhisperException as ex:
+            self._logger.error("Closing connection: %s", ex)
+            self._error = ex
+            protocol.close()
+            return
+        if self.blobs is not None and self._blob_timer is None:
+            self.__schedule_blobs(protocol)
+        if self.voice is not None and self._voice_timer is None:
+            self.__schedule_voice()
+
+    def __schedule_blobs(self, protocol: MumbleProtocol) -> None:
+        """Send batched blob requests once they are due."""
+        delay = self.blobs.time_until_flush()
+        if delay is not None:
+            self._blob_timer = asyncio.get_event_loop().call_later(delay, self.__flush_blobs, protocol)
+
+    def __flush_blobs(self, protocol: MumbleProtocol) -> None:
+        """"""
+        self._blob_timer = None
+        if protocol.is_alive():
+            self.blobs.poll(protocol)
+            self.__schedule_blobs(protocol)
+
+    def __schedule_voice(self) -> None:
+        """Decode voice once it's due, and pick up what was decoded."""
+        delay = self.voice.time_until_poll()
+        if delay is not None:
+            self._voice_timer = asyncio.get_event_loop().call_later(delay, self.__poll_voice)
+
+    def __poll_voice(self) -> None:
+        """"""
+        self._voice_timer = None
+        self.voice.poll(self._sink)
+        self.__schedule_voice()
+
+    def _connection_lost(self, exc: Optional[Exception]) -> None:
+        """"""
+        if exc is not None and self._error is None:
+            self._error = exc
+        if self._keep_alive is not None:
+            self._keep_alive.cancel()
+        if self._blob_timer is not None:
+            self._blob_timer.cancel()
+            self._blob_timer = None
+        if self._voice_timer is not None:
+            self._voice_timer.cancel()
+            self._voice_timer = None
+        # Wake up anyone waiting for events
+        self._events.put_nowait(None)
+
+    async def send(self, message_type: PacketType, content: Message) -> None:
+        """Send control message to the server, waits when the outgoing buffer is full."""
+        self._protocol.send(message_type, content)
+        await self._protocol.drain()
+
+    async def send_task(self, task: Task) -> None:
+        """Carry out a task which results in a message to the server."""
+        await self.send(*task.get_payload())
+
+    async def send_text_message(self, message: str, channel_ids: List[int] = (), sessions: List[int] = ()) -> None:
+        """Send a text message to channels and/or users."""
+        payload = TextMessage()
+        payload.channel_id.extend(channel_ids)
+        payload.session.extend(sessions)
+        payload.message = message
+        await self.send(PacketType.TEXTMESSAGE, payload)
+
+    async def close(self) -> None:
+        """Disconnect from the server."""
+        self._logger.debug("Disconnecting")
+        if self._protocol is not None:
+            self._protocol.close()
+        if self.voice is not None:
+            self.voice.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def subscribe(self, *subscriptions: Subscription) -> None:
+        """Only receive events for the given subscriptions (and any earlier ones)."""
+        for subscription in subscriptions:
+            self._sink.filter.subscribe(subscription)
+
+    def unsubscribe(self, *kinds: Union[PacketType, Type[Event]]) -> None:
+        """Stop receiving events of the given kinds, or go back to receiving everything when no kinds are given."""
+        if not kinds:
+            self._sink.filter.clear()
+        for kind in kinds:
+            self._sink.filter.unsubscribe(kind)
+
+    def is_connected(self) -> bool:
+        """"""
+        return self._protocol is not None and self._protocol.is_connected()
+
+    @property
+    def channels(self) -> Dict[int, Channel]:
+        """"""
+        return self.state.channels
+
+    @property
+    def users(self) -> Dict[int, User]:
+        """"""
+        return self.state.users
+
+    def __aiter__(self) -> 'AsyncMumble':
+        """Iterate over incoming events until the connection is closed."""
+        return self
+
+    async def __anext__(self) -> Event:
+        """"""
+        event = await self._events.get()
+        if event is None:
+            # Let other iterators know as well
+            self._events.put_nowait(None)
+            if self._error is not None:
+                raise self._error
+            raise StopAsyncIteration
+        return event
+
+    async def __aenter__(self) -> 'AsyncMumble':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
@@ -1,24 +1,298 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import logging
-import struct
+import os
+import time
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
 
-from wspr.protocol.mumble_pb2 import RequestBlob
+from wspr.protocol.mumble_pb2 import ChannelState, RequestBlob, UserState
 from wspr.protocol.packet_type import PacketType
 
 
-class Blob:
-    """A binary large object, also known as blob. Keeps data."""
+class BlobKind(Enum):
+    """What a blob contains, and the RequestBlob field used to ask for it."""
+    TEXTURE = "session_texture"
+    COMMENT = "session_comment"
+    DESCRIPTION = "channel_description"
+
+
+def blob_hash(data: Union[bytes, str]) -> bytes:
+    """Hash the server uses to refer to a blob, text is hashed as UTF-8."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).digest()
+
+
+class BlobStore:
+    """
+    Blobs by their hash, the most recently used ones in memory and, with a directory, all of them on disk.
+    The disk tier is content addressed, so it can be shared between sessions and survives reconnects.
+    """
+
+    def __init__(self, memory_size: int = 16 * 1024 * 1024, directory: Optional[Path] = None):
+        """Memory size is the total amount of bytes kept in memory."""
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_size: int = memory_size
+        self._memory_used: int = 0
+        self._directory: Optional[Path] = Path(directory) if directory is not None else None
+
+    def __path(self, item_hash: bytes) -> Path:
+        """"""
+        name = item_hash.hex()
+        return self._directory / name[:2] / name
+
+    def __remember(self, item_hash: bytes, data: bytes) -> None:
+        """Keep the blob in memory, forgetting the least recently used ones when there isn't enough room."""
+        if len(data) > self._memory_size:
+            return
+        if item_hash in self._memory:
+            self._memory.move_to_end(item_hash)
+            return
+        self._memory[item_hash] = data
+        self._memory_used += len(data)
+        while self._memory_used > self._memory_size:
+            _, forgotten = self._memory.popitem(last=False)
+            self._memory_used -= len(forgotten)
+
+    def get(self, item_hash: bytes) -> Optional[bytes]:
+        """"""
+        data = self._memory.get(item_hash)
+        if data is not None:
+            self._memory.move_to_end(item_hash)
+            return data
+        if self._directory is None:
+            return None
+        try:
+            data = self.__path(item_hash).read_bytes()
+        except OSError:
+            return None
+        self.__remember(item_hash, data)
+        return data
+
+    def put(self, data: Union[bytes, str]) -> bytes:
+        """Store a blob, returns its hash."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        item_hash = blob_hash(data)
+        self.__remember(item_hash, data)
+        if self._directory is not None:
+            path = self.__path(item_hash)
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Write next to it first, other sessions might be reading the same directory
+                temporary = path.with_suffix(".{}.tmp".format(os.getpid()))
+                temporary.write_bytes(data)
+                os.replace(str(temporary), str(path))
+        return item_hash
+
+    def __contains__(self, item_hash: bytes) -> bool:
+        """"""
+        return item_hash in self._memory or (self._directory is not None and self.__path(item_hash).exists())
+
+    def __len__(self) -> int:
+        """Blobs in memory."""
+        return len(self._memory)
 
-    def __init__(self):
+
+class BlobScheduler:
+    """
+    Collects blob requests for a short while and sends them as few RequestBlob messages as possible.
+    Every hash is only asked for once, and messages are sent at a limited rate to stay clear of flood protection.
+    Everyone waiting on a hash is remembered, done tells who else gets what was asked for once.
+    """
+
+    def __init__(self, delay: float = 0.05, max_batch_size: int = 256, rate: float = 2.0, burst: int = 5,
+                 timeout: float = 30.0):
+        """
+        Requests wait delay seconds for others to join them, at most max batch size ids go in a message.
+        Rate is the number of messages per second with bursts of up to burst messages.
+        A hash can be asked for again when it didn't arrive within timeout seconds.
+        """
+        self.delay: float = delay
+        self.max_batch_size: int = max_batch_size
+        self.rate: float = rate
+        self.burst: int = burst
+        self.timeout: float = timeout
+        # Hash of every (kind, session/channel id) waiting to be requested
+        self._pending: OrderedDict = OrderedDict()
+        self._pending_hashes: Set[bytes] = set()
+        self._pending_since: Optional[float] = None
+        # Deadline of every requested hash
+        self._in_flight: Dict[bytes, float] = {}
+        # Every (kind, session/channel id) waiting on a hash, whether it's asked for on its behalf or not
+        self._waiting: Dict[bytes, Set[Tuple[BlobKind, int]]] = {}
+        self._waits_for: Dict[Tuple[BlobKind, int], bytes] = {}
+        self._tokens: float = burst
+        self._refilled: float = time.monotonic()
+
+    def add(self, kind: BlobKind, key: int, item_hash: bytes) -> bool:
+        """Schedule a request, returns False when the hash is already pending or asked for."""
+        now = time.monotonic()
+        previous = self._waits_for.get((kind, key))
+        if previous != item_hash:
+            if previous is not None:
+                self.__stop_waiting(kind, key, previous)
+            self._waits_for[(kind, key)] = item_hash
+            self._waiting.setdefault(item_hash, set()).add((kind, key))
+        if self._in_flight.get(item_hash, 0.0) > now or item_hash in self._pending_hashes:
+            return False
+        previous = self._pending.pop((kind, key), None)
+        if previous is not None:
+            self._pending_hashes.discard(previous)
+        self._pending[(kind, key)] = item_hash
+        self._pending_hashes.add(item_hash)
+        if self._pending_since is None:
+            self._pending_since = now
+        return True
+
+    def __stop_waiting(self, kind: BlobKind, key: int, item_hash: bytes) -> None:
         """"""
+        waiting = self._waiting.get(item_hash)
+        if waiting is not None:
+            waiting.discard((kind, key))
+            if not waiting:
+                del self._waiting[item_hash]
+
+    def done(self, item_hash: bytes) -> Set[Tuple[BlobKind, int]]:
+        """The blob arrived, returns every (kind, session/channel id) which was waiting on it."""
+        self._in_flight.pop(item_hash, None)
+        waiting = self._waiting.pop(item_hash, set())
+        for waiter in waiting:
+            del self._waits_for[waiter]
+        return waiting
+
+    def __refill(self, now: float) -> None:
+        """"""
+        self._tokens = min(self._tokens + (now - self._refilled) * self.rate, self.burst)
+        self._refilled = now
+
+    def time_until_flush(self) -> Optional[float]:
+        """Seconds before requests have to be sent, None when nothing is waiting."""
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        self.__refill(now)
+        wait = self._pending_since + self.delay - now
+        if self._tokens < 1:
+            wait = max(wait, (1 - self._tokens) / self.rate)
+        return max(wait, 0.0)
+
+    def poll(self, connection) -> int:
+        """Send the waiting requests if they waited long enough and the rate allows it, returns messages sent."""
+        if not self._pending or self.time_until_flush() > 0:
+            return 0
+        now = time.monotonic()
+        # Forget requests which never got an answer
+        for item_hash in [item_hash for item_hash, deadline in self._in_flight.items() if deadline <= now]:
+            del self._in_flight[item_hash]
+        sent = 0
+        while self._pending and self._tokens >= 1:
+            request_packet = RequestBlob()
+            for _ in range(min(self.max_batch_size, len(self._pending))):
+                (kind, key), item_hash = self._pending.popitem(last=False)
+                self._pending_hashes.discard(item_hash)
+                self._in_flight[item_hash] = now + self.timeout
+                getattr(request_packet, kind.value).append(key)
+            connection.send(PacketType.REQUESTBLOB, request_packet)
+            self._tokens -= 1
+            sent += 1
+        self._pending_since = now if self._pending else None
+        return sent
+
+    def clear(self) -> None:
+        """Forget everything, requests don't survive the connection they were meant for."""
+        self._pending.clear()
+        self._pending_hashes.clear()
+        self._pending_since = None
+        self._in_flight.clear()
+        self._waiting.clear()
+        self._waits_for.clear()
+
+    def __len__(self) -> int:
+        """Requests waiting to be sent."""
+        return len(self._pending)
+
+
+class Blob:
+    """
+    Binary large objects, also known as blobs: textures, comments and channel descriptions.
+    The server only sends their hash when they are large, the content is filled in from the store when we have it
+    and requested from the server when we don't.
+    Use one per connection, connections can share a store.
+    """
+
+    def __init__(self, store: Optional[BlobStore] = None, fetch: bool = True,
+                 scheduler: Optional[BlobScheduler] = None):
+        """Without fetch, blobs are only filled in from the store and never requested."""
         self._logger = logging.getLogger('whisper')
+        self.store: BlobStore = store if store is not None else BlobStore()
+        self.fetch: bool = fetch
+        self.scheduler: BlobScheduler = scheduler if scheduler is not None else BlobScheduler()
+        # Messages completing the users and channels which waited on a blob that came for somebody else
+        self._arrived: List[Union[UserState, ChannelState]] = []
+
+    def __resolve(self, message, kind: BlobKind, key: int, field: str, hash_field: str, text: bool) -> bool:
+        """Store content which came with the message, or fill it in when only its hash came. True when filled in."""
+        if message.HasField(field):
+            data = getattr(message, field)
+            for waiting_kind, waiting_key in self.scheduler.done(self.store.put(data)):
+                if (waiting_kind, waiting_key) != (kind, key):
+                    self._arrived.append(self.__complete(waiting_kind, waiting_key, data))
+        elif message.HasField(hash_field):
+            item_hash = getattr(message, hash_field)
+            data = self.store.get(item_hash)
+            if data is not None:
+                setattr(message, field, data.decode("utf-8") if text else data)
+                return True
+            if self.fetch:
+                self.request(kind, key, item_hash)
+        return False
+
+    @staticmethod
+    def __complete(kind: BlobKind, key: int, data: Union[bytes, str]) -> Union[UserState, ChannelState]:
+        """State message carrying the content, as if the server sent it."""
+        if kind == BlobKind.TEXTURE:
+            return UserState(session=key, texture=data.encode("utf-8") if isinstance(data, str) else data)
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        if kind == BlobKind.DESCRIPTION:
+            return ChannelState(channel_id=key, description=data)
+        return UserState(session=key, comment=data)
+
+    def arrived(self) -> List[Union[UserState, ChannelState]]:
+        """State messages for everyone else who waited on the blobs that arrived since the last call."""
+        arrived, self._arrived = self._arrived, []
+        return arrived
+
+    def user_state(self, message: UserState) -> bool:
+        """Complete the texture and comment of a user, returns whether the message changed."""
+        texture = self.__resolve(message, BlobKind.TEXTURE, message.session, 'texture', 'texture_hash', False)
+        comment = self.__resolve(message, BlobKind.COMMENT, message.session, 'comment', 'comment_hash', True)
+        return texture or comment
+
+    def channel_state(self, message: ChannelState) -> bool:
+        """Complete the description of a channel, returns whether the message changed."""
+        return self.__resolve(message, BlobKind.DESCRIPTION, message.channel_id, 'description', 'description_hash',
+                              True)
+
+    def request(self, kind: BlobKind, key: int, item_hash: bytes) -> None:
+        """Ask the server for the blob of a user (by session) or a channel (by channel id) with the next batch."""
+        if self.scheduler.add(kind, key, item_hash):
+            self._logger.debug("Requesting %s of %s", kind.name.lower(), key)
+
+    def poll(self, connection) -> None:
+        """Send the batched requests which are due."""
+        self.scheduler.poll(connection)
+
+    def time_until_flush(self) -> Optional[float]:
+        """"""
+        return self.scheduler.time_until_flush()
 
-    def request(self, item_hash, connection):
-        """Request the user's comment."""
-        # We already have this information
-        # if comment_hash in self.blobs:
-        #     return
-        request_packet = RequestBlob()
-        request_packet.session_comment.extend(struct.unpack("!5I", item_hash))
-        connection.send_message(PacketType.REQUESTBLOB, request_packet)
+    def reset(self) -> None:
+        """Called on every new connection."""
+        self.scheduler.clear()
+        self._arrived.clear()
@@ -1,11 +1,30 @@
 # -*- coding: utf-8 -*-
 
+from wspr.protocol.message import compile_setters
 from wspr.protocol.mumble_pb2 import ChannelState
 
+# Murmur leaves the channel out of user states for users in the root channel
+ROOT_CHANNEL = 0
+
 
 class Channel:
     """"""
 
+    # No per instance dictionary, we might keep track of a lot of channels
+    __slots__ = (
+        'channel_id',
+        'parent',
+        'name',
+        'links',
+        'description',
+        'links_add',
+        'links_remove',
+        'temporary',
+        'position',
+        'description_hash',
+        'max_users',
+    )
+
     def __init__(self):
         """"""
         self.channel_id = None
@@ -24,8 +43,12 @@ class Channel:
         """Update channel."""
         # Don't override existing values if the update message doesn't contain them
         for field, value in data.ListFields():
-            setattr(self, field.name, value)
+            _SETTERS[field.number](self, value)
 
     def __repr__(self) -> str:
         """"""
         return 'name={}'.format(self.name)
+
+
+# Field number to slot, looked up once instead of by name for every field of every update
+_SETTERS = compile_setters(Channel, ChannelState.DESCRIPTOR)
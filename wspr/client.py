@@ -2,16 +2,23 @@
 
 import logging
 import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import selectors
 import time
-from collections import defaultdict
 from pathlib import Path
+from typing import Optional
 
 from wspr.blob import Blob
-from wspr.channel import Channel
 from wspr.containers.address import Address
 from wspr.containers.credentials import Credentials
 from wspr.control.events import FullTreeEvent
 from wspr.control.connection import Connection
+from wspr.control.filters import EventFilter
+from wspr.control.reconnect import ReconnectPolicy
+from wspr.control.ring import RingTransport
+from wspr.control.sink import EventSink, RingSink
 from wspr.control.tasks import (
     Task,
     StartTask,
@@ -19,42 +26,109 @@ from wspr.control.tasks import (
     StopTask,
     FullTreeTask,
     MessageTask,
-    PrivateMessageCommand
+    PrivateMessageCommand,
+    SubscribeTask,
+    UnsubscribeTask,
+    TreeDeltaTask,
+    VoiceTask,
 )
+from wspr.exceptions.client import InvalidSoundDataError
 from wspr.protocol.packets import Packet
-from wspr.user import User
+from wspr.state import ServerState
+from wspr.voice.receiver import VoiceReceiver
+from wspr.voice.recorder import Recorder
+from wspr.voice.transmitter import VoiceTransmitter
 
 
 class Mumble(multiprocessing.Process):
     """Mumble client library."""
 
+    # Seconds before tasks put on the queue directly instead of through submit are noticed, None to not look for them
+    TASK_POLL_INTERVAL: Optional[float] = None
+
     @classmethod
     def from_config(cls, configuration_file_path: Path):
         """Get all settings from configuration file."""
         raise NotImplemented
 
     def __init__(self, address: Address, credentials: Credentials, tasks: multiprocessing.Queue,
-                 events: multiprocessing.Queue, logger: logging.Logger):
-        """Create a new whisper Mumble thread, ready to connect to the server."""
+                 events: multiprocessing.Queue, logger: logging.Logger, event_filter: Optional[EventFilter] = None,
+                 max_batch_size: int = 1, max_delay: float = 0.0, ring: Optional[RingTransport] = None,
+                 state: Optional[ServerState] = None, blobs: Optional[Blob] = None,
+                 reconnect: Optional[ReconnectPolicy] = None, voice: Optional[VoiceReceiver] = None,
+                 transmitter: Optional[VoiceTransmitter] = None, recorder: Optional[Recorder] = None):
+        """
+        Create a new whisper Mumble thread, ready to connect to the server.
+        With a max batch size above one, events are put on the queue as EventBatch objects, see EventReceiver.
+        With a ring, packets are passed as raw frames through shared memory instead of the events queue,
+        and raw messages from the ring are sent to the server. The queues are still used for other tasks and events.
+        With voice, what people say is decoded and put on the events queue as VoiceReceivedEvent objects.
+        With a transmitter, PCM sent with VoiceTask objects is encoded and said.
+        With a recorder, voice is recorded to disk.
+        Hand tasks over with submit, which wakes the client up right away.
+        """
         # Basic logging
         self._logger: logging.Logger = logger
         self._tasks: multiprocessing.Queue = tasks
         self._events: multiprocessing.Queue = events
+        # Packets the consumer isn't interested in are never turned into events and put on the queue
+        self._ring: Optional[RingTransport] = ring
+        if ring is None:
+            self._sink: EventSink = EventSink(events.put, event_filter, max_batch_size, max_delay)
+        else:
+            self._sink: EventSink = RingSink(ring, events.put, event_filter)
         self._killed: multiprocessing.Event() = multiprocessing.Event()
+        # Rung by submit, wakes up the main loop as soon as a task comes in
+        self._wakeup_reader, self._wakeup_writer = multiprocessing.Pipe(duplex=False)
+        for end in (self._wakeup_reader, self._wakeup_writer):
+            os.set_blocking(end.fileno(), False)
 
-        self._blobs: defaultdict = defaultdict(Blob)
-        self._channels: defaultdict = defaultdict(Channel)
-        self._users: defaultdict = defaultdict(User)
+        self.blobs: Optional[Blob] = blobs
+        self.voice: Optional[VoiceReceiver] = voice
+        self.transmitter: Optional[VoiceTransmitter] = transmitter
+        self.recorder: Optional[Recorder] = recorder
+        self._reconnect: ReconnectPolicy = reconnect if reconnect is not None else ReconnectPolicy()
+        # Channels and users, versioned so consumers can ask for what changed
+        self.state: ServerState = state if state is not None else ServerState()
+        if recorder is not None and recorder.state is None:
+            recorder.state = self.state
 
         self._address: Address = address
         self._credentials: Credentials = credentials
 
         super().__init__(name=f"whisper-{credentials.name}")
 
+    def submit(self, task: Task) -> None:
+        """Hand a task to the client and wake it up, from the process which created it."""
+        # A byte per task, rung first so a task never arrives without one
+        try:
+            os.write(self._wakeup_writer.fileno(), b"\0")
+        except BlockingIOError:
+            # Plenty of wake ups are pending already
+            pass
+        self._tasks.put(task)
+
+    def __answer_wakeups(self, count: int) -> None:
+        """
+        Take a byte off the doorbell for every task taken off the queue.
+        The bytes of tasks the queue didn't deliver yet stay, so the doorbell keeps ringing until they are there.
+        """
+        try:
+            while count > 0:
+                count -= len(os.read(self._wakeup_reader.fileno(), count))
+        except BlockingIOError:
+            # Tasks put on the queue directly
+            pass
+
     def __handle_tasks(self, connection=None) -> None:
         """Process incoming task requests."""
-        while not self._tasks.empty():
-            task: Task = self._tasks.get()
+        taken = 0
+        while True:
+            try:
+                task: Task = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            taken += 1
             if type(task) == StartTask:
                 pass
             elif type(task) == ConnectTask:
@@ -63,45 +137,179 @@ class Mumble(multiprocessing.Process):
                 self._logger.debug("Stopping")
                 self._killed.set()
             elif type(task) == FullTreeTask:
-                self._events.put(FullTreeEvent(self._channels, self._users))
+                self._sink.put(FullTreeEvent(self.state.channels, self.state.users))
+            elif type(task) == TreeDeltaTask:
+                self._sink.put(self.state.delta(task.since))
+            elif type(task) == SubscribeTask:
+                for subscription in task.subscriptions:
+                    self._sink.filter.subscribe(subscription)
+            elif type(task) == UnsubscribeTask:
+                if not task.kinds:
+                    self._sink.filter.clear()
+                for kind in task.kinds:
+                    self._sink.filter.unsubscribe(kind)
             elif type(task) == MessageTask:
                 if connection:
-                    p = task.get_packet()
+                    p = task.get_payload()
                     connection.send(*p)
             elif type(task) == PrivateMessageCommand:
                 if connection:
-                    p = task.get_packet()
+                    p = task.get_payload()
                     connection.send(*p)
+            elif type(task) == VoiceTask:
+                if self.transmitter is None:
+                    self._logger.warning("Can't speak without a transmitter")
+                    continue
+                try:
+                    self.transmitter.add(task.pcm)
+                except InvalidSoundDataError as ex:
+                    self._logger.error("Invalid voice: %s", ex)
+                if task.end:
+                    self.transmitter.flush()
+        self.__answer_wakeups(taken)
 
-    def __handle_packets(self, c):
+    def __handle_ring_tasks(self, c: Connection) -> None:
+        """Send raw messages coming in through the shared memory ring."""
+        task = self._ring.get_task()
+        while task is not None:
+            c.send_raw(*task)
+            task = self._ring.get_task()
+
+    def __handle_packets(self, c, packets: [Packet]):
         """Take action depending on incoming packet type."""
-        packets: [Packet] = c.__incoming_packets()
         for packet in packets:
-            self._logger.debug(f"Incoming: {packet}")
-            try:
-                packet.update(c, self._events, self)
-            except AttributeError:
-                packet.handle(c, self._events)
+            # Only formatted when debug logging is enabled
+            self._logger.debug("Incoming: %s", packet)
+            if hasattr(packet, 'update'):
+                packet.update(c, self._sink, self)
+            else:
+                packet.handle(c, self._sink)
+
+    def __next_timeout(self, c: Connection) -> float:
+        """Seconds until something has to be done, even if no data comes in."""
+        timeouts = [
+            c.ping.time_until_needed(),
+            self._sink.time_until_flush(),
+            c.outbound.time_until_ready(),
+            c.media.time_until_ping(),
+        ]
+        if self.blobs is not None:
+            timeouts.append(self.blobs.time_until_flush())
+        if self.voice is not None:
+            timeouts.append(self.voice.time_until_poll())
+        if self.transmitter is not None and c.is_connected():
+            timeouts.append(self.transmitter.time_until_send())
+        return min(timeout for timeout in timeouts if timeout is not None)
+
+    def __session(self) -> None:
+        """Connect and react to incoming data until the connection is lost."""
+        # We have established a connection
+        with Connection(self._address, self._credentials, self._logger) as c, \
+                selectors.DefaultSelector() as selector:
+            self._logger.debug("Main loop")
+            # Whatever we knew is checked against what the server sends this time, see ServerState.sweep
+            self.state.mark_stale()
+            if self.blobs is not None:
+                self.blobs.reset()
+            if self.voice is not None:
+                self.voice.clear()
+            if self.recorder is not None:
+                self.recorder.clear()
+            if self.transmitter is not None:
+                self.transmitter.clear()
+            selector.register(c.control_socket, selectors.EVENT_READ)
+            if c.media_socket is not None:
+                selector.register(c.media_socket, selectors.EVENT_READ)
+            # The doorbell becomes readable as soon as a task is submitted
+            producers = [self._wakeup_reader]
+            if self._ring is not None:
+                producers.append(self._ring.tasks_fileno())
+            for producer in producers:
+                selector.register(producer, selectors.EVENT_READ)
+            paused = False
+            # Keep connection alive
+            while not self._killed.is_set() and c.is_alive():
+                # Send ping and keep last time
+                c.send_ping()
+                c.media.send_ping()
+                # Voice frames which are due
+                if self.transmitter is not None and c.is_connected():
+                    self.transmitter.poll(c)
+                # Everything we have to say since the last pass goes out in as few writes as possible
+                c.flush()
+                if not c.is_alive():
+                    break
+                # Wait for the socket to become writable only while there is something left to write
+                events = selectors.EVENT_READ | (selectors.EVENT_WRITE if c.has_pending_output() else 0)
+                if selector.get_key(c.control_socket).events != events:
+                    selector.modify(c.control_socket, events)
+                # Leave tasks where they are while the server can't keep up with what we already have to send
+                if c.is_paused() != paused:
+                    paused = c.is_paused()
+                    for producer in producers:
+                        if paused:
+                            selector.unregister(producer)
+                        else:
+                            selector.register(producer, selectors.EVENT_READ)
+                # Sleep until the server sends something, a task comes in or something else is due
+                timeout = self.__next_timeout(c)
+                if not paused and self.TASK_POLL_INTERVAL is not None:
+                    timeout = min(timeout, self.TASK_POLL_INTERVAL)
+                ready = {key.fileobj: mask for key, mask in selector.select(timeout)}
+                # Handle tasks while connected
+                if not paused:
+                    self.__handle_tasks(c)
+                if self._ring is not None and self._ring.tasks_fileno() in ready:
+                    self.__handle_ring_tasks(c)
+                # Process all incoming packets
+                if ready.get(c.control_socket, 0) & selectors.EVENT_READ:
+                    self.__handle_packets(c, c.incoming_packets())
+                    # The server accepted us, back off from scratch the next time we lose the connection
+                    if self._reconnect.attempts and c.is_connected():
+                        self._reconnect.reset()
+                # Voice packets which came over UDP are handled as if they were tunnelled
+                if c.media_socket is not None and c.media_socket in ready:
+                    self.__handle_packets(c, c.incoming_media_packets())
+                # Voice which is due goes to the decoders, what they decoded goes to the consumer
+                if self.voice is not None:
+                    self.voice.poll(self._sink)
+                # Everything from this pass goes to the consumer as a single batch
+                self._sink.poll()
+                # Blob requests of this pass go out together
+                if self.blobs is not None:
+                    self.blobs.poll(c)
+            self._sink.flush()
+            self._logger.debug("Main loop ended")
+
+    def __wait(self, delay: float) -> None:
+        """Wait before reconnecting, while still handling tasks."""
+        deadline = time.monotonic() + delay
+        remaining = delay
+        while remaining > 0 and not self._killed.is_set():
+            if self.TASK_POLL_INTERVAL is not None:
+                remaining = min(remaining, self.TASK_POLL_INTERVAL)
+            multiprocessing.connection.wait([self._wakeup_reader], remaining)
+            self.__handle_tasks()
+            self._sink.flush()
+            remaining = deadline - time.monotonic()
 
     def __loop(self) -> None:
-        """Continuously react to incoming data."""
+        """Continuously react to incoming data, reconnecting when the connection is lost."""
         while not self._killed.is_set():
             # Handle tasks before we're connected
             self.__handle_tasks()
-            # We have established a connection
-            with Connection(self._address, self._credentials, self._logger) as c:
-                self._logger.debug("Main loop")
-                # Keep connection alive
-                while not self._killed.is_set():
-                    # Handle tasks while connected
-                    self.__handle_tasks(c)
-                    # Send ping and keep last time
-                    c.__send_ping()
-                    # Process all incoming packets
-                    self.__handle_packets(c)
-                    time.sleep(0.1)
-                self._logger.debug("Main loop ended")
-            time.sleep(1)
+            try:
+                self.__session()
+            except OSError as ex:
+                self._logger.warning("Connection failed: %s", ex)
+            if self._killed.is_set():
+                break
+            delay = self._reconnect.next_delay()
+            if delay is None:
+                self._logger.error("Giving up after %d attempts to reconnect", self._reconnect.attempts)
+                break
+            self._logger.info("Reconnecting in %.1f seconds", delay)
+            self.__wait(delay)
 
     def run(self) -> None:
         """Start the execution of the process. Will connect to the server and start the main loop."""
@@ -111,4 +319,8 @@ class Mumble(multiprocessing.Process):
             self._logger.critical("Error:")
             self._logger.exception(ex)
         finally:
+            if self.voice is not None:
+                self.voice.close()
+            if self.recorder is not None:
+                self.recorder.close()
             self._logger.debug("Shutting down")
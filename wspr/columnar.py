@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from collections.abc import Mapping
+from enum import IntFlag
+from typing import Callable, Dict, Iterator, List, Optional
+
+from wspr.channel import ROOT_CHANNEL
+from wspr.protocol.mumble_pb2 import UserState
+from wspr.state import ServerState
+from wspr.user import User
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class UserFlag(IntFlag):
+    """Boolean fields of a user, stored as bits of a single column."""
+    MUTE = 1 << 0
+    DEAF = 1 << 1
+    SUPPRESS = 1 << 2
+    SELF_MUTE = 1 << 3
+    SELF_DEAF = 1 << 4
+    PRIORITY_SPEAKER = 1 << 5
+    RECORDING = 1 << 6
+
+
+# Value of the user id column when the server didn't tell us, users without a channel are in the root channel
+UNKNOWN = -1
+
+
+class UserTable(Mapping):
+    """
+    Users stored as columns instead of one object per user, for servers with tens of thousands of sessions.
+    Only the session, name, user id, channel and flags are kept; textures, comments and plugin data are dropped.
+    Reading a user creates a User record on the fly, changing it doesn't change the table.
+    """
+
+    def __init__(self):
+        """"""
+        self.sessions: array = array('I')
+        self.channel_ids: array = array('q')
+        self.user_ids: array = array('q')
+        self.flags: array = array('H')
+        self.names: List[Optional[str]] = []
+        # Row of every session, rows are moved around on removal to keep the columns dense
+        self._rows: Dict[int, int] = {}
+
+    def update(self, message: UserState) -> None:
+        """Add or update the user in the message."""
+        row = self._rows.get(message.session)
+        if row is None:
+            row = self._rows[message.session] = len(self.sessions)
+            self.sessions.append(message.session)
+            self.channel_ids.append(ROOT_CHANNEL)
+            self.user_ids.append(UNKNOWN)
+            self.flags.append(0)
+            self.names.append(None)
+        for field, value in message.ListFields():
+            setter = _SETTERS.get(field.number)
+            if setter is not None:
+                setter(self, row, value)
+
+    def remove(self, session: int) -> None:
+        """Forget the user, the last row takes its place."""
+        row = self._rows.pop(session)
+        last = len(self.sessions) - 1
+        if row != last:
+            for column in (self.sessions, self.channel_ids, self.user_ids, self.flags, self.names):
+                column[row] = column[last]
+            self._rows[self.sessions[row]] = row
+        for column in (self.sessions, self.channel_ids, self.user_ids, self.flags, self.names):
+            column.pop()
+
+    def has_flag(self, session: int, flag: UserFlag) -> bool:
+        """"""
+        return bool(self.flags[self._rows[session]] & flag)
+
+    def __select(self, column: array, value: int) -> List[int]:
+        """Sessions of the rows where the column has the given value."""
+        if numpy is not None and column:
+            sessions = numpy.frombuffer(self.sessions, dtype=numpy.uint32)
+            return sessions[numpy.frombuffer(column, dtype=numpy.int64) == value].tolist()
+        return [session for session, other in zip(self.sessions, column) if other == value]
+
+    def sessions_in_channel(self, channel_id: int) -> List[int]:
+        """"""
+        return self.__select(self.channel_ids, channel_id)
+
+    def sessions_with_flag(self, flag: UserFlag) -> List[int]:
+        """Sessions of the users which have all of the given flags, e.g. everyone muted."""
+        if numpy is not None and self.flags:
+            sessions = numpy.frombuffer(self.sessions, dtype=numpy.uint32)
+            return sessions[(numpy.frombuffer(self.flags, dtype=numpy.uint16) & flag) == flag].tolist()
+        return [session for session, flags in zip(self.sessions, self.flags) if flags & flag == flag]
+
+    def session_by_user_id(self, user_id: int) -> Optional[int]:
+        """"""
+        sessions = self.__select(self.user_ids, user_id)
+        return sessions[0] if sessions else None
+
+    def session_by_name(self, name: str) -> Optional[int]:
+        """"""
+        try:
+            return self.sessions[self.names.index(name)]
+        except ValueError:
+            return None
+
+    def __getitem__(self, session: int) -> User:
+        """The user as a User record."""
+        row = self._rows[session]
+        user = User()
+        user.session = session
+        user.name = self.names[row]
+        user.channel_id = self.channel_ids[row]
+        user.user_id = self.user_ids[row] if self.user_ids[row] != UNKNOWN else None
+        flags = self.flags[row]
+        user.mute = bool(flags & UserFlag.MUTE)
+        user.deaf = bool(flags & UserFlag.DEAF)
+        user.suppress = bool(flags & UserFlag.SUPPRESS)
+        user.self_mute = bool(flags & UserFlag.SELF_MUTE)
+        user.self_deaf = bool(flags & UserFlag.SELF_DEAF)
+        user.priority_speaker = bool(flags & UserFlag.PRIORITY_SPEAKER)
+        user.recording = bool(flags & UserFlag.RECORDING)
+        return user
+
+    def __contains__(self, session) -> bool:
+        """"""
+        return session in self._rows
+
+    def __iter__(self) -> Iterator[int]:
+        """"""
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        """"""
+        return len(self._rows)
+
+
+def _column_setter(name: str) -> Callable[[UserTable, int, object], None]:
+    """"""
+    def setter(table: UserTable, row: int, value) -> None:
+        getattr(table, name)[row] = value
+    return setter
+
+
+def _flag_setter(flag: UserFlag) -> Callable[[UserTable, int, bool], None]:
+    """"""
+    def setter(table: UserTable, row: int, value: bool) -> None:
+        if value:
+            table.flags[row] |= flag
+        else:
+            table.flags[row] &= ~int(flag)
+    return setter
+
+
+# Field number to column, fields without a column are dropped
+_SETTERS: Dict[int, Callable[[UserTable, int, object], None]] = {
+    UserState.DESCRIPTOR.fields_by_name['name'].number: _column_setter('names'),
+    UserState.DESCRIPTOR.fields_by_name['user_id'].number: _column_setter('user_ids'),
+    UserState.DESCRIPTOR.fields_by_name['channel_id'].number: _column_setter('channel_ids'),
+}
+for _flag in UserFlag:
+    _SETTERS[UserState.DESCRIPTOR.fields_by_name[_flag.name.lower()].number] = _flag_setter(_flag)
+
+
+class ColumnarState(ServerState):
+    """
+    Server state keeping users in a UserTable instead of User records.
+    Lookups scan the columns (vectorized when NumPy is available) instead of keeping indexes per user.
+    """
+
+    def __init__(self, max_removals: int = 10000):
+        """"""
+        super().__init__(max_removals)
+        self.users: UserTable = UserTable()
+
+    def update_user(self, message: UserState) -> None:
+        """"""
+        if message.session in self._stale_users:
+            self._stale_users.discard(message.session)
+            self.users.remove(message.session)
+        self.users.update(message)
+        self._user_changed(message.session)
+
+    def remove_user(self, session: int) -> None:
+        """"""
+        self._stale_users.discard(session)
+        if session in self.users:
+            self.users.remove(session)
+            self._user_removed(session)
+
+    def user_by_name(self, name: str) -> Optional[User]:
+        """"""
+        session = self.users.session_by_name(name)
+        return self.users[session] if session is not None else None
+
+    def user_by_id(self, user_id: int) -> Optional[User]:
+        """Registered user by its user id."""
+        session = self.users.session_by_user_id(user_id)
+        return self.users[session] if session is not None else None
+
+    def users_in_channel(self, channel_id: int) -> List[User]:
+        """"""
+        return [self.users[session] for session in self.users.sessions_in_channel(channel_id)]
@@ -69,6 +69,11 @@ class Ping:
         """"""
         return self.__get_current_time_milliseconds() >= self.time_sent + self.delay_milliseconds
 
+    def time_until_needed(self) -> float:
+        """Seconds left before the next ping has to be sent."""
+        remaining = self.time_sent + self.delay_milliseconds - self.__get_current_time_milliseconds()
+        return max(remaining, 0) / 1000
+
     def has_timed_out(self) -> bool:
         """Did we get a response to our ping in the last 60 seconds?"""
         return self.time_received != 0 and self.time_sent > self.time_received + self.timeout_milliseconds
@@ -1,21 +1,27 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import select
 import socket
 import ssl
-import struct
 import enum
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+from google.protobuf.message import Message
 
 from wspr import __version__
 from wspr.containers.address import Address
 from wspr.containers.credentials import Credentials
 from wspr.containers.ping import Ping
 from wspr.control.converter import PacketConverter
+from wspr.control.framing import FrameBuffer
+from wspr.control.outbound import OutboundQueue
+from wspr.control.tls import get_ssl_context, sessions
 from wspr.exceptions.connection import AlreadyConnectedError
 from wspr.protocol.packet_type import PacketType
+from wspr.protocol.mumble_pb2 import CryptSetup
 from wspr.protocol.packets import Packet, VersionPacket, AuthenticatePacket, PingPacket
+from wspr.voice import crypt
+from wspr.voice.udp import MediaChannel
 
 
 class ConnectionState(enum.Enum):
@@ -26,6 +32,20 @@ class ConnectionState(enum.Enum):
     FAILED = 3
 
 
+def get_authentication_packets(credentials: Credentials, tokens: List) -> List[Tuple[PacketType, Message]]:
+    """First packets to send to the server, version information followed by user information."""
+    # Version information
+    whisper_version = __version__
+    protocol_version = (1, 2, 4)
+    application = "Whisper {}".format(whisper_version)
+    os_string = "TODO"
+    os_version_string = "TODO"
+    return [
+        VersionPacket.from_info(application, protocol_version, os_string, os_version_string).get_full(),
+        AuthenticatePacket.from_info(credentials, tokens).get_full(),
+    ]
+
+
 class Connection:
     """All traffic from client to server and vice-versa passes through here."""
 
@@ -47,14 +67,18 @@ class Connection:
         self.control_socket: Optional[socket.socket] = None
         self.media_socket: Optional[socket.socket] = None
         self.ping: Ping = Ping()
-        self.udp_active: bool = False
-        self.receive_buffer: bytes = bytes()
+        # Voice over UDP when we can encrypt it, tunnelled through this connection otherwise
+        self.udp_active: bool = crypt.is_available()
+        self.media: MediaChannel = MediaChannel(self)
+        self.receive_buffer: FrameBuffer = FrameBuffer()
+        self.outbound: OutboundQueue = OutboundQueue()
+        # Write queued messages right away once this many bytes are waiting, in bytes
+        self.flush_size: int = 64 * 1024
         # How many bytes to read at a time from the control address, in bytes
-        self.read_buffer_size: int = 4096
+        self.read_buffer_size: int = 64 * 1024
         # Total outgoing bitrate in bit/seconds
         self.bandwidth: int = 192000
         self.bandwidth_limit: Optional[int] = None
-        self.rate: float = 0.05
 
     def __get_tcp_socket(self) -> socket.socket:
         """"""
@@ -62,44 +86,25 @@ class Connection:
         self._logger.debug("Creating SSL tunnel for TCP traffic")
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(10)
-        sock = ssl.wrap_socket(
+        # Resume the session of the last connection with the same identity if we can, a full handshake otherwise
+        return get_ssl_context(self.credentials).wrap_socket(
             sock,
-            certfile=self.credentials.certificate_file,
-            keyfile=self.credentials.key_file,
-            ssl_version=ssl.PROTOCOL_TLS,
+            session=sessions.get(self.address, self.credentials),
         )
-        return sock
 
     def __get_udp_socket(self) -> socket.socket:
         """"""
-        # Create SSL tunnel
-        self._logger.debug("Creating SSL tunnel for UDP traffic")
+        # Voice packets are encrypted on their own, using the keys from CryptSetup
+        self._logger.debug("Creating UDP socket")
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.settimeout(10)
-        sock = ssl.wrap_socket(
-            sock,
-            certfile=self.credentials.certificate_file,
-            keyfile=self.credentials.key_file,
-            ssl_version=ssl.PROTOCOL_TLS,
-        )
         return sock
 
     def __authenticate(self) -> None:
         """"""
         self._logger.debug("Authenticating")
-        # Version information
-        whisper_version = __version__
-        protocol_version = (1, 2, 4)
-        application = "Whisper {}".format(whisper_version)
-        os_string = "TODO"
-        os_version_string = "TODO"
-
-        # Send version information
-        pack = VersionPacket.from_info(application, protocol_version, os_string, os_version_string).get_full()
-        self.send(*pack)
-        # Send user information
-        pack = AuthenticatePacket.from_info(self.credentials, self.tokens).get_full()
-        self.send(*pack)
+        for pack in get_authentication_packets(self.credentials, self.tokens):
+            self.send(*pack)
 
         # We still need to receive a message whether we are actually authenticated
         self.state = ConnectionState.AUTHENTICATING
@@ -115,8 +120,10 @@ class Connection:
         # Connect using the TCP SSL tunnel
         self.control_socket.connect((self.address.host, self.address.port))
         self.control_socket.setblocking(False)
+        self._logger.debug("TLS session resumed: %s", self.control_socket.session_reused)
         # Perform Mumble authentication
         self.__authenticate()
+        self.flush()
         # Connect using the UDP SSL tunnel
         if self.udp_active:
             self.media_socket.connect((self.address.host, self.address.port))
@@ -127,6 +134,8 @@ class Connection:
         self._logger.debug("Disconnecting")
         # TCP
         try:
+            # Only now we're sure to have the session tickets the server sent after the handshake
+            sessions.put(self.address, self.credentials, self.control_socket.session)
             self.control_socket.close()
         except socket.error:
             self._logger.debug("Failed to close TCP socket")
@@ -138,39 +147,64 @@ class Connection:
             self._logger.debug("Failed to close UDP socket")
         self.state = ConnectionState.NOT_CONNECTED
 
-    def send(self, message_type: PacketType, content) -> None:
-        """Send control message to the server."""
-        self._logger.debug("Sending message {}':'{}".format(message_type, str(content).replace('\n', ' ')))
-        # Construct content packet
-        pack = struct.pack("!HL", message_type.value, content.ByteSize()) + content.SerializeToString()
-
-        # Try sending the constructed packet
-        while len(pack) > 0:
-            sent = self.control_socket.send(pack)
-            if sent < 0:
-                self._logger.error("Server connection error")
-                raise socket.error("Server connection error")
-            pack = pack[sent:]
-
-    def __incoming_packets(self) -> [Packet]:
-        """"""
-        # Wait for incoming messages
-        rlist, _, _ = select.select([self.control_socket], [], [self.control_socket], self.rate)
-        # We are ready for reading
-        if self.control_socket in rlist:
-            self.__read_buffer()
-            self.receive_buffer, packets = self.converter.buffer_to_packets(self.receive_buffer)
-            return packets
-        return []
-
-    def __read_buffer(self) -> None:
-        """Grab messages from the buffer."""
+    def send(self, message_type: PacketType, content: Message) -> None:
+        """Queue a control message for the server, it's written on the next flush."""
+        self._logger.debug("Sending message %s", message_type)
+        self.send_raw(message_type, content.SerializeToString())
+
+    def send_raw(self, message_type: PacketType, payload: bytes) -> None:
+        """Queue an already serialized control message for the server."""
+        self.outbound.append(message_type, payload)
+        # Don't let a burst of messages pile up without bounds between flushes
+        if len(self.outbound) >= self.flush_size:
+            self.flush()
+
+    def flush(self) -> bool:
+        """Write queued messages without blocking, returns whether the socket kept up."""
+        if not self.outbound:
+            return True
+        if not self.is_alive():
+            return False
         try:
-            self.receive_buffer += self.control_socket.recv(self.read_buffer_size)
+            return self.outbound.write_to(self.control_socket)
         except socket.error:
-            self._logger.error("Could not read socket data")
+            self._logger.error("Server connection error")
+            self.close()
+            return False
+
+    def has_pending_output(self) -> bool:
+        """Whether we are waiting for the socket to become writable."""
+        return self.outbound.blocked
 
-    def __send_ping(self) -> None:
+    def is_paused(self) -> bool:
+        """Whether producers should hold off until the queued messages drained."""
+        return self.outbound.paused
+
+    def incoming_packets(self) -> [Packet]:
+        """Read everything the server sent us so far and convert it to packets."""
+        while self.__read_buffer():
+            pass
+        return self.converter.buffer_to_packets(self.receive_buffer)
+
+    def __read_buffer(self) -> bool:
+        """Grab messages from the buffer, returns whether there might be more data to read."""
+        try:
+            received = self.receive_buffer.recv_from(self.control_socket, self.read_buffer_size)
+        except (ssl.SSLWantReadError, BlockingIOError):
+            # Nothing left to read until the socket becomes readable again
+            return False
+        except socket.error as ex:
+            # The socket stays readable after an error, keeping it would make the main loop spin
+            self._logger.error("Could not read socket data: %s", ex)
+            self.close()
+            return False
+        if received == 0:
+            self._logger.warning("Server closed the connection")
+            self.close()
+            return False
+        return True
+
+    def send_ping(self) -> None:
         """Send keep-alive packet."""
         # Send a ping packet from time to time
         if not self.ping.is_needed():
@@ -186,12 +220,24 @@ class Connection:
             self._logger.warning("Disconnecting because of ping timeout")
             self.close()
 
-    def __incoming_ping(self) -> None:
+    def incoming_ping(self) -> None:
         """Handle incoming ping packets."""
         self._logger.debug("Responding to ping")
         # Remember when the last ping packet came in
         self.ping.received()
 
+    def crypt_setup(self, message: CryptSetup) -> None:
+        """Keys for encrypting voice packets."""
+        self.media.setup(message)
+
+    def send_voice(self, voice_packet: bytes) -> None:
+        """Send a voice packet, over UDP when it works and through this connection when it doesn't."""
+        self.media.send(voice_packet)
+
+    def incoming_media_packets(self) -> [Packet]:
+        """Voice packets the server sent us over UDP."""
+        return self.media.incoming_packets()
+
     def set_bandwidth_limit(self, bandwidth: int) -> None:
         """Set maximum allowed outgoing bandwidth the server will accept."""
         self.bandwidth_limit = bandwidth
@@ -210,9 +256,9 @@ class Connection:
             self.bandwidth = bandwidth
         self._logger.debug("Maximum outgoing bandwidth set to {} bits per second".format(self.bandwidth))
 
-    # def is_alive(self):
-    #     """"""
-    #     return self.state in (ConnectionState.CONNECTED, ConnectionState.AUTHENTICATING)
+    def is_alive(self) -> bool:
+        """"""
+        return self.state in (ConnectionState.CONNECTED, ConnectionState.AUTHENTICATING)
 
     def is_connected(self) -> bool:
         """"""
@@ -233,6 +279,7 @@ class Connection:
         self.control_socket = self.__get_tcp_socket()
         if self.udp_active:
             self.media_socket = self.__get_udp_socket()
+            self.media.socket = self.media_socket
         self.open()
         return self
 
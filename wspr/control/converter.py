@@ -1,15 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import struct
-from typing import Optional, Tuple, List
+from typing import Optional, List
 
+from wspr.control.framing import FrameBuffer
 from wspr.protocol.packets import (
     Packet,
     SuggestConfigPacket,
     ServerConfigPacket,
     RequestBlobPacket,
     UserListPacket,
+    UserStatsPacket,
     CodecVersionPacket,
     PermissionQueryPacket,
     VoiceTargetPacket,
@@ -73,35 +74,31 @@ class PacketConverter:
     def convert(self, packet_type, payload) -> Optional[Packet]:
         """"""
         try:
-            dispatch = self._router.get(packet_type)
+            dispatch = self._router[packet_type]
             return dispatch(payload)
         except KeyError:
             text = "UNHANDLED MESSAGE TYPE: {}, args: {}"
             self._logger.warning(text.format(packet_type, payload))
         return None
 
-    def buffer_to_packets(self, buffer) -> Tuple[bytes, List[Packet]]:
-        """Extract packets from buffer."""
-        # Header is present (type + length)
+    def buffer_to_packets(self, buffer: FrameBuffer) -> List[Packet]:
+        """Extract all complete packets from buffer, incomplete data stays buffered until more is read."""
         packets = []
-        while len(buffer) >= 6:
-            header = buffer[0:6]
-            # Shouldn't happen, need to read more data
-            if len(header) < 6:
-                break
-            # Decode header
-            packet_type_int, size = struct.unpack("!HL", header)
-            packet_type = PacketType(packet_type_int)
-            # We don't have enough data yet, we'll read more later
-            if len(buffer) < size + 6:
-                break
-            # Get message without header
-            message = buffer[6:size + 6]
-            # Remove what we've processed from the buffer
-            buffer = buffer[size + 6:]
-            # Do something with the message
+        frame = buffer.next_frame()
+        while frame is not None:
+            packet_type_int, view = frame
+            # Packets outlive the buffer, so the payload is copied exactly once
+            with view:
+                message = bytes(view)
+            frame = buffer.next_frame()
+            try:
+                packet_type = PacketType(packet_type_int)
+            except ValueError:
+                # Newer servers may send types this client doesn't know about, the frame is skipped as a whole
+                self._logger.warning("UNKNOWN MESSAGE TYPE: {}, length: {}".format(packet_type_int, len(message)))
+                continue
             packets.append(self.convert(packet_type, message))
-        return buffer, packets
+        return packets
 
     def udp_tunnel(self, payload):
         """"""
@@ -193,7 +190,7 @@ class PacketConverter:
 
     def user_stats(self, payload):
         """"""
-        return UserListPacket(payload)
+        return UserStatsPacket(payload)
 
     def request_blob(self, payload):
         """"""
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from wspr.protocol.mumble_pb2 import Version, Authenticate, TextMessage
+from typing import Dict, Iterator, List
+
+from wspr.protocol.mumble_pb2 import Version, TextMessage
 
 
 class Event:
@@ -10,6 +12,10 @@ class Event:
         """Contains payload which triggered response."""
         self.payload = payload
 
+    def get_payload(self):
+        """Decoded payload, shared with the packet handlers so it is only parsed once."""
+        return self.payload.message
+
 
 class VersionReceivedEvent(Event):
     """"""
@@ -26,9 +32,7 @@ class VersionReceivedEvent(Event):
         # release
         # os
         # os_version
-        version = Version()
-        version.ParseFromString(self.payload)
-        return version
+        return self.payload.message
 
     def __repr__(self) -> str:
         """"""
@@ -43,10 +47,26 @@ class UDPTunnelReceivedEvent(Event):
         """"""
         super().__init__(payload)
 
-    def get_payload(self):
+    def get_payload(self) -> bytes:
+        """Raw voice packet."""
+        return self.payload.message
+
+
+class VoiceReceivedEvent(Event):
+    """Decoded audio of a speaker, see VoiceReceiver."""
+
+    def __init__(self, session: int, sequence: int, pcm: bytes, concealed: bool = False):
+        """PCM is 16 bit native endian mono at 48 kHz, concealed when it stands in for a lost packet."""
+        self.session = session
+        self.sequence = sequence
+        self.pcm = pcm
+        self.concealed = concealed
+        super().__init__(None)
+
+    def __repr__(self):
         """"""
-        pass
-        # self.payload = mumble_pb2.UDPTunnel().ParseFromString(payload)
+        concealed = " (concealed)" if self.concealed else ""
+        return "Voice of {} #{}: {} bytes{}".format(self.session, self.sequence, len(self.pcm), concealed)
 
 
 class AuthenticateReceivedEvent(Event):
@@ -56,11 +76,6 @@ class AuthenticateReceivedEvent(Event):
         """"""
         super().__init__(payload)
 
-    def get_payload(self):
-        """"""
-        auth = Authenticate()
-        auth.ParseFromString(self.payload)
-
 
 class PingReceivedEvent(Event):
     """"""
@@ -133,16 +148,14 @@ class TextMessageReceivedEvent(Event):
         """"""
         super().__init__(payload)
 
-    def get_payload(self):
+    def get_payload(self) -> TextMessage:
         """"""
         # actor
         # session
         # channel_id
         # tree_id
         # message
-        message = TextMessage()
-        message.ParseFromString(self.payload)
-        return message
+        return self.payload.message
 
     def __repr__(self):
         """"""
@@ -274,3 +287,46 @@ class FullTreeEvent(Event):
     def __repr__(self):
         """"""
         return "{} - {}".format(self.channels, self.users)
+
+
+class TreeDeltaEvent(Event):
+    """Channels and users that changed since a sequence number, or all of them when full is set."""
+
+    def __init__(self, sequence: int, channels: Dict, users: Dict, removed_channels: List[int],
+                 removed_users: List[int], full: bool = False):
+        """Ask for the next delta using sequence."""
+        self.sequence = sequence
+        self.channels = channels
+        self.users = users
+        self.removed_channels = removed_channels
+        self.removed_users = removed_users
+        self.full = full
+        super().__init__(None)
+
+    def __repr__(self):
+        """"""
+        text = "{} #{}: {} channels, {} users, {} channels removed, {} users removed"
+        kind = "Snapshot" if self.full else "Delta"
+        return text.format(kind, self.sequence, len(self.channels), len(self.users), len(self.removed_channels),
+                           len(self.removed_users))
+
+
+class EventBatch(Event):
+    """Several events sent to the consumer at once, they only need a single pickle and queue transfer."""
+
+    def __init__(self, events: List[Event]):
+        """"""
+        self.events = events
+        super().__init__(None)
+
+    def __iter__(self) -> Iterator[Event]:
+        """"""
+        return iter(self.events)
+
+    def __len__(self) -> int:
+        """"""
+        return len(self.events)
+
+    def __repr__(self):
+        """"""
+        return "Batch of {} events".format(len(self.events))
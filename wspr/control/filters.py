@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Type, Union
+
+from wspr.control.events import Event
+from wspr.protocol.packet_type import PacketType
+
+
+class Subscription:
+    """Interest in one kind of event, optionally only when fields of the message have specific values."""
+
+    def __init__(self, kind: Union[PacketType, Type[Event]], predicate: Optional[Callable] = None, **fields):
+        """
+        Kind is either the type of packet or the type of event.
+        Fields are compared to the decoded message, repeated fields match when they contain the value.
+        The predicate gets the decoded message, it has to be picklable when sent to a Mumble process.
+        """
+        self.kind: Union[PacketType, Type[Event]] = kind
+        self.predicate: Optional[Callable] = predicate
+        self.fields: Dict = fields
+
+    def matches(self, packet) -> bool:
+        """Does the packet, which is already known to be of the right kind, interest the consumer?"""
+        # Only decode the payload if we really have to
+        if not self.fields and self.predicate is None:
+            return True
+        message = packet.payload.message
+        for name, expected in self.fields.items():
+            value = getattr(message, name, None)
+            if isinstance(value, (str, bytes)) or not hasattr(value, '__contains__'):
+                if value != expected:
+                    return False
+            elif expected not in value:
+                return False
+        return self.predicate is None or self.predicate(message)
+
+    def __repr__(self) -> str:
+        """"""
+        kind = self.kind.name if isinstance(self.kind, PacketType) else self.kind.__name__
+        return "Subscription({}, {})".format(kind, self.fields)
+
+
+class EventFilter:
+    """Decides which packets end up as events for the consumer. Without subscriptions every packet does."""
+
+    def __init__(self, subscriptions: Iterable[Subscription] = ()):
+        """"""
+        self._by_packet_type: Dict[PacketType, List[Subscription]] = defaultdict(list)
+        self._by_event_type: Dict[Type[Event], List[Subscription]] = defaultdict(list)
+        for subscription in subscriptions:
+            self.subscribe(subscription)
+
+    def subscribe(self, subscription: Subscription) -> None:
+        """"""
+        if isinstance(subscription.kind, PacketType):
+            self._by_packet_type[subscription.kind].append(subscription)
+        else:
+            self._by_event_type[subscription.kind].append(subscription)
+
+    def unsubscribe(self, kind: Union[PacketType, Type[Event]]) -> None:
+        """Remove all subscriptions for a kind of packet or event."""
+        self._by_packet_type.pop(kind, None)
+        self._by_event_type.pop(kind, None)
+
+    def clear(self) -> None:
+        """Go back to accepting everything."""
+        self._by_packet_type.clear()
+        self._by_event_type.clear()
+
+    def is_empty(self) -> bool:
+        """"""
+        return not self._by_packet_type and not self._by_event_type
+
+    def accepts(self, packet) -> bool:
+        """"""
+        if self.is_empty():
+            return True
+        for subscription in self._by_packet_type.get(packet.packet_type, ()):
+            if subscription.matches(packet):
+                return True
+        for subscription in self._by_event_type.get(packet.event_type, ()):
+            if subscription.matches(packet):
+                return True
+        return False
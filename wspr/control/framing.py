@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import struct
+from typing import Optional, Tuple
+
+
+class FrameBuffer:
+    """Growable receive buffer that splits the TCP control stream into Mumble frames without re-copying it."""
+
+    # Every control frame starts with the packet type (2 bytes) followed by the payload length (4 bytes)
+    HEADER = struct.Struct("!HL")
+
+    def __init__(self, capacity: int = 64 * 1024):
+        """"""
+        self._buffer: bytearray = bytearray(capacity)
+        # Start of the data we haven't consumed yet
+        self._read: int = 0
+        # End of the data we've received so far
+        self._write: int = 0
+
+    def __len__(self) -> int:
+        """Amount of bytes received but not consumed yet."""
+        return self._write - self._read
+
+    @property
+    def capacity(self) -> int:
+        """"""
+        return len(self._buffer)
+
+    def __reserve(self, size: int) -> None:
+        """Make sure at least size bytes can be written after the current data."""
+        if self.capacity - self._write >= size:
+            return
+        pending = self._write - self._read
+        # Move the (usually tiny) unfinished frame to the front instead of keeping everything we already handed out
+        if self._read:
+            self._buffer[:pending] = self._buffer[self._read:self._write]
+            self._read = 0
+            self._write = pending
+        # Still not enough room, grow the buffer
+        if self.capacity - self._write < size:
+            self._buffer.extend(bytes(max(size - (self.capacity - self._write), self.capacity)))
+
+    def feed(self, data: bytes) -> None:
+        """Append received data to the buffer."""
+        size = len(data)
+        self.__reserve(size)
+        self._buffer[self._write:self._write + size] = data
+        self._write += size
+
+    def recv_from(self, sock: socket.socket, size: int) -> int:
+        """Receive at most size bytes from the socket straight into the buffer."""
+        self.__reserve(size)
+        with memoryview(self._buffer) as view:
+            received = sock.recv_into(view[self._write:self._write + size], size)
+        self._write += received
+        return received
+
+    def next_frame(self) -> Optional[Tuple[int, memoryview]]:
+        """
+        Take the next complete frame out of the buffer.
+        The payload is a view into the buffer, it is only valid until the next call to feed or recv_from.
+        """
+        if self._write - self._read < self.HEADER.size:
+            return None
+        # Decode header
+        packet_type, size = self.HEADER.unpack_from(self._buffer, self._read)
+        start = self._read + self.HEADER.size
+        # We don't have enough data yet, we'll read more later
+        if self._write - start < size:
+            return None
+        self._read = start + size
+        # Everything has been consumed, we can start writing at the front again without moving anything
+        if self._read == self._write:
+            self._read = self._write = 0
+        return packet_type, memoryview(self._buffer)[start:start + size]
+
+    def clear(self) -> None:
+        """Drop all buffered data."""
+        self._read = self._write = 0
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import enum
+import socket
+import ssl
+import struct
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from wspr.protocol.packet_type import PacketType
+
+
+class OutboundBuffer:
+    """
+    Control messages waiting to be written to the socket, framed back to back in a single reusable bytearray.
+    Many messages go out in one write, partial writes are tracked by offset instead of copying what's left.
+    """
+
+    HEADER = struct.Struct("!HL")
+    # Largest amount of data in a single TLS record
+    MAX_WRITE = 16 * 1024
+
+    def __init__(self):
+        """"""
+        self._buffer: bytearray = bytearray()
+        # Everything before this offset has been written
+        self._offset: int = 0
+        # A TLS write that couldn't complete has to be retried with the same amount of data
+        self._retry: int = 0
+
+    def __len__(self) -> int:
+        """Bytes waiting to be written."""
+        return len(self._buffer) - self._offset
+
+    def append(self, message_type: PacketType, payload: bytes) -> None:
+        """Frame a serialized message and queue it."""
+        end = len(self._buffer)
+        self._buffer.extend(bytes(self.HEADER.size))
+        self.HEADER.pack_into(self._buffer, end, message_type.value, len(payload))
+        self._buffer += payload
+
+    def write_to(self, sock: socket.socket) -> bool:
+        """Write as much as the socket accepts without blocking, returns whether everything was written."""
+        with memoryview(self._buffer) as view:
+            while self._offset < len(self._buffer):
+                size = self._retry or min(len(self._buffer) - self._offset, self.MAX_WRITE)
+                try:
+                    sent = sock.send(view[self._offset:self._offset + size])
+                except (ssl.SSLWantWriteError, ssl.SSLWantReadError):
+                    self._retry = size
+                    break
+                except BlockingIOError:
+                    break
+                self._retry = 0
+                self._offset += sent
+        return self.__compact()
+
+    def __compact(self) -> bool:
+        """Drop written data, returns whether nothing is waiting anymore."""
+        if self._offset == len(self._buffer):
+            self.clear()
+            return True
+        # Only move the rest to the front once the written part dominates
+        if self._offset > len(self._buffer) // 2:
+            del self._buffer[:self._offset]
+            self._offset = 0
+        return False
+
+    def clear(self) -> None:
+        """"""
+        del self._buffer[:]
+        self._offset = 0
+        self._retry = 0
+
+
+class Priority(enum.IntEnum):
+    """Order in which queued messages are written, lowest first."""
+    CONTROL = 0
+    NORMAL = 1
+    BULK = 2
+
+
+# Keep alive, authentication and crypt messages jump the queue, messages producers might spam are shaped
+PRIORITIES: Dict[PacketType, Priority] = {
+    PacketType.VERSION: Priority.CONTROL,
+    PacketType.AUTHENTICATE: Priority.CONTROL,
+    PacketType.PING: Priority.CONTROL,
+    PacketType.CRYPTSETUP: Priority.CONTROL,
+    PacketType.TEXTMESSAGE: Priority.BULK,
+    PacketType.USERSTATE: Priority.BULK,
+}
+
+
+class OutboundQueue:
+    """
+    Control messages waiting to be written, by priority.
+    Messages only move to the write buffer when it's almost empty, so a ping never waits behind more than a record.
+    Bulk messages are shaped to the server's default flood limits, and producers are paused above the high watermark
+    until the queue drains below the low watermark.
+    """
+
+    def __init__(self, bulk_rate: Optional[float] = 1.0, bulk_burst: int = 5, high_watermark: int = 256 * 1024,
+                 low_watermark: int = 64 * 1024, priorities: Optional[Dict[PacketType, Priority]] = None):
+        """Bulk rate is in messages per second, without it bulk messages aren't shaped. Watermarks are in bytes."""
+        self._buffer: OutboundBuffer = OutboundBuffer()
+        self._queues: Dict[Priority, deque] = {priority: deque() for priority in Priority}
+        # Bytes in the queues, not counting the write buffer
+        self._queued: int = 0
+        self._priorities: Dict[PacketType, Priority] = priorities if priorities is not None else PRIORITIES
+        self.bulk_rate: Optional[float] = bulk_rate
+        self.bulk_burst: int = bulk_burst
+        self._bulk_tokens: float = bulk_burst
+        self._refilled: float = time.monotonic()
+        self.high_watermark: int = high_watermark
+        self.low_watermark: int = low_watermark
+        # Producers should hold off
+        self.paused: bool = False
+        # The socket didn't accept everything we had for it
+        self.blocked: bool = False
+
+    def __len__(self) -> int:
+        """Bytes waiting to be written."""
+        return self._queued + len(self._buffer)
+
+    def append(self, message_type: PacketType, payload: bytes) -> None:
+        """Queue a serialized message."""
+        self._queues[self._priorities.get(message_type, Priority.NORMAL)].append((message_type, payload))
+        self._queued += OutboundBuffer.HEADER.size + len(payload)
+        if len(self) >= self.high_watermark:
+            self.paused = True
+
+    def __refill(self) -> None:
+        """"""
+        now = time.monotonic()
+        self._bulk_tokens = min(self._bulk_tokens + (now - self._refilled) * self.bulk_rate, self.bulk_burst)
+        self._refilled = now
+
+    def __next(self) -> Optional[deque]:
+        """Queue of the message which may be written next, if any."""
+        for priority, queue in self._queues.items():
+            if not queue:
+                continue
+            if priority == Priority.BULK and self.bulk_rate is not None:
+                self.__refill()
+                if self._bulk_tokens < 1:
+                    return None
+                self._bulk_tokens -= 1
+            return queue
+        return None
+
+    def __stage(self) -> None:
+        """Move messages to the write buffer, most important first, until there is about a record to write."""
+        while len(self._buffer) < OutboundBuffer.MAX_WRITE:
+            queue = self.__next()
+            if queue is None:
+                return
+            message_type, payload = queue.popleft()
+            self._queued -= OutboundBuffer.HEADER.size + len(payload)
+            self._buffer.append(message_type, payload)
+
+    def write_to(self, sock: socket.socket) -> bool:
+        """Write as much as the socket and the bulk rate allow without blocking, returns whether the socket kept up."""
+        self.__stage()
+        while self._buffer:
+            if not self._buffer.write_to(sock):
+                break
+            self.__stage()
+        self.blocked = len(self._buffer) > 0
+        if self.paused and len(self) <= self.low_watermark:
+            self.paused = False
+        return not self.blocked
+
+    def time_until_ready(self) -> Optional[float]:
+        """Seconds before shaped bulk messages may be written, None when none are held back."""
+        # Once the socket is writable again we're woken up anyway
+        if self.bulk_rate is None or self.blocked or not self._queues[Priority.BULK]:
+            return None
+        self.__refill()
+        return max((1 - self._bulk_tokens) / self.bulk_rate, 0.0)
+
+    def clear(self) -> None:
+        """"""
+        self._buffer.clear()
+        for queue in self._queues.values():
+            queue.clear()
+        self._queued = 0
+        self.paused = False
+        self.blocked = False
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+from collections import deque
+from typing import Deque, Iterator, List, Optional
+
+from wspr.control.events import Event, EventBatch
+
+
+class EventReceiver:
+    """Consumer side of the events queue, works the same whether events arrive one by one or in batches."""
+
+    def __init__(self, events: multiprocessing.Queue):
+        """"""
+        self._events: multiprocessing.Queue = events
+        # Events of a batch which weren't handed out yet by get
+        self._pending: Deque[Event] = deque()
+
+    def get_batch(self, block: bool = True, timeout: Optional[float] = None) -> List[Event]:
+        """
+        All events of the next item on the queue, raises queue.Empty like the queue itself.
+        Events left over from calls to get come first.
+        """
+        if self._pending:
+            events = list(self._pending)
+            self._pending.clear()
+            return events
+        item = self._events.get(block, timeout)
+        if isinstance(item, EventBatch):
+            return item.events
+        return [item]
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Event:
+        """Next single event, raises queue.Empty like the queue itself."""
+        if not self._pending:
+            self._pending.extend(self.get_batch(block, timeout))
+        return self._pending.popleft()
+
+    def __iter__(self) -> Iterator[Event]:
+        """Block for events forever."""
+        while True:
+            yield self.get()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import random
+from typing import Optional
+
+
+class ReconnectPolicy:
+    """
+    How long to wait before connecting again: exponential backoff with jitter, so clients which lost their
+    connection at the same time don't all come back at the same time.
+    """
+
+    def __init__(self, initial_delay: float = 1.0, max_delay: float = 60.0, multiplier: float = 2.0,
+                 jitter: float = 0.5, max_attempts: Optional[int] = None, rng: Optional[random.Random] = None):
+        """
+        Jitter is the fraction of the delay which is random, from 0 (none) to 1 (anywhere between 0 and the delay).
+        Without max attempts we keep trying forever.
+        """
+        self.initial_delay: float = initial_delay
+        self.max_delay: float = max_delay
+        self.multiplier: float = multiplier
+        self.jitter: float = jitter
+        self.max_attempts: Optional[int] = max_attempts
+        self._random: random.Random = rng or random.Random()
+        # Attempts since the last successful connection
+        self.attempts: int = 0
+
+    def next_delay(self) -> Optional[float]:
+        """Seconds to wait before the next attempt, None when we should give up."""
+        if self.max_attempts is not None and self.attempts >= self.max_attempts:
+            return None
+        delay = min(self.initial_delay * self.multiplier ** self.attempts, self.max_delay)
+        self.attempts += 1
+        return delay * (1 - self.jitter * self._random.random())
+
+    def reset(self) -> None:
+        """We are connected again."""
+        self.attempts = 0
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import struct
+import time
+from typing import Optional, Tuple, Union
+
+from google.protobuf.message import Message
+
+from wspr.protocol.packet_type import PacketType
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+
+class SharedRingBuffer:
+    """
+    Single producer, single consumer ring of frames in shared memory.
+    Frames use the same header as the control stream (type + length), followed by the payload.
+    """
+
+    # Read position (only written by the consumer) and write position (only written by the producer)
+    POSITIONS = struct.Struct("QQ")
+    FRAME_HEADER = struct.Struct("!HL")
+
+    def __init__(self, capacity: int = 4 * 1024 * 1024, name: Optional[str] = None):
+        """Create a new ring, or attach to an existing one when a name is given."""
+        if shared_memory is None:
+            raise RuntimeError("Shared memory rings require Python 3.8 or newer")
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=self.POSITIONS.size + capacity)
+            self.POSITIONS.pack_into(self._memory.buf, 0, 0, 0)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+        self.capacity: int = capacity
+        self._data: memoryview = self._memory.buf[self.POSITIONS.size:self.POSITIONS.size + capacity]
+
+    @property
+    def name(self) -> str:
+        """"""
+        return self._memory.name
+
+    def __positions(self) -> Tuple[int, int]:
+        """"""
+        return self.POSITIONS.unpack_from(self._memory.buf, 0)
+
+    def __copy_in(self, position: int, data: bytes) -> None:
+        """Write data at the (ever increasing) position, wrapping around the end of the ring."""
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        with memoryview(data) as view:
+            self._data[start:start + first] = view[:first]
+            if first < len(data):
+                self._data[:len(data) - first] = view[first:]
+
+    def __copy_out(self, position: int, size: int) -> bytes:
+        """Read size bytes from the (ever increasing) position, wrapping around the end of the ring."""
+        start = position % self.capacity
+        first = min(size, self.capacity - start)
+        if first == size:
+            return bytes(self._data[start:start + size])
+        return bytes(self._data[start:]) + bytes(self._data[:size - first])
+
+    def put(self, packet_type: int, payload: bytes) -> Tuple[bool, bool]:
+        """
+        Append a frame, returns whether it fitted and whether the ring was empty before.
+        Only the producer may call this.
+        """
+        head, tail = self.__positions()
+        size = self.FRAME_HEADER.size + len(payload)
+        if size > self.capacity - (tail - head):
+            return False, head == tail
+        self.__copy_in(tail, self.FRAME_HEADER.pack(packet_type, len(payload)))
+        self.__copy_in(tail + self.FRAME_HEADER.size, payload)
+        # Publish the frame only after its data is in place
+        struct.pack_into("Q", self._memory.buf, 8, tail + size)
+        # The consumer might have emptied the ring while we were writing, read its position again
+        head, _ = self.__positions()
+        return True, head == tail
+
+    def get(self) -> Optional[Tuple[int, bytes]]:
+        """Take the oldest frame out of the ring, only the consumer may call this."""
+        head, tail = self.__positions()
+        if head == tail:
+            return None
+        packet_type, size = self.FRAME_HEADER.unpack(self.__copy_out(head, self.FRAME_HEADER.size))
+        payload = self.__copy_out(head + self.FRAME_HEADER.size, size)
+        struct.pack_into("Q", self._memory.buf, 0, head + self.FRAME_HEADER.size + size)
+        return packet_type, payload
+
+    def __len__(self) -> int:
+        """Bytes in use."""
+        head, tail = self.__positions()
+        return tail - head
+
+    def close(self) -> None:
+        """Detach from the shared memory, in every process using it."""
+        self._data.release()
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Free the shared memory, once."""
+        self._memory.unlink()
+
+    def __reduce__(self):
+        """Attach to the same shared memory when sent to another process."""
+        return self.__class__, (self.capacity, self.name)
+
+
+class RingTransport:
+    """
+    Events and tasks between a Mumble process and its consumer as raw frames in shared memory, without pickling.
+    Each direction has a ring and a pipe used as doorbell, which only rings when the ring was empty.
+    """
+
+    def __init__(self, capacity: int = 4 * 1024 * 1024):
+        """"""
+        self.events: SharedRingBuffer = SharedRingBuffer(capacity)
+        self.tasks: SharedRingBuffer = SharedRingBuffer(capacity)
+        self._events_bell = multiprocessing.Pipe(duplex=False)
+        self._tasks_bell = multiprocessing.Pipe(duplex=False)
+        # Frames that didn't fit because the other side isn't keeping up
+        self.dropped: int = 0
+
+    @staticmethod
+    def __put(ring: SharedRingBuffer, bell, packet_type: PacketType, payload: bytes) -> bool:
+        """"""
+        fitted, was_empty = ring.put(packet_type.value, payload)
+        if fitted and was_empty:
+            bell[1].send_bytes(b"")
+        return fitted
+
+    @staticmethod
+    def __get(ring: SharedRingBuffer, bell) -> Optional[Tuple[PacketType, bytes]]:
+        """"""
+        frame = ring.get()
+        if frame is None:
+            # Silence the doorbell and look again, any frame put after this rings it again
+            while bell[0].poll():
+                bell[0].recv_bytes()
+            frame = ring.get()
+            if frame is None:
+                return None
+        return PacketType(frame[0]), frame[1]
+
+    # Mumble process side
+
+    def put_event(self, packet_type: PacketType, payload: bytes) -> bool:
+        """Hand a raw packet to the consumer, returns False when the ring is full and the packet was dropped."""
+        if self.__put(self.events, self._events_bell, packet_type, payload):
+            return True
+        self.dropped += 1
+        return False
+
+    def get_task(self) -> Optional[Tuple[PacketType, bytes]]:
+        """Next raw message to send to the server, None when there is none."""
+        return self.__get(self.tasks, self._tasks_bell)
+
+    def tasks_fileno(self) -> int:
+        """Becomes readable when tasks arrive."""
+        return self._tasks_bell[0].fileno()
+
+    # Consumer side
+
+    def send(self, packet_type: PacketType, message: Union[Message, bytes], timeout: Optional[float] = None) -> bool:
+        """Have the Mumble process send a message to the server, waits while the ring is full."""
+        payload = message if isinstance(message, bytes) else message.SerializeToString()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.__put(self.tasks, self._tasks_bell, packet_type, payload):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def get_event(self, timeout: Optional[float] = None) -> Optional[Tuple[PacketType, bytes]]:
+        """Next raw packet from the server, waits at most timeout seconds (forever when None)."""
+        frame = self.__get(self.events, self._events_bell)
+        if frame is None and self._events_bell[0].poll(timeout):
+            frame = self.__get(self.events, self._events_bell)
+        return frame
+
+    def events_fileno(self) -> int:
+        """Becomes readable when events arrive."""
+        return self._events_bell[0].fileno()
+
+    def close(self) -> None:
+        """"""
+        self.events.close()
+        self.tasks.close()
+
+    def unlink(self) -> None:
+        """Free the shared memory, call once when both sides are done."""
+        self.events.unlink()
+        self.tasks.unlink()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Type
+
+from wspr.control.events import Event, EventBatch
+from wspr.control.filters import EventFilter
+from wspr.control.ring import RingTransport
+from wspr.protocol.packet_type import PacketType
+from wspr.protocol.packets import Packet
+
+
+class EventSink:
+    """Where packet handlers put their events, packets the consumer isn't interested in never become events."""
+
+    def __init__(self, put: Callable[[Event], None], event_filter: Optional[EventFilter] = None,
+                 max_batch_size: int = 1, max_delay: float = 0.0):
+        """
+        Put is called for every accepted event, e.g. the put method of a multiprocessing queue.
+        With a max batch size above one, events are collected and put as a single EventBatch once the batch is
+        full, or at the end of a pass over incoming packets when the oldest event waited at least max delay seconds.
+        """
+        self._logger: logging.Logger = logging.getLogger('whisper')
+        self._put: Callable[[Event], None] = put
+        self.filter: EventFilter = event_filter or EventFilter()
+        self.max_batch_size: int = max_batch_size
+        self.max_delay: float = max_delay
+        self._batch: List[Event] = []
+        # When the first event of the current batch came in (monotonic clock)
+        self._batch_started: float = 0.0
+
+    def accepts(self, packet) -> bool:
+        """Checked by the packet before building its event."""
+        return self.filter.accepts(packet)
+
+    def put(self, event: Event) -> None:
+        """"""
+        if self.max_batch_size <= 1:
+            self._put(event)
+            return
+        if not self._batch:
+            self._batch_started = time.monotonic()
+        self._batch.append(event)
+        if len(self._batch) >= self.max_batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Send whatever is batched right now."""
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._put(EventBatch(batch))
+
+    def poll(self) -> None:
+        """Called after every pass over incoming packets and tasks, sends the batch if it waited long enough."""
+        if self._batch and time.monotonic() - self._batch_started >= self.max_delay:
+            self.flush()
+
+    def time_until_flush(self) -> Optional[float]:
+        """Seconds before the current batch has to be sent, None when nothing is waiting."""
+        if not self._batch:
+            return None
+        return max(self._batch_started + self.max_delay - time.monotonic(), 0.0)
+
+
+# Events caused by a packet, and the type of that packet
+EVENT_PACKET_TYPES: Dict[Type[Event], PacketType] = {
+    packet.event_type: packet.packet_type for packet in Packet.__subclasses__()
+}
+
+
+class RingSink(EventSink):
+    """Sends accepted packets as raw frames through a shared memory ring, instead of pickling events."""
+
+    def __init__(self, ring: RingTransport, put: Callable[[Event], None], event_filter: Optional[EventFilter] = None):
+        """Put is still used for events which aren't caused by a packet, like FullTreeEvent."""
+        super().__init__(put, event_filter)
+        self._ring: RingTransport = ring
+
+    def put(self, event: Event) -> None:
+        """"""
+        packet_type = EVENT_PACKET_TYPES.get(type(event))
+        if packet_type is None:
+            super().put(event)
+        elif not self._ring.put_event(packet_type, event.payload.raw):
+            self._logger.warning("Event ring is full, dropped %s", packet_type)
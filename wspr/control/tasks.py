@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+from typing import List, Type, Union
+
+from wspr.control.events import Event
+from wspr.control.filters import Subscription
 from wspr.protocol.mumble_pb2 import TextMessage
 from wspr.protocol.packet_type import PacketType
 
@@ -36,6 +40,15 @@ class FullTreeTask(Task):
         super().__init__()
 
 
+class TreeDeltaTask(Task):
+    """Ask for the channels and users which changed since the sequence number of an earlier TreeDeltaEvent."""
+
+    def __init__(self, since: int = 0):
+        """"""
+        self.since = since
+        super().__init__()
+
+
 class ConnectTask(Task):
     """"""
 
@@ -96,3 +109,31 @@ class MoveTask(Task):
         p.session.append(0)
         p.channel_id.append(0)
         return PacketType.USERSTATE, p
+
+
+class SubscribeTask(Task):
+    """Only receive events for the given subscriptions (and any earlier ones)."""
+
+    def __init__(self, subscriptions: List[Subscription]):
+        """"""
+        self.subscriptions = subscriptions
+        super().__init__()
+
+
+class UnsubscribeTask(Task):
+    """Stop receiving events of the given kinds, or go back to receiving everything when no kinds are given."""
+
+    def __init__(self, kinds: List[Union[PacketType, Type[Event]]] = ()):
+        """"""
+        self.kinds = kinds
+        super().__init__()
+
+
+class VoiceTask(Task):
+    """Say something: 16 bit mono PCM at 48 kHz, see VoiceTransmitter.add."""
+
+    def __init__(self, pcm, end: bool = False):
+        """End marks the last PCM of what is said, so the listeners don't wait for more."""
+        self.pcm = pcm
+        self.end = end
+        super().__init__()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import ssl
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from wspr.containers.address import Address
+from wspr.containers.credentials import Credentials
+
+
+def create_ssl_context(credentials: Credentials) -> ssl.SSLContext:
+    """Client side TLS settings for the control connection."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    # Murmur servers usually run with self-signed certificates
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    # Registered users identify themselves using their certificate
+    if credentials.certificate_file:
+        context.load_cert_chain(credentials.certificate_file, credentials.key_file)
+    return context
+
+
+def credentials_key(credentials: Credentials) -> Tuple[Optional[str], Optional[str]]:
+    """Everything about the credentials which matters for TLS."""
+    certificate_file = str(credentials.certificate_file) if credentials.certificate_file else None
+    key_file = str(credentials.key_file) if credentials.key_file else None
+    return certificate_file, key_file
+
+
+_contexts: Dict[Tuple[Optional[str], Optional[str]], ssl.SSLContext] = {}
+_contexts_lock = threading.Lock()
+
+
+def get_ssl_context(credentials: Credentials) -> ssl.SSLContext:
+    """
+    Shared TLS settings for the credentials, certificates are only loaded from disk once.
+    All anonymous clients share a single context.
+    """
+    key = credentials_key(credentials)
+    with _contexts_lock:
+        context = _contexts.get(key)
+        if context is None:
+            context = _contexts[key] = create_ssl_context(credentials)
+        return context
+
+
+def clear_ssl_contexts() -> None:
+    """Forget shared contexts, e.g. after certificates changed on disk."""
+    with _contexts_lock:
+        _contexts.clear()
+
+
+class SessionCache:
+    """TLS sessions by server and identity, so reconnecting resumes a session instead of a full handshake."""
+
+    def __init__(self, max_size: int = 4096):
+        """"""
+        self._sessions: OrderedDict = OrderedDict()
+        self._max_size: int = max_size
+        self._lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def key(address: Address, credentials: Credentials) -> Hashable:
+        """A session is tied to the certificate it was made with, never resume one as somebody else."""
+        return (address.host, address.port) + credentials_key(credentials)
+
+    def get(self, address: Address, credentials: Credentials) -> Optional[ssl.SSLSession]:
+        """"""
+        with self._lock:
+            return self._sessions.get(self.key(address, credentials))
+
+    def put(self, address: Address, credentials: Credentials, session: Optional[ssl.SSLSession]) -> None:
+        """Remember the session, the least recently stored ones are forgotten first."""
+        if session is None:
+            return
+        key = self.key(address, credentials)
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self._max_size:
+                self._sessions.popitem(last=False)
+
+    def discard(self, address: Address, credentials: Credentials) -> None:
+        """"""
+        with self._lock:
+            self._sessions.pop(self.key(address, credentials), None)
+
+    def __len__(self) -> int:
+        """"""
+        return len(self._sessions)
+
+
+# Shared by all connections in the process
+sessions = SessionCache()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from typing import Dict, Hashable, Optional, Tuple, Iterator
+
+from wspr.async_client import AsyncMumble
+from wspr.blob import Blob
+from wspr.containers.address import Address
+from wspr.containers.credentials import Credentials
+from wspr.control.events import Event, FullTreeEvent
+from wspr.control.filters import EventFilter
+from wspr.control.tasks import Task, StopTask, FullTreeTask, TreeDeltaTask
+from wspr.state import ServerState
+from wspr.voice.receiver import VoiceReceiver
+from wspr.voice.recorder import Recorder
+
+
+class MumbleHub:
+    """Many Mumble sessions, possibly to different servers, multiplexed on a single event loop."""
+
+    def __init__(self, logger: Optional[logging.Logger] = None, max_concurrent_connects: int = 32):
+        """"""
+        self._logger: logging.Logger = logger or logging.getLogger('whisper')
+        self._clients: Dict[Hashable, AsyncMumble] = {}
+        self._forwarders: Dict[Hashable, asyncio.Task] = {}
+        # Events of all sessions, tagged with the key of the session they belong to
+        self._events: asyncio.Queue = asyncio.Queue()
+        # Don't hammer the servers with hundreds of TLS handshakes at once
+        self._max_concurrent_connects: int = max_concurrent_connects
+        self._connecting: Optional[asyncio.Semaphore] = None
+
+    async def add(self, key: Hashable, address: Address, credentials: Credentials,
+                  event_filter: Optional[EventFilter] = None, state: Optional[ServerState] = None,
+                  blobs: Optional[Blob] = None, voice: Optional[VoiceReceiver] = None,
+                  recorder: Optional[Recorder] = None) -> AsyncMumble:
+        """
+        Connect a new session, its events and tasks are routed using key.
+        Every session needs its own blobs, they can share a BlobStore so an avatar is fetched once for all of them.
+        Every session needs its own voice receiver and recorder as well.
+        """
+        if key in self._clients:
+            raise KeyError("Session '{}' already exists.".format(key))
+        if self._connecting is None:
+            self._connecting = asyncio.Semaphore(self._max_concurrent_connects)
+        client = AsyncMumble(address, credentials, self._logger, event_filter, state, blobs, voice, recorder)
+        self._clients[key] = client
+        try:
+            async with self._connecting:
+                await client.connect()
+        except Exception:
+            del self._clients[key]
+            raise
+        self._forwarders[key] = asyncio.get_event_loop().create_task(self.__forward(key, client))
+        return client
+
+    async def remove(self, key: Hashable) -> None:
+        """Disconnect a session and forget about it, sessions which lost their connection are forgotten already."""
+        client = self._clients.pop(key)
+        await client.close()
+        forwarder = self._forwarders.pop(key, None)
+        if forwarder is not None:
+            forwarder.cancel()
+
+    async def __forward(self, key: Hashable, client: AsyncMumble) -> None:
+        """Move events of a single session to the shared queue, and forget the session once it's disconnected."""
+        try:
+            async for event in client:
+                self._events.put_nowait((key, event))
+        except Exception as ex:
+            self._logger.warning("Session '%s' failed: %s", key, ex)
+        finally:
+            # The key might already belong to a new session
+            if self._forwarders.get(key) is asyncio.current_task():
+                del self._forwarders[key]
+        if self._clients.get(key) is client:
+            self._logger.debug("Session '%s' disconnected", key)
+            del self._clients[key]
+            await client.close()
+
+    async def submit(self, key: Hashable, task: Task) -> None:
+        """Carry out a task for the session with the given key."""
+        client = self._clients[key]
+        if isinstance(task, StopTask):
+            await self.remove(key)
+        elif isinstance(task, FullTreeTask):
+            self._events.put_nowait((key, FullTreeEvent(client.channels, client.users)))
+        elif isinstance(task, TreeDeltaTask):
+            self._events.put_nowait((key, client.state.delta(task.since)))
+        else:
+            await client.send_task(task)
+
+    async def broadcast(self, task: Task) -> None:
+        """Carry out the same task for every session."""
+        await asyncio.gather(*(self.submit(key, task) for key in list(self._clients)))
+
+    async def close(self) -> None:
+        """Disconnect all sessions."""
+        await asyncio.gather(*(self.remove(key) for key in list(self._clients)))
+
+    def __getitem__(self, key: Hashable) -> AsyncMumble:
+        """"""
+        return self._clients[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        """"""
+        return key in self._clients
+
+    def __len__(self) -> int:
+        """"""
+        return len(self._clients)
+
+    def keys(self) -> Iterator[Hashable]:
+        """"""
+        return iter(self._clients)
+
+    def __aiter__(self) -> 'MumbleHub':
+        """Iterate over (key, event) pairs of all sessions."""
+        return self
+
+    async def __anext__(self) -> Tuple[Hashable, Event]:
+        """"""
+        return await self._events.get()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from typing import Callable, Dict, Optional, Type, Union
+
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from google.protobuf.message import Message
+
+from wspr.protocol import mumble_pb2
+
+
+class LazyMessage:
+    """Payload of a packet which is only decoded when somebody needs it, and then at most once."""
+
+    __slots__ = ('message_type', '_raw', '_message')
+
+    def __init__(self, message_type: Optional[Type[Message]], raw: Optional[bytes] = None,
+                 message: Optional[Message] = None):
+        """Keep either the raw payload, the decoded message or both. Without message type the payload stays raw."""
+        self.message_type: Optional[Type[Message]] = message_type
+        self._raw: Optional[bytes] = raw
+        self._message: Optional[Message] = message
+
+    @classmethod
+    def from_message(cls, message: Message) -> 'LazyMessage':
+        """Wrap an already decoded message."""
+        return cls(type(message), message=message)
+
+    @property
+    def raw(self) -> bytes:
+        """Payload as received from or sent to the server."""
+        if self._raw is None:
+            self._raw = self._message.SerializeToString()
+        return self._raw
+
+    @property
+    def message(self) -> Union[Message, bytes]:
+        """Decoded payload, parsed on first access."""
+        if self._message is None:
+            if self.message_type is None:
+                return self._raw
+            self._decode()
+        return self._message
+
+    def _decode(self) -> None:
+        """"""
+        message = self.message_type()
+        message.ParseFromString(self._raw)
+        self._message = message
+
+    def modified(self) -> None:
+        """The decoded message was changed, serialize it again when the raw payload is needed."""
+        if self.message_type is not None:
+            # Dropping the raw payload of a message which was never decoded would lose it
+            if self._message is None:
+                self._decode()
+            self._raw = None
+
+    def is_decoded(self) -> bool:
+        """"""
+        return self._message is not None or self.message_type is None
+
+    def __len__(self) -> int:
+        """Size of the raw payload in bytes."""
+        return len(self.raw)
+
+    def __getstate__(self):
+        """Only the raw bytes cross process boundaries, the receiving side decodes them when needed."""
+        name = self.message_type.__name__ if self.message_type is not None else None
+        return name, self.raw
+
+    def __setstate__(self, state) -> None:
+        """"""
+        name, raw = state
+        # Generated message classes can't be pickled by reference, look them up again
+        self.message_type = getattr(mumble_pb2, name) if name is not None else None
+        self._raw = raw
+        self._message = None
+
+    def __repr__(self) -> str:
+        """"""
+        name = self.message_type.__name__ if self.message_type is not None else "Raw"
+        return "{}({} bytes)".format(name, len(self))
+
+
+def compile_setters(cls: type, descriptor: Descriptor) -> Dict[int, Callable[[object, object], None]]:
+    """
+    Setter of the slot with the same name for every field number of a message.
+    Repeated fields are copied to a list, so records don't keep the message alive.
+    """
+    setters = {}
+    for field in descriptor.fields:
+        setter = getattr(cls, field.name).__set__
+        if field.label == FieldDescriptor.LABEL_REPEATED:
+            setters[field.number] = (lambda set_slot: lambda record, value: set_slot(record, list(value)))(setter)
+        else:
+            setters[field.number] = setter
+    return setters
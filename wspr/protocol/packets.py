@@ -3,15 +3,38 @@
 import time
 from typing import List, Tuple
 
+from google.protobuf.message import Message
+
 from wspr.containers.credentials import Credentials
 from wspr.exceptions.connection import ConnectionRejectedError
 from wspr.protocol.mumble_pb2 import (
-    UserState,
-    Version,
+    ACL,
     Authenticate,
-    Ping,
+    BanList,
+    ChannelRemove,
     ChannelState,
+    CodecVersion,
+    ContextAction,
+    ContextActionModify,
+    CryptSetup,
+    PermissionDenied,
+    PermissionQuery,
+    Ping,
+    QueryUsers,
+    Reject,
+    RequestBlob,
+    ServerConfig,
+    ServerSync,
+    SuggestConfig,
+    TextMessage,
+    UserList,
+    UserRemove,
+    UserState,
+    UserStats,
+    Version,
+    VoiceTarget,
 )
+from wspr.protocol.message import LazyMessage
 from wspr.protocol.packet_type import PacketType
 from wspr.control.events import (
     VersionReceivedEvent,
@@ -46,9 +69,30 @@ from wspr.control.events import (
 class Packet:
     """"""
 
+    # Protobuf message contained in the payload, None when the payload isn't a protobuf message
+    message_type = None
+    packet_type: PacketType = None
+    # Event the consumer receives for this packet
+    event_type = None
+
     def __init__(self, payload):
-        """"""
-        self.payload = payload
+        """Payload can be raw bytes from the server, a decoded message or an existing lazy message."""
+        if not isinstance(payload, LazyMessage):
+            if isinstance(payload, Message):
+                payload = LazyMessage.from_message(payload)
+            else:
+                payload = LazyMessage(self.message_type, payload)
+        self.payload: LazyMessage = payload
+
+    def __repr__(self) -> str:
+        """Cheap to build, the payload isn't decoded for it."""
+        return "{}({!r})".format(type(self).__name__, self.payload)
+
+    def emit(self, r) -> None:
+        """Hand the event for this packet to the consumer, unless the consumer isn't interested in it."""
+        accepts = getattr(r, 'accepts', None)
+        if accepts is None or accepts(self):
+            r.put(self.event_type(self.payload))
 
     def handle(self, c, r):
         """"""
@@ -58,6 +102,10 @@ class Packet:
 class VersionPacket(Packet):
     """"""
 
+    message_type = Version
+    packet_type = PacketType.VERSION
+    event_type = VersionReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
@@ -74,29 +122,43 @@ class VersionPacket(Packet):
 
     def handle(self, c, r):
         """"""
-        r.put(VersionReceivedEvent(self.payload))
+        self.emit(r)
 
     def get_full(self) -> Tuple[PacketType, Version]:
         """"""
-        return PacketType.VERSION, self.payload
+        return PacketType.VERSION, self.payload.message
 
 
 class UDPTunnelPacket(Packet):
     """"""
 
+    packet_type = PacketType.UDPTUNNEL
+    event_type = UDPTunnelReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(UDPTunnelReceivedEvent(self.payload))
-        # sound_received(self.payload)
+        self.emit(r)
+
+    def update(self, c, r, whisper):
+        """"""
+        self.handle(c, r)
+        if whisper.voice is not None:
+            whisper.voice.add(self.payload.message)
+        if whisper.recorder is not None:
+            whisper.recorder.add_packet(self.payload.message)
 
 
 class AuthenticatePacket(Packet):
     """"""
 
+    message_type = Authenticate
+    packet_type = PacketType.AUTHENTICATE
+    event_type = AuthenticateReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
@@ -113,24 +175,28 @@ class AuthenticatePacket(Packet):
 
     def handle(self, c, r):
         """"""
-        r.put(AuthenticateReceivedEvent(self.payload))
+        self.emit(r)
 
     def get_full(self) -> Tuple[PacketType, Authenticate]:
         """"""
-        return PacketType.AUTHENTICATE, self.payload
+        return PacketType.AUTHENTICATE, self.payload.message
 
 
 class PingPacket(Packet):
     """"""
 
+    message_type = Ping
+    packet_type = PacketType.PING
+    event_type = PingReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(PingReceivedEvent(self.payload))
-        c.__incoming_ping()
+        self.emit(r)
+        c.incoming_ping()
 
     @classmethod
     def from_info(cls, average, variance, nb):
@@ -144,293 +210,415 @@ class PingPacket(Packet):
 
     def get_full(self) -> Tuple[PacketType, Ping]:
         """"""
-        return PacketType.PING, self.payload
+        return PacketType.PING, self.payload.message
 
 
 class RejectPacket(Packet):
     """"""
 
+    message_type = Reject
+    packet_type = PacketType.REJECT
+    event_type = RejectReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(RejectReceivedEvent(self.payload))
-        raise ConnectionRejectedError(self.payload.reason)
+        self.emit(r)
+        raise ConnectionRejectedError(self.payload.message.reason)
 
 
 class ServerSyncPacket(Packet):
     """"""
 
+    message_type = ServerSync
+    packet_type = PacketType.SERVERSYNC
+    event_type = ServerSyncReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(ServerSyncReceivedEvent(self.payload))
+        self.emit(r)
         # self._connection.current_users.set_my(mess.session)
-        # c.set_bandwidth_limit(self.payload.max_bandwidth)
+        if self.payload.message.HasField('max_bandwidth'):
+            c.set_bandwidth_limit(self.payload.message.max_bandwidth)
         if c.is_authenticating():
             c.set_connected()
 
+    def update(self, c, r, whisper):
+        """"""
+        self.handle(c, r)
+        # Everything from before a reconnect the server didn't send again is gone
+        whisper.state.sweep()
+
 
 class ChannelRemovePacket(Packet):
     """"""
 
+    message_type = ChannelRemove
+    packet_type = PacketType.CHANNELREMOVE
+    event_type = ChannelRemoveReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(ChannelRemoveReceivedEvent(self.payload))
-        # self._mumble.channels.remove(message.channel_id)
+        self.emit(r)
+
+    def update(self, c, r, whisper):
+        """"""
+        self.handle(c, r)
+        whisper.state.remove_channel(self.payload.message.channel_id)
 
 
 class ChannelStatePacket(Packet):
     """"""
 
+    message_type = ChannelState
+    packet_type = PacketType.CHANNELSTATE
+    event_type = ChannelStateReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(ChannelStateReceivedEvent(self.payload))
+        self.emit(r)
 
     def update(self, c, r, whisper):
         """"""
+        # Fill in blobs we already have before anyone sees the message
+        if whisper.blobs is not None and whisper.blobs.channel_state(self.payload.message):
+            self.payload.modified()
         self.handle(c, r)
-        cs = ChannelState()
-        cs.ParseFromString(self.payload)
-        whisper._channels[cs.channel_id].update(cs)
+        whisper.state.update_channel(self.payload.message)
+        if whisper.blobs is not None:
+            _update_arrived(c, r, whisper)
 
 
 class UserRemovePacket(Packet):
     """"""
 
+    message_type = UserRemove
+    packet_type = PacketType.USERREMOVE
+    event_type = UserRemoveReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(UserRemoveReceivedEvent(self.payload))
-        # information = mumble_pb2.UserRemove()
-        # information.ParseFromString(args)
-        # self._mumble.users.remove(information)
+        self.emit(r)
+
+    def update(self, c, r, whisper):
+        """"""
+        self.handle(c, r)
+        whisper.state.remove_user(self.payload.message.session)
+        if whisper.voice is not None:
+            whisper.voice.remove(self.payload.message.session)
+        if whisper.recorder is not None:
+            whisper.recorder.remove(self.payload.message.session)
 
 
 class UserStatePacket(Packet):
     """"""
 
+    message_type = UserState
+    packet_type = PacketType.USERSTATE
+    event_type = UserStateReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(UserStateReceivedEvent(self.payload))
+        self.emit(r)
 
     def update(self, c, r, whisper):
         """"""
+        # Fill in blobs we already have before anyone sees the message
+        if whisper.blobs is not None and whisper.blobs.user_state(self.payload.message):
+            self.payload.modified()
         self.handle(c, r)
-        us = UserState()
-        us.ParseFromString(self.payload)
-        whisper._users[us.session].update(us)
+        whisper.state.update_user(self.payload.message)
+        if whisper.blobs is not None:
+            _update_arrived(c, r, whisper)
+
+
+def _update_arrived(c, r, whisper) -> None:
+    """Users and channels which waited on a blob that came for somebody else get it as if the server sent it."""
+    for message in whisper.blobs.arrived():
+        if isinstance(message, UserState):
+            if message.session in whisper.state.users:
+                UserStatePacket(message).update(c, r, whisper)
+        elif message.channel_id in whisper.state.channels:
+            ChannelStatePacket(message).update(c, r, whisper)
 
 
 class BanListPacket(Packet):
     """"""
 
+    message_type = BanList
+    packet_type = PacketType.BANLIST
+    event_type = BanListReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(BanListReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class TextMessagePacket(Packet):
     """"""
 
+    message_type = TextMessage
+    packet_type = PacketType.TEXTMESSAGE
+    event_type = TextMessageReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(TextMessageReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class PermissionDeniedPacket(Packet):
     """"""
 
+    message_type = PermissionDenied
+    packet_type = PacketType.PERMISSIONDENIED
+    event_type = PermissionDeniedReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(PermissionDeniedReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class ACLPacket(Packet):
     """"""
 
+    message_type = ACL
+    packet_type = PacketType.ACL
+    event_type = ACLReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(ACLReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class QueryUsersPacket(Packet):
     """"""
 
+    message_type = QueryUsers
+    packet_type = PacketType.QUERYUSERS
+    event_type = QueryUsersReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(QueryUsersReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class CryptSetupPacket(Packet):
     """"""
 
+    message_type = CryptSetup
+    packet_type = PacketType.CRYPTSETUP
+    event_type = CryptSetupReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(CryptSetupReceivedEvent(self.payload))
-        c.__send_ping()
+        self.emit(r)
+        c.crypt_setup(self.payload.message)
+        c.send_ping()
 
 
 class ContextActionModifyPacket(Packet):
     """"""
 
+    message_type = ContextActionModify
+    packet_type = PacketType.CONTEXTACTIONMODIFY
+    event_type = ContextActionModifyReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(ContextActionModifyReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class ContextActionPacket(Packet):
     """"""
 
+    message_type = ContextAction
+    packet_type = PacketType.CONTEXTACTION
+    event_type = ContextActionReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(ContextActionReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class UserListPacket(Packet):
     """"""
 
+    message_type = UserList
+    packet_type = PacketType.USERLIST
+    event_type = UserListReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(UserListReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class VoiceTargetPacket(Packet):
     """"""
 
+    message_type = VoiceTarget
+    packet_type = PacketType.VOICETARGET
+    event_type = VoiceTargetReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(VoiceTargetReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class PermissionQueryPacket(Packet):
     """"""
 
+    message_type = PermissionQuery
+    packet_type = PacketType.PERMISSIONQUERY
+    event_type = PermissionQueryReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(PermissionQueryReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class CodecVersionPacket(Packet):
     """"""
 
+    message_type = CodecVersion
+    packet_type = PacketType.CODECVERSION
+    event_type = CodecVersionReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(CodecVersionReceivedEvent(self.payload))
+        self.emit(r)
         # self._connection.sound_output.set_default_codec(mess)
 
 
 class UserStatsPacket(Packet):
     """"""
 
+    message_type = UserStats
+    packet_type = PacketType.USERSTATS
+    event_type = UserStatsReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(UserStatsReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class RequestBlobPacket(Packet):
     """"""
 
+    message_type = RequestBlob
+    packet_type = PacketType.REQUESTBLOB
+    event_type = RequestBlobReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(RequestBlobReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class ServerConfigPacket(Packet):
     """"""
 
+    message_type = ServerConfig
+    packet_type = PacketType.SERVERCONFIG
+    event_type = ServerConfigReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(ServerConfigReceivedEvent(self.payload))
+        self.emit(r)
 
 
 class SuggestConfigPacket(Packet):
     """"""
 
+    message_type = SuggestConfig
+    packet_type = PacketType.SUGGESTCONFIG
+    event_type = SuggestConfigReceivedEvent
+
     def __init__(self, payload):
         """"""
         super().__init__(payload)
 
     def handle(self, c, r):
         """"""
-        r.put(SuggestConfigReceivedEvent(self.payload))
+        self.emit(r)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+from typing import Sequence, Tuple, Union
+
+from wspr.exceptions.exceptions import InvalidVarInt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Mumble variable length integers, used in voice packets
+# https://mumble-protocol.readthedocs.io/en/latest/voice_data.html#variable-length-integer-encoding
+
+
+# Single byte encodings, by far the most common ones
+_SMALL = [bytes((value,)) for value in range(0x80)]
+
+
+def encode_varint(value: int) -> bytes:
+    """"""
+    if 0 <= value < 0x80:
+        return _SMALL[value]
+    prefix = b""
+    if value < 0:
+        value = ~value
+        if value <= 0x3:
+            # -1 to -4 fit in a single byte
+            return bytes((0xFC | value,))
+        prefix = b"\xF8"
+    if value < 0x80:
+        return prefix + bytes((value,))
+    if value < 0x4000:
+        return prefix + bytes((0x80 | (value >> 8), value & 0xFF))
+    if value < 0x200000:
+        return prefix + bytes((0xC0 | (value >> 16), (value >> 8) & 0xFF, value & 0xFF))
+    if value < 0x10000000:
+        return prefix + bytes((0xE0 | (value >> 24), (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF))
+    if value < 0x100000000:
+        return prefix + b"\xF0" + value.to_bytes(4, "big")
+    if value < 0x10000000000000000:
+        return prefix + b"\xF4" + value.to_bytes(8, "big")
+    raise InvalidVarInt(value)
+
+
+def decode_varint(data: bytes, offset: int = 0) -> Tuple[int, int]:
+    """Value starting at offset, and the offset right after it."""
+    try:
+        first = data[offset]
+        if first & 0x80 == 0x00:
+            return first, offset + 1
+        if first & 0xC0 == 0x80:
+            return (first & 0x3F) << 8 | data[offset + 1], offset + 2
+        if first & 0xE0 == 0xC0:
+            return (first & 0x1F) << 16 | data[offset + 1] << 8 | data[offset + 2], offset + 3
+        if first & 0xF0 == 0xE0:
+            value = (first & 0x0F) << 24 | data[offset + 1] << 16 | data[offset + 2] << 8 | data[offset + 3]
+            return value, offset + 4
+        kind = first & 0xFC
+        if kind in (0xF0, 0xF4):
+            end = offset + (5 if kind == 0xF0 else 9)
+            if end > len(data):
+                raise IndexError(end)
+            return int.from_bytes(data[offset + 1:end], "big"), end
+        if kind == 0xF8:
+            value, end = decode_varint(data, offset + 1)
+            return ~value, end
+        return ~(first & 0x03), offset + 1
+    except IndexError:
+        raise InvalidVarInt(bytes(data[offset:]))
+
+
+def decode_varints(data: Union[bytes, "numpy.ndarray"], offsets: Sequence[int]) -> Tuple[Sequence, Sequence]:
+    """
+    Decode a value at each of the offsets in one go, returns the values and the offsets right after them.
+    Doesn't raise for values running past the end of the data, compare the returned offsets to its length instead.
+    With NumPy both are int64 arrays, lists otherwise.
+    """
+    if numpy is None:
+        values, ends = [], []
+        for offset in offsets:
+            try:
+                value, end = decode_varint(data, offset)
+            except InvalidVarInt:
+                value, end = 0, len(data) + 1
+            values.append(value)
+            ends.append(end)
+        return values, ends
+    return _decode_varints_numpy(data, numpy.asarray(offsets, dtype=numpy.int64))
+
+
+def _decode_varints_numpy(data: Union[bytes, "numpy.ndarray"], offsets: "numpy.ndarray"):
+    """"""
+    size = len(data)
+    # Reading past the end yields zeroes instead of errors, the offsets tell whether that happened
+    buffer = numpy.zeros(size + 9, dtype=numpy.uint8)
+    buffer[:size] = numpy.frombuffer(data, dtype=numpy.uint8) if isinstance(data, (bytes, bytearray)) else data
+    offsets = numpy.minimum(offsets, size)
+    first = buffer[offsets].astype(numpy.int64)
+    following = [buffer[offsets + i].astype(numpy.int64) for i in range(1, 9)]
+
+    prefix = first & 0xFC
+    conditions = [
+        first < 0x80,
+        first & 0xC0 == 0x80,
+        first & 0xE0 == 0xC0,
+        first & 0xF0 == 0xE0,
+        prefix == 0xF0,
+        prefix == 0xF4,
+        prefix == 0xFC,
+    ]
+    big = following[0]
+    for byte in following[1:]:
+        # Wraps around for values above 2^63 - 1, like the C++ implementation
+        big = (big << 8) | byte
+    values = numpy.select(conditions, [
+        first,
+        (first & 0x3F) << 8 | following[0],
+        (first & 0x1F) << 16 | following[0] << 8 | following[1],
+        (first & 0x0F) << 24 | following[0] << 16 | following[1] << 8 | following[2],
+        following[0] << 24 | following[1] << 16 | following[2] << 8 | following[3],
+        big,
+        ~(first & 0x03),
+    ])
+    ends = offsets + numpy.select(conditions, [1, 2, 3, 4, 5, 9, 1], default=0)
+    # Negative numbers wrapping another varint are rare, decode those one by one
+    for row in numpy.flatnonzero(prefix == 0xF8):
+        try:
+            values[row], ends[row] = decode_varint(bytes(buffer[:size]), int(offsets[row]))
+        except InvalidVarInt:
+            values[row], ends[row] = 0, size + 1
+    return values, ends
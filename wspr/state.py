@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from wspr.channel import ROOT_CHANNEL, Channel
+from wspr.control.events import TreeDeltaEvent
+from wspr.protocol.mumble_pb2 import ChannelState, UserState
+from wspr.user import User
+
+
+class ServerState:
+    """Channels and users on the server. Every change bumps a sequence number, so consumers can ask for deltas."""
+
+    def __init__(self, max_removals: int = 10000):
+        """Max removals is how many removed channels and users are remembered for deltas."""
+        self.channels: Dict[int, Channel] = {}
+        self.users: Dict[int, User] = {}
+        # Sequence number of the last change
+        self.sequence: int = 0
+        # Sequence number of the last change per channel/user, least recently changed first
+        self._channel_changes: OrderedDict = OrderedDict()
+        self._user_changes: OrderedDict = OrderedDict()
+        # Sequence number of the removal per channel/user, oldest removal first
+        self._removed_channels: OrderedDict = OrderedDict()
+        self._removed_users: OrderedDict = OrderedDict()
+        self._max_removals: int = max_removals
+        # Deltas since before this sequence number might miss removals we forgot about
+        self._forgotten: int = 0
+        # Channels and users from before a reconnect, which the server hasn't told us about again yet
+        self._stale_channels: Set[int] = set()
+        self._stale_users: Set[int] = set()
+
+        # Secondary indexes, kept up to date on every change
+        self._session_by_name: Dict[str, int] = {}
+        self._session_by_user_id: Dict[int, int] = {}
+        self._sessions_by_channel: Dict[int, Set[int]] = defaultdict(set)
+        self._children_by_parent: Dict[int, Set[int]] = defaultdict(set)
+        self._channel_by_parent_and_name: Dict[Tuple[Optional[int], str], int] = {}
+
+    def __bump(self, changes: OrderedDict, removed: OrderedDict, key: int) -> None:
+        """Remember the key changed just now."""
+        self.sequence += 1
+        changes[key] = self.sequence
+        changes.move_to_end(key)
+        removed.pop(key, None)
+
+    def __remove(self, changes: OrderedDict, removed: OrderedDict, key: int) -> None:
+        """Remember the key was removed just now."""
+        self.sequence += 1
+        changes.pop(key, None)
+        removed[key] = self.sequence
+        removed.move_to_end(key)
+        while len(removed) > self._max_removals:
+            _, sequence = removed.popitem(last=False)
+            self._forgotten = max(self._forgotten, sequence)
+
+    @staticmethod
+    def __discard(index: Dict, key, value) -> None:
+        """Remove a value from a set in the index, and the set itself once it's empty."""
+        values = index.get(key)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del index[key]
+
+    def __index_channel(self, channel: Channel) -> None:
+        """"""
+        if channel.parent is not None:
+            self._children_by_parent[channel.parent].add(channel.channel_id)
+        self._channel_by_parent_and_name[(channel.parent, channel.name)] = channel.channel_id
+
+    def __unindex_channel(self, channel: Channel) -> None:
+        """"""
+        if channel.parent is not None:
+            self.__discard(self._children_by_parent, channel.parent, channel.channel_id)
+        if self._channel_by_parent_and_name.get((channel.parent, channel.name)) == channel.channel_id:
+            del self._channel_by_parent_and_name[(channel.parent, channel.name)]
+
+    def __index_user(self, user: User) -> None:
+        """"""
+        if user.name is not None:
+            self._session_by_name[user.name] = user.session
+        if user.user_id is not None:
+            self._session_by_user_id[user.user_id] = user.session
+        if user.channel_id is not None:
+            self._sessions_by_channel[user.channel_id].add(user.session)
+
+    def __unindex_user(self, user: User) -> None:
+        """"""
+        if self._session_by_name.get(user.name) == user.session:
+            del self._session_by_name[user.name]
+        if self._session_by_user_id.get(user.user_id) == user.session:
+            del self._session_by_user_id[user.user_id]
+        if user.channel_id is not None:
+            self.__discard(self._sessions_by_channel, user.channel_id, user.session)
+
+    def update_channel(self, message: ChannelState) -> Channel:
+        """"""
+        channel = self.channels.get(message.channel_id)
+        if channel is not None:
+            self.__unindex_channel(channel)
+        if channel is None or message.channel_id in self._stale_channels:
+            # Nothing we knew from before a reconnect should survive, the server sends everything again
+            self._stale_channels.discard(message.channel_id)
+            channel = self.channels[message.channel_id] = Channel()
+        channel.update(message)
+        self.__index_channel(channel)
+        self.__bump(self._channel_changes, self._removed_channels, message.channel_id)
+        return channel
+
+    def remove_channel(self, channel_id: int) -> None:
+        """"""
+        self._stale_channels.discard(channel_id)
+        channel = self.channels.pop(channel_id, None)
+        if channel is not None:
+            self.__unindex_channel(channel)
+            self.__remove(self._channel_changes, self._removed_channels, channel_id)
+
+    def update_user(self, message: UserState) -> User:
+        """"""
+        user = self.users.get(message.session)
+        if user is not None:
+            self.__unindex_user(user)
+        if user is None or message.session in self._stale_users:
+            self._stale_users.discard(message.session)
+            user = self.users[message.session] = User()
+            user.channel_id = ROOT_CHANNEL
+        user.update(message)
+        self.__index_user(user)
+        self._user_changed(message.session)
+        return user
+
+    def remove_user(self, session: int) -> None:
+        """"""
+        self._stale_users.discard(session)
+        user = self.users.pop(session, None)
+        if user is not None:
+            self.__unindex_user(user)
+            self._user_removed(session)
+
+    def _user_changed(self, session: int) -> None:
+        """Remember the user changed just now, for deltas."""
+        self.__bump(self._user_changes, self._removed_users, session)
+
+    def _user_removed(self, session: int) -> None:
+        """Remember the user was removed just now, for deltas."""
+        self.__remove(self._user_changes, self._removed_users, session)
+
+    def mark_stale(self) -> None:
+        """
+        We are reconnecting, everything we know might be outdated.
+        Channels and users the server tells us about again are replaced, the others are removed on sweep.
+        """
+        self._stale_channels = set(self.channels)
+        self._stale_users = set(self.users)
+
+    def sweep(self) -> None:
+        """The server told us everything after a reconnect, remove what it didn't mention."""
+        for session in list(self._stale_users):
+            self.remove_user(session)
+        for channel_id in list(self._stale_channels):
+            self.remove_channel(channel_id)
+        self._stale_users.clear()
+        self._stale_channels.clear()
+
+    def is_stale(self) -> bool:
+        """"""
+        return bool(self._stale_channels or self._stale_users)
+
+    def user_by_name(self, name: str) -> Optional[User]:
+        """"""
+        session = self._session_by_name.get(name)
+        return self.users[session] if session is not None else None
+
+    def user_by_id(self, user_id: int) -> Optional[User]:
+        """Registered user by its user id."""
+        session = self._session_by_user_id.get(user_id)
+        return self.users[session] if session is not None else None
+
+    def users_in_channel(self, channel_id: int) -> List[User]:
+        """"""
+        return [self.users[session] for session in self._sessions_by_channel.get(channel_id, ())]
+
+    def children_of(self, channel_id: int) -> List[Channel]:
+        """Channels directly below the given channel."""
+        return [self.channels[child] for child in self._children_by_parent.get(channel_id, ())]
+
+    def channel_by_path(self, path: str, separator: str = "/") -> Optional[Channel]:
+        """Channel by the names of the channels leading to it from the root channel, e.g. "Games/Minecraft"."""
+        channel_id = 0
+        for name in filter(None, path.split(separator)):
+            channel_id = self._channel_by_parent_and_name.get((channel_id, name))
+            if channel_id is None:
+                return None
+        return self.channels.get(channel_id)
+
+    @staticmethod
+    def __since(changes: OrderedDict, since: int) -> list:
+        """Keys changed after the given sequence number, only looks at those."""
+        keys = []
+        for key, sequence in reversed(changes.items()):
+            if sequence <= since:
+                break
+            keys.append(key)
+        return keys
+
+    def snapshot(self) -> TreeDeltaEvent:
+        """Everything we know."""
+        return TreeDeltaEvent(self.sequence, dict(self.channels), dict(self.users), [], [], full=True)
+
+    def delta(self, since: int) -> TreeDeltaEvent:
+        """What changed after the given sequence number, or a snapshot when we can't tell anymore."""
+        if since < self._forgotten or since > self.sequence:
+            return self.snapshot()
+        channels = {key: self.channels[key] for key in self.__since(self._channel_changes, since)}
+        users = {key: self.users[key] for key in self.__since(self._user_changes, since)}
+        removed_channels = self.__since(self._removed_channels, since)
+        removed_users = self.__since(self._removed_users, since)
+        return TreeDeltaEvent(self.sequence, channels, users, removed_channels, removed_users)
@@ -1,11 +1,35 @@
 # -*- coding: utf-8 -*-
 
+from wspr.protocol.message import compile_setters
 from wspr.protocol.mumble_pb2 import UserState
 
 
 class User:
     """"""
 
+    # No per instance dictionary, we might keep track of a lot of users
+    __slots__ = (
+        'session',
+        'actor',
+        'name',
+        'user_id',
+        'channel_id',
+        'mute',
+        'deaf',
+        'suppress',
+        'self_mute',
+        'self_deaf',
+        'texture',
+        'plugin_context',
+        'plugin_identity',
+        'comment',
+        'hash',
+        'comment_hash',
+        'texture_hash',
+        'priority_speaker',
+        'recording',
+    )
+
     def __init__(self):
         """"""
         self.session = None
@@ -22,6 +46,8 @@ class User:
         self.plugin_context = None
         self.plugin_identity = None
         self.comment = None
+        self.hash = None
+        self.comment_hash = None
         self.texture_hash = None
         self.priority_speaker = None
         self.recording = None
@@ -30,8 +56,12 @@ class User:
         """Update user state."""
         # Don't override existing values if the update message doesn't contain them
         for field, value in data.ListFields():
-            setattr(self, field.name, value)
+            _SETTERS[field.number](self, value)
 
     def __repr__(self) -> str:
         """"""
         return 'name={}'.format(self.name)
+
+
+# Field number to slot, looked up once instead of by name for every field of every update
+_SETTERS = compile_setters(User, UserState.DESCRIPTOR)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+import time
+from typing import List, Optional
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+
+# OCB2-AES128 as used by Mumble for UDP voice packets
+# https://mumble-protocol.readthedocs.io/en/latest/voice_data.html#encryption
+
+BLOCK_SIZE = 16
+_MASK = (1 << 128) - 1
+
+
+def is_available() -> bool:
+    """Whether the cryptography package needed to encrypt voice packets is installed."""
+    return Cipher is not None
+
+
+def _times_two(block: int) -> int:
+    """Multiply by two in GF(2^128), the way OCB2 moves from one block offset to the next."""
+    block <<= 1
+    if block >> 128:
+        block = (block & _MASK) ^ 0x87
+    return block
+
+
+def _times_three(block: int) -> int:
+    """"""
+    return _times_two(block) ^ block
+
+
+def _blocks(data: bytes) -> List[int]:
+    """"""
+    return [int.from_bytes(data[i:i + BLOCK_SIZE], "big") for i in range(0, len(data), BLOCK_SIZE)]
+
+
+def _join(blocks: List[int]) -> bytes:
+    """"""
+    return b"".join(block.to_bytes(BLOCK_SIZE, "big") for block in blocks)
+
+
+class OCB2:
+    """
+    OCB2 mode on top of AES-128 in ECB mode.
+    Every block of a packet is whitened up front, so AES is called a few times per packet instead of once per block.
+    """
+
+    def __init__(self, key: bytes):
+        """"""
+        if Cipher is None:
+            raise RuntimeError("UDP voice requires the cryptography package")
+        cipher = Cipher(algorithms.AES(key), modes.ECB())
+        self._encryptor = cipher.encryptor()
+        self._decryptor = cipher.decryptor()
+
+    def __offsets(self, nonce: bytes, count: int) -> List[int]:
+        """Offset of every full block and the last (partial) block, followed by the offset of the tag."""
+        offsets = []
+        delta = int.from_bytes(self._encryptor.update(nonce), "big")
+        for _ in range(count + 1):
+            delta = _times_two(delta)
+            offsets.append(delta)
+        offsets.append(_times_three(delta))
+        return offsets
+
+    @staticmethod
+    def __split(size: int) -> int:
+        """Number of full blocks before the last block, which holds between 1 and 16 bytes (none when empty)."""
+        return (size - 1) // BLOCK_SIZE if size > 0 else 0
+
+    def encrypt(self, plain: bytes, nonce: bytes) -> (bytes, bytes):
+        """Encrypted data and its tag."""
+        full = self.__split(len(plain))
+        last = len(plain) - full * BLOCK_SIZE
+        offsets = self.__offsets(nonce, full)
+        blocks = _blocks(plain[:full * BLOCK_SIZE])
+        if blocks:
+            # Counter measure from section 9 of https://eprint.iacr.org/2019/311, flips a bit of the second to last
+            # block when it's all zeroes except for its last byte. Digital silence produces those, it's inaudible.
+            if blocks[-1] >> 8 == 0:
+                blocks[-1] ^= 1 << 120
+        whitened = [offset ^ block for offset, block in zip(offsets, blocks)]
+        whitened.append(offsets[full] ^ (last * 8))
+        encrypted = _blocks(self._encryptor.update(_join(whitened)))
+        pad = encrypted.pop()
+        checksum = 0
+        for block in blocks:
+            checksum ^= block
+        tail = int.from_bytes(plain[full * BLOCK_SIZE:] + pad.to_bytes(BLOCK_SIZE, "big")[last:], "big")
+        checksum ^= tail
+        crypted = _join([offset ^ block for offset, block in zip(offsets, encrypted)])
+        crypted += (tail ^ pad).to_bytes(BLOCK_SIZE, "big")[:last]
+        tag = self._encryptor.update((offsets[-1] ^ checksum).to_bytes(BLOCK_SIZE, "big"))
+        return crypted, tag
+
+    def decrypt(self, crypted: bytes, nonce: bytes) -> (Optional[bytes], bytes):
+        """Decrypted data and its tag, no data when the packet is an attempt at forging one."""
+        full = self.__split(len(crypted))
+        last = len(crypted) - full * BLOCK_SIZE
+        offsets = self.__offsets(nonce, full)
+        whitened = [offset ^ block for offset, block in zip(offsets, _blocks(crypted[:full * BLOCK_SIZE]))]
+        blocks = [offset ^ block for offset, block in zip(offsets, _blocks(self._decryptor.update(_join(whitened))))]
+        pad = int.from_bytes(self._encryptor.update((offsets[full] ^ (last * 8)).to_bytes(BLOCK_SIZE, "big")), "big")
+        tail = int.from_bytes(crypted[full * BLOCK_SIZE:] + bytes(BLOCK_SIZE - last), "big") ^ pad
+        checksum = tail
+        for block in blocks:
+            checksum ^= block
+        tag = self._encryptor.update((offsets[-1] ^ checksum).to_bytes(BLOCK_SIZE, "big"))
+        # Counter measure from section 9 of https://eprint.iacr.org/2019/311
+        if (tail ^ offsets[full]) >> 8 == 0:
+            return None, tag
+        plain = _join(blocks) + tail.to_bytes(BLOCK_SIZE, "big")[:last]
+        return plain, tag
+
+
+class CryptState:
+    """
+    Keys and nonces for voice packets, as handed out by the server with CryptSetup.
+    Keeps track of packets which arrive late, get lost or are replayed.
+    """
+
+    def __init__(self):
+        """"""
+        self._ocb: Optional[OCB2] = None
+        self.key: bytes = b""
+        self.encrypt_iv: bytearray = bytearray(BLOCK_SIZE)
+        self.decrypt_iv: bytearray = bytearray(BLOCK_SIZE)
+        # Second byte of the nonce last used for every first byte, to recognize replayed packets
+        self._history: bytearray = bytearray(256)
+        # Packet statistics
+        self.good: int = 0
+        self.late: int = 0
+        self.lost: int = 0
+        self.last_good: float = 0.0
+
+    def set_key(self, key: bytes, client_nonce: bytes, server_nonce: bytes) -> None:
+        """"""
+        self._ocb = OCB2(key)
+        self.key = key
+        self.encrypt_iv = bytearray(client_nonce)
+        self.decrypt_iv = bytearray(server_nonce)
+        self._history = bytearray(256)
+        self.last_good = time.monotonic()
+
+    def set_decrypt_iv(self, server_nonce: bytes) -> None:
+        """The server resynchronized its nonce."""
+        self.decrypt_iv = bytearray(server_nonce)
+
+    def is_valid(self) -> bool:
+        """"""
+        return self._ocb is not None
+
+    @staticmethod
+    def __increment(iv: bytearray, start: int = 0) -> None:
+        """Add one to the little endian nonce, from the given byte on."""
+        for i in range(start, BLOCK_SIZE):
+            iv[i] = (iv[i] + 1) & 0xFF
+            if iv[i]:
+                break
+
+    @staticmethod
+    def __decrement(iv: bytearray, start: int = 0) -> None:
+        """"""
+        for i in range(start, BLOCK_SIZE):
+            iv[i] = (iv[i] - 1) & 0xFF
+            if iv[i] != 0xFF:
+                break
+
+    def encrypt(self, plain: bytes) -> bytes:
+        """Packet ready to be sent: first byte of the nonce, three bytes of the tag and the encrypted data."""
+        self.__increment(self.encrypt_iv)
+        crypted, tag = self._ocb.encrypt(plain, bytes(self.encrypt_iv))
+        return bytes((self.encrypt_iv[0],)) + tag[:3] + crypted
+
+    def decrypt(self, packet: bytes) -> Optional[bytes]:
+        """Decrypted data, None when the packet is invalid, a replay or too late."""
+        if len(packet) < 4 or self._ocb is None:
+            return None
+        saved = bytearray(self.decrypt_iv)
+        iv_byte = packet[0]
+        restore = False
+        late = 0
+        lost = 0
+        if (self.decrypt_iv[0] + 1) & 0xFF == iv_byte:
+            # In order, as expected
+            if iv_byte > self.decrypt_iv[0]:
+                self.decrypt_iv[0] = iv_byte
+            elif iv_byte < self.decrypt_iv[0]:
+                self.decrypt_iv[0] = iv_byte
+                self.__increment(self.decrypt_iv, 1)
+            else:
+                return None
+        else:
+            # Out of order or a repeat
+            diff = iv_byte - self.decrypt_iv[0]
+            if diff > 128:
+                diff -= 256
+            elif diff < -128:
+                diff += 256
+            if iv_byte < self.decrypt_iv[0] and -30 < diff < 0:
+                # Late packet, without wrap around
+                late, lost = 1, -1
+                self.decrypt_iv[0] = iv_byte
+                restore = True
+            elif iv_byte > self.decrypt_iv[0] and -30 < diff < 0:
+                # Late packet from before the last wrap around
+                late, lost = 1, -1
+                self.decrypt_iv[0] = iv_byte
+                self.__decrement(self.decrypt_iv, 1)
+                restore = True
+            elif iv_byte > self.decrypt_iv[0] and diff > 0:
+                # Lost a few packets
+                lost = iv_byte - self.decrypt_iv[0] - 1
+                self.decrypt_iv[0] = iv_byte
+            elif iv_byte < self.decrypt_iv[0] and diff > 0:
+                # Lost a few packets, and wrapped around
+                lost = 256 - self.decrypt_iv[0] + iv_byte - 1
+                self.decrypt_iv[0] = iv_byte
+                self.__increment(self.decrypt_iv, 1)
+            else:
+                return None
+            if self._history[self.decrypt_iv[0]] == self.decrypt_iv[1]:
+                # Seen this one before
+                self.decrypt_iv = saved
+                return None
+        plain, tag = self._ocb.decrypt(packet[4:], bytes(self.decrypt_iv))
+        if plain is None or tag[:3] != packet[1:4]:
+            self.decrypt_iv = saved
+            return None
+        self._history[self.decrypt_iv[0]] = self.decrypt_iv[1]
+        if restore:
+            self.decrypt_iv = saved
+        self.good += 1
+        self.late += late
+        self.lost += lost
+        self.last_good = time.monotonic()
+        return plain
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, List, Optional, Tuple
+
+from wspr.voice.opus import FRAME_SAMPLES, SAMPLE_RATE
+
+# Sequence numbers count frames of this many seconds
+FRAME_DURATION = FRAME_SAMPLES / SAMPLE_RATE
+
+
+class JitterBuffer:
+    """
+    Voice packets of a single speaker, ordered by sequence number and played out at the pace they were recorded.
+    Playout starts a fixed delay after the first packet, so packets which arrive a little late are still in time.
+    Packets which don't make it are concealed, packets which arrive after their turn are dropped.
+    """
+
+    # A sequence number this far behind means the speaker started over instead of a very late packet
+    RESET_WINDOW = 500
+
+    def __init__(self, delay: float = 0.06, max_packets: int = 50, max_concealed: int = 5):
+        """
+        Delay is in seconds, more packets than max packets are skipped to catch up.
+        After max concealed packets without anything coming in the speaker is considered silent.
+        """
+        self.delay: float = delay
+        self.max_packets: int = max_packets
+        self.max_concealed: int = max_concealed
+        # Packet data, its samples and whether it's the last one by sequence number
+        self._packets: Dict[int, Tuple[bytes, int, bool]] = {}
+        # Sequence number to play next and when, None while the speaker is silent
+        self._next: Optional[int] = None
+        self._playout: float = 0.0
+        # Sequence numbers a packet spans, the last one is assumed to repeat for concealed packets
+        self._step: int = 1
+        self._concealed: int = 0
+        # Whether anything has been played since the speaker started
+        self._playing: bool = False
+        # Packet statistics
+        self.late: int = 0
+        self.lost: int = 0
+        self.skipped: int = 0
+
+    def __len__(self) -> int:
+        """Packets waiting for their turn."""
+        return len(self._packets)
+
+    def push(self, sequence: int, data: bytes, samples: int, terminator: bool, now: float) -> bool:
+        """Add a packet which arrived at now, returns whether it'll be played."""
+        if self._next is not None and sequence < self._next:
+            if self._next - sequence >= self.RESET_WINDOW:
+                self.reset()
+            elif self._playing:
+                self.late += 1
+                return False
+            else:
+                # Overtaken by the packet after it, but still in time
+                self._next = sequence
+        if sequence in self._packets:
+            return False
+        self._packets[sequence] = (data, samples, terminator)
+        if self._next is None:
+            self._next = sequence
+            self._playout = now + self.delay
+        if len(self._packets) > self.max_packets:
+            self.__skip()
+        return True
+
+    def __skip(self) -> None:
+        """Drop the oldest packets, the speaker got too far ahead of us."""
+        for sequence in sorted(self._packets)[:len(self._packets) - self.max_packets]:
+            del self._packets[sequence]
+            self.skipped += 1
+        self._next = min(self._packets)
+
+    def pop(self, now: float) -> List[Tuple[int, Optional[bytes], int, Optional[bytes]]]:
+        """
+        Packets which are due at now, in order: sequence number, data, samples and, for concealed packets without
+        data, the data of the packet after it if that's already here.
+        """
+        packets = []
+        while self._next is not None and now >= self._playout:
+            sequence = self._next
+            self._playing = True
+            packet = self._packets.pop(sequence, None)
+            if packet is not None:
+                data, samples, terminator = packet
+                self._step = max(samples // FRAME_SAMPLES, 1)
+                self._concealed = 0
+                packets.append((sequence, data, samples, None))
+                if terminator:
+                    self.__silence(now)
+                    continue
+            elif not self._packets and self._concealed >= self.max_concealed:
+                # Nothing came in for a while, wait for the speaker to start again
+                self.__silence(now)
+                continue
+            else:
+                self._concealed += 1
+                self.lost += 1
+                following = self._packets.get(sequence + self._step)
+                packets.append((sequence, None, self._step * FRAME_SAMPLES, following[0] if following else None))
+            self._next = sequence + self._step
+            self._playout += self._step * FRAME_DURATION
+        return packets
+
+    def __silence(self, now: float) -> None:
+        """The speaker stopped, play whatever already arrived of what they said next after the delay."""
+        self._concealed = 0
+        self._playing = False
+        if self._packets:
+            self._next = min(self._packets)
+            self._playout = now + self.delay
+        else:
+            self._next = None
+
+    def time_until_ready(self, now: float) -> Optional[float]:
+        """Seconds before the next packet is due, None while the speaker is silent."""
+        if self._next is None:
+            return None
+        return max(self._playout - now, 0.0)
+
+    def reset(self) -> None:
+        """"""
+        self._packets.clear()
+        self._next = None
+        self._step = 1
+        self._concealed = 0
+        self._playing = False
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+import time
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from wspr.channel import ROOT_CHANNEL
+from wspr.state import ServerState
+from wspr.voice.opus import SAMPLE_RATE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Gains are applied in fixed point with this many fractional bits, so mixing never leaves integers
+GAIN_BITS = 8
+
+
+class SpeakerBuffer:
+    """Ring of decoded samples of a single speaker, waiting to be mixed."""
+
+    def __init__(self, capacity: int):
+        """Capacity in samples, the oldest samples are overwritten when it's full."""
+        self.samples: 'numpy.ndarray' = numpy.zeros(capacity, dtype=numpy.int16)
+        self._read: int = 0
+        self._size: int = 0
+        # Fixed point gain, None for unity gain
+        self.gain: Optional[int] = None
+
+    def __len__(self) -> int:
+        """Samples waiting to be mixed."""
+        return self._size
+
+    def write(self, pcm: bytes) -> None:
+        """Append 16 bit native endian PCM."""
+        data = numpy.frombuffer(pcm, dtype=numpy.int16)
+        capacity = len(self.samples)
+        if len(data) > capacity:
+            data = data[-capacity:]
+        overflow = self._size + len(data) - capacity
+        if overflow > 0:
+            # Too far behind, drop the oldest samples
+            self._read = (self._read + overflow) % capacity
+            self._size -= overflow
+        start = (self._read + self._size) % capacity
+        first = min(len(data), capacity - start)
+        self.samples[start:start + first] = data[:first]
+        self.samples[:len(data) - first] = data[first:]
+        self._size += len(data)
+
+    def mix_into(self, accumulator: 'numpy.ndarray', scratch: 'numpy.ndarray') -> int:
+        """Add up to a frame of samples to the accumulator and consume them, returns the number of samples."""
+        count = min(self._size, len(accumulator))
+        capacity = len(self.samples)
+        first = min(count, capacity - self._read)
+        self.__add(accumulator[:first], self.samples[self._read:self._read + first], scratch[:first])
+        if count > first:
+            self.__add(accumulator[first:count], self.samples[:count - first], scratch[first:count])
+        self._read = (self._read + count) % capacity
+        self._size -= count
+        return count
+
+    def skip(self, count: int) -> None:
+        """Consume up to count samples without mixing them."""
+        count = min(self._size, count)
+        self._read = (self._read + count) % len(self.samples)
+        self._size -= count
+
+    def __add(self, accumulator: 'numpy.ndarray', samples: 'numpy.ndarray', scratch: 'numpy.ndarray') -> None:
+        """"""
+        if self.gain is None:
+            numpy.add(accumulator, samples, out=accumulator)
+        else:
+            numpy.multiply(samples, self.gain, out=scratch, dtype=numpy.int32)
+            numpy.right_shift(scratch, GAIN_BITS, out=scratch)
+            numpy.add(accumulator, scratch, out=accumulator)
+
+
+class Mixer:
+    """
+    Mixes decoded voice of everyone in a channel into a single stream per channel.
+    Frames are summed in 32 bit integers and clipped to 16 bit. Every speaker and every channel gets its arrays once,
+    mixing a frame allocates nothing, no matter how many people speak at once.
+    Output frames are produced at a fixed pace off the monotonic clock.
+    """
+
+    # Ticks which are more than this many frames late are skipped instead of mixed in a burst
+    MAX_LATE_FRAMES = 5
+
+    def __init__(self, state: ServerState, callback: Callable[[int, 'numpy.ndarray'], None],
+                 frame_duration: float = 0.02, channels: Optional[Iterable[int]] = None, buffer_duration: float = 1.0):
+        """
+        Mixed frames are handed to the callback along with the channel id. The frame array is reused for the next
+        frame, copy it to keep it. Users are put in their channel using state.
+        Without channels, every channel someone speaks in is mixed. With them, only those are mixed, and they get a
+        frame every tick, silent or not.
+        Every speaker buffers up to buffer duration seconds.
+        """
+        if numpy is None:
+            raise RuntimeError("Mixing voice requires numpy")
+        self.state: ServerState = state
+        self.callback: Callable[[int, 'numpy.ndarray'], None] = callback
+        self.frame_duration: float = frame_duration
+        self.frame_samples: int = int(SAMPLE_RATE * frame_duration)
+        self.channels: Optional[Set[int]] = set(channels) if channels is not None else None
+        self._buffer_samples: int = int(SAMPLE_RATE * buffer_duration)
+        self._speakers: Dict[int, SpeakerBuffer] = {}
+        self._gains: Dict[int, float] = {}
+        # Sum and output of every channel, and room to apply gains in
+        self._accumulators: Dict[int, 'numpy.ndarray'] = {}
+        self._outputs: Dict[int, 'numpy.ndarray'] = {}
+        self._scratch: 'numpy.ndarray' = numpy.zeros(self.frame_samples, dtype=numpy.int32)
+        # When the next frame is due, None until someone speaks
+        self._next: Optional[float] = None
+
+    def set_gain(self, session: int, gain: float) -> None:
+        """Volume of a user, 1.0 leaves it as it is."""
+        self._gains[session] = gain
+        speaker = self._speakers.get(session)
+        if speaker is not None:
+            speaker.gain = self.__fixed_point(gain)
+
+    @staticmethod
+    def __fixed_point(gain: Optional[float]) -> Optional[int]:
+        """"""
+        if gain is None or gain == 1.0:
+            return None
+        return int(round(gain * (1 << GAIN_BITS)))
+
+    def add(self, session: int, pcm: bytes) -> None:
+        """Decoded 16 bit mono PCM of a user, e.g. from VoiceReceivedEvent."""
+        speaker = self._speakers.get(session)
+        if speaker is None:
+            speaker = self._speakers[session] = SpeakerBuffer(self._buffer_samples)
+            speaker.gain = self.__fixed_point(self._gains.get(session))
+        speaker.write(pcm)
+        if self._next is None:
+            self._next = time.monotonic()
+
+    def remove(self, session: int) -> None:
+        """The user left."""
+        self._speakers.pop(session, None)
+        self._gains.pop(session, None)
+
+    def time_until_mix(self) -> Optional[float]:
+        """Seconds before the next frame is due, None while nobody speaks."""
+        if self._next is None:
+            return None
+        return max(self._next - time.monotonic(), 0.0)
+
+    def __arrays(self, channel_id: int):
+        """"""
+        accumulator = self._accumulators.get(channel_id)
+        if accumulator is None:
+            accumulator = self._accumulators[channel_id] = numpy.zeros(self.frame_samples, dtype=numpy.int32)
+            self._outputs[channel_id] = numpy.zeros(self.frame_samples, dtype=numpy.int16)
+        return accumulator
+
+    def mix(self) -> None:
+        """Mix a single frame of every channel and hand them to the callback."""
+        mixed = set()
+        for session, speaker in self._speakers.items():
+            if not speaker:
+                continue
+            user = self.state.users.get(session)
+            if user is None:
+                channel_id = None
+            else:
+                channel_id = user.channel_id if user.channel_id is not None else ROOT_CHANNEL
+            if channel_id is None or (self.channels is not None and channel_id not in self.channels):
+                # Nobody listens to this speaker, keep pace anyway
+                speaker.skip(self.frame_samples)
+                continue
+            accumulator = self.__arrays(channel_id)
+            if channel_id not in mixed:
+                accumulator.fill(0)
+                mixed.add(channel_id)
+            speaker.mix_into(accumulator, self._scratch)
+        for channel_id in self.channels or ():
+            if channel_id not in mixed:
+                self.__arrays(channel_id).fill(0)
+                mixed.add(channel_id)
+        for channel_id in mixed:
+            accumulator = self._accumulators[channel_id]
+            output = self._outputs[channel_id]
+            numpy.clip(accumulator, -32768, 32767, out=accumulator)
+            numpy.copyto(output, accumulator, casting='unsafe')
+            self.callback(channel_id, output)
+
+    def poll(self) -> int:
+        """Mix the frames which are due, returns the number of frames mixed."""
+        if self._next is None:
+            return 0
+        now = time.monotonic()
+        late = int((now - self._next) / self.frame_duration)
+        if late > self.MAX_LATE_FRAMES:
+            self._next += (late - self.MAX_LATE_FRAMES) * self.frame_duration
+        frames = 0
+        while self._next <= now:
+            self.mix()
+            frames += 1
+            self._next += self.frame_duration
+        if self.channels is None and not any(self._speakers.values()):
+            # Everyone stopped speaking, start the clock again with the next one who does
+            self._next = None
+        return frames
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import zlib
+from typing import BinaryIO, Dict, List
+
+from wspr.voice.opus import CHANNELS, SAMPLE_RATE
+
+# Opus in Ogg, https://tools.ietf.org/html/rfc7845
+
+PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+OPUS_HEAD = struct.Struct("<8sBBHIhB")
+CONTINUED = 0x01
+FIRST_PAGE = 0x02
+LAST_PAGE = 0x04
+
+# Bits of every byte in reverse order
+_REVERSED = bytes(int("{:08b}".format(byte)[::-1], 2) for byte in range(256))
+
+
+def ogg_crc(data: bytes) -> int:
+    """
+    CRC-32 of Ogg pages: polynomial 0x04C11DB7, no reflection, no final xor.
+    That's zlib's reflected CRC-32 on bit reversed bytes, reversed again, which is a lot faster than a table in Python.
+    """
+    state = ~zlib.crc32(data.translate(_REVERSED), 0xFFFFFFFF) & 0xFFFFFFFF
+    return int("{:032b}".format(state)[::-1], 2)
+
+
+class OggOpusWriter:
+    """
+    Writes Opus packets as they came from the server into an Ogg Opus stream, without decoding them.
+    Packets are gathered into pages of about a second, which keeps the overhead of the container low.
+    """
+
+    # Samples the decoder drops at the start, the usual lookahead of libopus
+    PRE_SKIP = 312
+    # Close a page once it holds this many samples or bytes
+    PAGE_SAMPLES = SAMPLE_RATE
+    PAGE_SIZE = 8 * 1024
+
+    def __init__(self, stream: BinaryIO, serial: int, tags: Dict[str, str], vendor: str = "wspr"):
+        """Tags are Vorbis comments, like TITLE or ARTIST."""
+        self._stream: BinaryIO = stream
+        self._serial: int = serial & 0xFFFFFFFF
+        self._sequence: int = 0
+        # Samples of every packet written so far
+        self.granule: int = 0
+        self._segments: List[int] = []
+        self._packets: List[bytes] = []
+        self._page_size: int = 0
+        self._page_start: int = 0
+        # Bytes written to the stream
+        self.size: int = 0
+        head = OPUS_HEAD.pack(b"OpusHead", 1, CHANNELS, self.PRE_SKIP, SAMPLE_RATE, 0, 0)
+        self.__page([head], FIRST_PAGE, 0)
+        comments = [self.__string("{}={}".format(key, value)) for key, value in tags.items()]
+        opus_tags = b"".join([b"OpusTags", self.__string(vendor), struct.pack("<I", len(comments))] + comments)
+        self.__page([opus_tags], 0, 0)
+
+    @staticmethod
+    def __string(text: str) -> bytes:
+        """"""
+        data = text.encode("utf-8")
+        return struct.pack("<I", len(data)) + data
+
+    @staticmethod
+    def __lacing(size: int) -> List[int]:
+        """Segment sizes of a packet of that many bytes."""
+        return [255] * (size // 255) + [size % 255]
+
+    def __page(self, packets: List[bytes], flags: int, granule: int) -> None:
+        """Write a page holding whole packets."""
+        segments = [segment for packet in packets for segment in self.__lacing(len(packet))]
+        header = PAGE_HEADER.pack(b"OggS", 0, flags, granule, self._serial, self._sequence, 0, len(segments))
+        page = bytearray(header)
+        page += bytes(segments)
+        for packet in packets:
+            page += packet
+        struct.pack_into("<I", page, 22, ogg_crc(bytes(page)))
+        self._stream.write(page)
+        self._sequence += 1
+        self.size += len(page)
+
+    def write(self, packet: bytes, samples: int) -> None:
+        """Add an Opus packet which decodes to that many samples."""
+        lacing = len(packet) // 255 + 1
+        if len(self._segments) + lacing > 255:
+            self.flush()
+        self._segments.extend(self.__lacing(len(packet)))
+        self._packets.append(packet)
+        self._page_size += len(packet)
+        self.granule += samples
+        if self._page_size >= self.PAGE_SIZE or self.granule - self._page_start >= self.PAGE_SAMPLES:
+            self.flush()
+
+    def flush(self, last: bool = False) -> None:
+        """Write the packets gathered so far as a page."""
+        if not self._packets and not last:
+            return
+        self.__page(self._packets, LAST_PAGE if last else 0, self.granule)
+        self._segments = []
+        self._packets = []
+        self._page_size = 0
+        self._page_start = self.granule
+
+    def close(self) -> None:
+        """Write the last page, the stream itself is left open."""
+        self.flush(last=True)
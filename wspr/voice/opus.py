@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import ctypes
+from typing import Optional
+
+from wspr.exceptions.client import InvalidSoundDataError
+from wspr.exceptions.exceptions import InvalidFormatError
+
+try:
+    import opuslib
+    import opuslib.api
+    from opuslib.api import ctl as opus_ctl
+    from opuslib.api import decoder as opus_decoder
+    from opuslib.api import encoder as opus_encoder
+except Exception:
+    # Besides ImportError, opuslib raises a plain Exception when libopus itself can't be found
+    opuslib = None
+
+
+# Mumble sends mono Opus at 48 kHz, sequence numbers count frames of 10 ms
+SAMPLE_RATE = 48000
+CHANNELS = 1
+FRAME_SAMPLES = 480
+# Longest packet Opus produces: 120 ms
+MAX_PACKET_SAMPLES = 5760
+SAMPLE_SIZE = 2
+# Largest encoded packet we accept from the encoder, in bytes
+MAX_ENCODED_SIZE = 1275
+# Bitrates Opus supports, in bit/s
+MIN_BITRATE = 6000
+MAX_BITRATE = 510000
+
+# Duration of an Opus frame in 2.5 ms units by configuration, see RFC 6716 section 3.1
+_FRAME_DURATIONS = [4, 8, 16, 24] * 3 + [4, 8] * 2 + [1, 2, 4, 8] * 4
+
+
+def is_available() -> bool:
+    """Whether opuslib and libopus are installed."""
+    return opuslib is not None
+
+
+def packet_samples(data: bytes) -> int:
+    """Samples per channel in an Opus packet at 48 kHz, read from its table of contents byte. 0 when invalid."""
+    if not data:
+        return 0
+    toc = data[0]
+    code = toc & 0x03
+    if code == 0:
+        frames = 1
+    elif code in (1, 2):
+        frames = 2
+    elif len(data) > 1:
+        frames = data[1] & 0x3F
+    else:
+        return 0
+    return frames * _FRAME_DURATIONS[toc >> 3] * SAMPLE_RATE // 400
+
+
+class OpusDecoder:
+    """
+    Decoder for the packets of a single speaker.
+    Decodes into a buffer which is allocated once, instead of the buffer, list and array opuslib makes per packet.
+    """
+
+    def __init__(self):
+        """"""
+        if opuslib is None:
+            raise RuntimeError("Decoding voice requires opuslib and libopus")
+        self._state = opus_decoder.create_state(SAMPLE_RATE, CHANNELS)
+        self._pcm = (ctypes.c_int16 * (MAX_PACKET_SAMPLES * CHANNELS))()
+        self._pointer = ctypes.cast(self._pcm, opuslib.api.c_int16_pointer)
+
+    def __decode(self, data: Optional[bytes], samples: int, fec: bool) -> bytes:
+        """"""
+        result = opus_decoder.libopus_decode(self._state, data, len(data) if data else 0, self._pointer, samples,
+                                             int(fec))
+        if result < 0:
+            raise InvalidFormatError(result)
+        return ctypes.string_at(self._pcm, result * CHANNELS * SAMPLE_SIZE)
+
+    def decode(self, data: bytes) -> bytes:
+        """16 bit native endian PCM of a packet."""
+        return self.__decode(data, MAX_PACKET_SAMPLES, False)
+
+    def conceal(self, samples: int, next_data: Optional[bytes] = None) -> bytes:
+        """
+        PCM standing in for a lost packet of that many samples.
+        With the packet after it, it's recovered from the forward error correction data in there when possible.
+        """
+        return self.__decode(next_data, samples, next_data is not None)
+
+    def reset(self) -> None:
+        """Forget the previous speaker, so the decoder can be reused for another one."""
+        opus_decoder.decoder_ctl(self._state, opus_ctl.reset_state)
+
+    def __del__(self):
+        """"""
+        if getattr(self, '_state', None) is not None:
+            opus_decoder.destroy(self._state)
+
+
+class OpusEncoder:
+    """Encoder for what we say, encodes into a buffer which is allocated once."""
+
+    def __init__(self, bitrate: int = 40000, application: str = 'voip'):
+        """Application is voip, audio or restricted_lowdelay, see opus_encoder_create."""
+        if opuslib is None:
+            raise RuntimeError("Encoding voice requires opuslib and libopus")
+        self._state = opus_encoder.create_state(SAMPLE_RATE, CHANNELS, opuslib.APPLICATION_TYPES_MAP[application])
+        self._data = (ctypes.c_char * MAX_ENCODED_SIZE)()
+        self.bitrate: int = 0
+        self.set_bitrate(bitrate)
+
+    def set_bitrate(self, bitrate: int) -> None:
+        """Bitrate in bit/s."""
+        bitrate = min(max(bitrate, MIN_BITRATE), MAX_BITRATE)
+        if bitrate != self.bitrate:
+            opus_encoder.encoder_ctl(self._state, opus_ctl.set_bitrate, bitrate)
+            self.bitrate = bitrate
+
+    def encode(self, pcm: bytes) -> bytes:
+        """Encode 16 bit native endian PCM, which has to be 2.5, 5, 10, 20, 40 or 60 ms long."""
+        samples = len(pcm) // (SAMPLE_SIZE * CHANNELS)
+        pointer = ctypes.cast(ctypes.c_char_p(pcm), opuslib.api.c_int16_pointer)
+        result = opus_encoder.libopus_encode(self._state, pointer, samples, self._data, MAX_ENCODED_SIZE)
+        if result < 0:
+            raise InvalidSoundDataError(result)
+        return ctypes.string_at(self._data, result)
+
+    def reset(self) -> None:
+        """"""
+        opus_encoder.encoder_ctl(self._state, opus_ctl.reset_state)
+
+    def __del__(self):
+        """"""
+        if getattr(self, '_state', None) is not None:
+            opus_encoder.destroy(self._state)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import enum
+from array import array
+from typing import Optional, Sequence
+
+from wspr.exceptions.exceptions import InvalidFormatError, InvalidVarInt
+from wspr.protocol.varint import decode_varint, decode_varints
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Voice packets as the server sends them, tunnelled or over UDP
+# https://mumble-protocol.readthedocs.io/en/latest/voice_data.html#packet-format
+
+
+class VoiceType(enum.IntEnum):
+    """Type of a voice packet, in the three highest bits of its first byte."""
+    CELT_ALPHA = 0
+    PING = 1
+    SPEEX = 2
+    CELT_BETA = 3
+    OPUS = 4
+
+
+# Opus frames are prefixed by a varint: the size in the lowest 13 bits and a bit marking the last frame
+OPUS_SIZE_MASK = 0x1FFF
+OPUS_TERMINATOR = 0x2000
+# Other codecs prefix every frame by a byte: the size in the lowest 7 bits and a bit marking more frames follow
+FRAME_SIZE_MASK = 0x7F
+FRAME_CONTINUATION = 0x80
+
+
+class VoicePacket:
+    """Header of a single voice packet, and where its first frame is."""
+
+    __slots__ = ('type', 'target', 'session', 'sequence', 'length', 'terminator', 'offset')
+
+    def __init__(self, voice_type: VoiceType, target: int, session: int, sequence: int, length: int,
+                 terminator: bool, offset: int):
+        """Offset is where the frame starts in the packet, length its size in bytes."""
+        self.type: VoiceType = voice_type
+        self.target: int = target
+        self.session: int = session
+        self.sequence: int = sequence
+        self.length: int = length
+        self.terminator: bool = terminator
+        self.offset: int = offset
+
+    def __repr__(self) -> str:
+        """"""
+        return "VoicePacket({}, session={}, sequence={}, length={})".format(
+            self.type.name, self.session, self.sequence, self.length)
+
+
+def parse_voice_packet(data: bytes) -> VoicePacket:
+    """Header of a voice packet sent by the server, raises InvalidFormatError when it's truncated or a ping."""
+    header = data[0] if data else VoiceType.PING << 5
+    try:
+        voice_type = VoiceType(header >> 5)
+    except ValueError:
+        raise InvalidFormatError(bytes(data[:1]))
+    if voice_type == VoiceType.PING:
+        raise InvalidFormatError(bytes(data[:1]))
+    try:
+        session, offset = decode_varint(data, 1)
+        sequence, offset = decode_varint(data, offset)
+        if voice_type == VoiceType.OPUS:
+            size, offset = decode_varint(data, offset)
+            length, terminator = size & OPUS_SIZE_MASK, bool(size & OPUS_TERMINATOR)
+        else:
+            size, offset = data[offset], offset + 1
+            length, terminator = size & FRAME_SIZE_MASK, not size & FRAME_CONTINUATION
+    except (InvalidVarInt, IndexError):
+        raise InvalidFormatError(bytes(data))
+    if offset + length > len(data):
+        raise InvalidFormatError(bytes(data))
+    return VoicePacket(voice_type, header & 0x1F, session, sequence, length, terminator, offset)
+
+
+class VoiceHeaders:
+    """
+    Headers of many voice packets at once, decoded into columns which are allocated once and reused.
+    Rows of packets which are truncated or aren't voice (pings) are marked invalid.
+    With NumPy the columns are arrays and packets are decoded in a single vectorized pass.
+    """
+
+    # Columns with their NumPy type, and their type code for array when NumPy isn't there
+    COLUMNS = (
+        ('type', 'uint8', 'B'),
+        ('target', 'uint8', 'B'),
+        ('session', 'int64', 'q'),
+        ('sequence', 'int64', 'q'),
+        ('length', 'int64', 'q'),
+        ('terminator', 'bool', 'B'),
+        ('offset', 'int64', 'q'),
+        ('valid', 'bool', 'B'),
+    )
+
+    def __init__(self, capacity: int = 256):
+        """Capacity is the number of packets the columns hold before they have to grow."""
+        self.capacity: int = 0
+        # Packets decoded by the last call to decode
+        self.count: int = 0
+        self.__allocate(capacity)
+
+    def __allocate(self, capacity: int) -> None:
+        """"""
+        self.capacity = capacity
+        for name, dtype, type_code in self.COLUMNS:
+            if numpy is not None:
+                column = numpy.zeros(capacity, dtype=dtype)
+            else:
+                column = array(type_code, bytes(capacity * array(type_code).itemsize))
+            setattr(self, name, column)
+
+    def decode(self, packets: Sequence[bytes]) -> int:
+        """Decode the headers of the packets into the first rows of the columns, returns the number of packets."""
+        if len(packets) > self.capacity:
+            self.__allocate(max(len(packets), self.capacity * 2))
+        self.count = len(packets)
+        if numpy is None:
+            for row, data in enumerate(packets):
+                self.__decode_one(row, data)
+        elif packets:
+            self.__decode_numpy(packets)
+        return self.count
+
+    def __decode_one(self, row: int, data: bytes) -> None:
+        """"""
+        try:
+            packet = parse_voice_packet(data)
+        except InvalidFormatError:
+            self.valid[row] = False
+            return
+        self.type[row] = packet.type
+        self.target[row] = packet.target
+        self.session[row] = packet.session
+        self.sequence[row] = packet.sequence
+        self.length[row] = packet.length
+        self.terminator[row] = packet.terminator
+        self.offset[row] = packet.offset
+        self.valid[row] = True
+
+    def __decode_numpy(self, packets: Sequence[bytes]) -> None:
+        """"""
+        count = len(packets)
+        sizes = numpy.fromiter((len(data) for data in packets), dtype=numpy.int64, count=count)
+        starts = numpy.zeros(count, dtype=numpy.int64)
+        numpy.cumsum(sizes[:-1], out=starts[1:])
+        ends = starts + sizes
+        buffer = numpy.frombuffer(b"".join(packets), dtype=numpy.uint8)
+        # Zero sized packets read the byte after them, padding keeps that in bounds
+        header = numpy.append(buffer, numpy.uint8(0))[starts].astype(numpy.int64)
+        header[sizes == 0] = VoiceType.PING << 5
+
+        session, offsets = decode_varints(buffer, starts + 1)
+        sequence, offsets = decode_varints(buffer, offsets)
+        voice_type = header >> 5
+        opus = voice_type == VoiceType.OPUS
+        size, opus_offsets = decode_varints(buffer, offsets)
+        # Other codecs have a plain byte, which reads the same as a varint up to 127
+        size_byte = numpy.append(buffer, numpy.uint8(0))[numpy.minimum(offsets, len(buffer))].astype(numpy.int64)
+        length = numpy.where(opus, size & OPUS_SIZE_MASK, size_byte & FRAME_SIZE_MASK)
+        terminator = numpy.where(opus, size & OPUS_TERMINATOR != 0, size_byte & FRAME_CONTINUATION == 0)
+        offsets = numpy.where(opus, opus_offsets, offsets + 1)
+
+        valid = (voice_type != VoiceType.PING) & (voice_type <= VoiceType.OPUS) & (offsets + length <= ends)
+        self.type[:count] = voice_type
+        self.target[:count] = header & 0x1F
+        self.session[:count] = session
+        self.sequence[:count] = sequence
+        self.length[:count] = length
+        self.terminator[:count] = terminator
+        # Relative to the start of every packet, like the scalar parser
+        self.offset[:count] = offsets - starts
+        self.valid[:count] = valid
+
+    def __getitem__(self, row: int) -> Optional[VoicePacket]:
+        """Header of a decoded packet, None when it was invalid."""
+        if not 0 <= row < self.count:
+            raise IndexError(row)
+        if not self.valid[row]:
+            return None
+        return VoicePacket(VoiceType(int(self.type[row])), int(self.target[row]), int(self.session[row]),
+                           int(self.sequence[row]), int(self.length[row]), bool(self.terminator[row]),
+                           int(self.offset[row]))
+
+    def __len__(self) -> int:
+        """"""
+        return self.count
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+
+from wspr.control.events import VoiceReceivedEvent
+from wspr.exceptions.exceptions import InvalidFormatError
+from wspr.voice.jitter import FRAME_DURATION, JitterBuffer
+from wspr.voice.opus import FRAME_SAMPLES, OpusDecoder, packet_samples
+from wspr.voice.packet import VoiceHeaders, VoiceType
+
+
+class VoiceReceiver:
+    """
+    Turns incoming voice packets into a clean PCM stream per speaker.
+    Packets are collected as they arrive, their headers are decoded in batches and they go through a jitter buffer
+    per speaker. Decoding happens on a pool of worker threads, every speaker sticks to one of them so its packets
+    are decoded in order. Decoders of speakers who left are reset and reused.
+    Use one per connection, call poll whenever time_until_poll says so.
+    """
+
+    def __init__(self, workers: int = 2, delay: float = 0.06, max_packets: int = 50,
+                 callback: Optional[Callable[[VoiceReceivedEvent], None]] = None,
+                 decoder_factory: Callable = OpusDecoder):
+        """
+        Delay is the time in seconds packets are buffered before they're played, see JitterBuffer.
+        With a callback, decoded audio is handed to it right away on a worker thread instead of becoming events.
+        """
+        self._logger: logging.Logger = logging.getLogger('whisper')
+        self.workers: int = workers
+        self.delay: float = delay
+        self.max_packets: int = max_packets
+        self.callback: Optional[Callable[[VoiceReceivedEvent], None]] = callback
+        self._decoder_factory: Callable = decoder_factory
+        # Raw packets since the last poll
+        self._incoming: List[bytes] = []
+        self._headers: VoiceHeaders = VoiceHeaders()
+        self.buffers: Dict[int, JitterBuffer] = {}
+        self._unsupported: Set[int] = set()
+        # Decoded audio waiting for the next poll, filled by the workers
+        self._decoded: deque = deque()
+        # Threads are only started once there's something to decode, the receiver may be moved to another process
+        self._executors: List[ThreadPoolExecutor] = []
+        self._decoders: Dict[int, object] = {}
+        self._free_decoders: List = []
+        self._lock: Optional[threading.Lock] = None
+        # Packets handed to the workers which they haven't decoded yet
+        self._in_progress: int = 0
+
+    def add(self, packet: bytes) -> None:
+        """Voice packet as sent by the server, tunnelled or over UDP."""
+        self._incoming.append(packet)
+
+    def __buffer(self, session: int) -> JitterBuffer:
+        """"""
+        buffer = self.buffers.get(session)
+        if buffer is None:
+            buffer = self.buffers[session] = JitterBuffer(self.delay, self.max_packets)
+        return buffer
+
+    def __sort(self, now: float) -> None:
+        """Move the packets which came in into the jitter buffers of their speakers."""
+        packets, self._incoming = self._incoming, []
+        headers = self._headers
+        headers.decode(packets)
+        for row, data in enumerate(packets):
+            if not headers.valid[row]:
+                continue
+            session = int(headers.session[row])
+            if headers.type[row] != VoiceType.OPUS:
+                if session not in self._unsupported:
+                    self._unsupported.add(session)
+                    self._logger.debug("Ignoring %s voice of %s", VoiceType(int(headers.type[row])).name, session)
+                continue
+            start = int(headers.offset[row])
+            frame = data[start:start + int(headers.length[row])]
+            self.__buffer(session).push(int(headers.sequence[row]), frame, packet_samples(frame),
+                                        bool(headers.terminator[row]), now)
+
+    def poll(self, r) -> None:
+        """Decode what's due on the workers and hand what they decoded since the last poll to the consumer."""
+        now = time.monotonic()
+        if self._incoming:
+            self.__sort(now)
+        for session, buffer in self.buffers.items():
+            if buffer.time_until_ready(now) == 0.0:
+                packets = buffer.pop(now)
+                if packets:
+                    self.__submit(session, self.__decode, session, packets)
+                    with self._lock:
+                        self._in_progress += len(packets)
+        while self._decoded:
+            r.put(self._decoded.popleft())
+
+    def __submit(self, session: int, function: Callable, *args) -> None:
+        """Run on the worker of the speaker."""
+        if not self._executors:
+            self._lock = threading.Lock()
+            self._executors = [ThreadPoolExecutor(1, "whisper-voice-{}".format(i)) for i in range(self.workers)]
+        self._executors[session % len(self._executors)].submit(function, *args)
+
+    def __decoder(self, session: int):
+        """Decoder of the speaker, a reused one if there is one."""
+        decoder = self._decoders.get(session)
+        if decoder is None:
+            with self._lock:
+                decoder = self._free_decoders.pop() if self._free_decoders else None
+            if decoder is None:
+                decoder = self._decoder_factory()
+            self._decoders[session] = decoder
+        return decoder
+
+    def __decode(self, session: int, packets: List) -> None:
+        """Runs on a worker."""
+        try:
+            decoder = self.__decoder(session)
+            for sequence, data, samples, next_data in packets:
+                concealed = data is None
+                if not concealed and not data:
+                    # Terminator without audio
+                    continue
+                try:
+                    pcm = decoder.conceal(samples, next_data) if concealed else decoder.decode(data)
+                except InvalidFormatError as ex:
+                    self._logger.debug("Voice of %s #%d can't be decoded: %s", session, sequence, ex)
+                    pcm, concealed = decoder.conceal(samples or FRAME_SAMPLES), True
+                event = VoiceReceivedEvent(session, sequence, pcm, concealed)
+                if self.callback is not None:
+                    self.callback(event)
+                else:
+                    self._decoded.append(event)
+        except Exception as ex:
+            # Nobody would ever hear of it otherwise
+            self._logger.exception(ex)
+        finally:
+            with self._lock:
+                self._in_progress -= len(packets)
+
+    def __release(self, session: int) -> None:
+        """Runs on a worker."""
+        decoder = self._decoders.pop(session, None)
+        if decoder is not None:
+            decoder.reset()
+            with self._lock:
+                self._free_decoders.append(decoder)
+
+    def remove(self, session: int) -> None:
+        """The speaker left, their decoder goes back to the pool."""
+        self.buffers.pop(session, None)
+        self._unsupported.discard(session)
+        if self._executors:
+            self.__submit(session, self.__release, session)
+
+    def time_until_poll(self) -> Optional[float]:
+        """Seconds before poll has something to do, None while nobody is speaking."""
+        if self._incoming or self._decoded:
+            return 0.0
+        now = time.monotonic()
+        timeouts = [buffer.time_until_ready(now) for buffer in self.buffers.values()]
+        if self._in_progress:
+            # Come back for what the workers are decoding right now
+            timeouts.append(FRAME_DURATION)
+        return min((timeout for timeout in timeouts if timeout is not None), default=None)
+
+    def clear(self) -> None:
+        """Called on every new connection, sessions don't survive the connection they belong to."""
+        for session in list(self.buffers):
+            self.remove(session)
+        self._incoming.clear()
+
+    def close(self) -> None:
+        """Stop the workers after they decoded what they have."""
+        for executor in self._executors:
+            executor.shutdown()
+        self._executors = []
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import logging
+import queue
+import re
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+
+from wspr.control.events import VoiceReceivedEvent
+from wspr.exceptions.exceptions import InvalidFormatError
+from wspr.state import ServerState
+from wspr.voice.ogg import OggOpusWriter
+from wspr.voice.opus import FRAME_SAMPLES, SAMPLE_RATE, packet_samples
+from wspr.voice.packet import VoiceType, parse_voice_packet
+from wspr.voice.wav import WavWriter
+
+# Opus packets without audio, decoders fill them with silence: 10 and 20 ms CELT only
+SILENCE_10MS = b"\xF0"
+SILENCE_20MS = b"\xF8"
+
+
+class RecordingFormat(Enum):
+    """Format of the per session recordings, by file extension."""
+    OGG = "opus"
+    WAV = "wav"
+
+
+class Recording:
+    """A file being written, for a session or the mix of a channel."""
+
+    def __init__(self, path: Path, stream: BinaryIO, writer: Union[OggOpusWriter, WavWriter]):
+        """"""
+        self.path: Path = path
+        self.stream: BinaryIO = stream
+        self.writer: Union[OggOpusWriter, WavWriter] = writer
+        self.opened: float = time.monotonic()
+        # Sequence number expected next and when the audio written so far ends, Ogg only
+        self.next_sequence: Optional[int] = None
+        self.end: Optional[float] = None
+        self.terminated: bool = False
+
+    def close(self) -> None:
+        """"""
+        self.writer.close()
+        self.stream.close()
+
+
+class Recorder:
+    """
+    Records voice to disk, a file per session and optionally one per channel mix.
+    With Ogg, packets are stored as they came from the server, nothing is decoded or encoded again. Lost packets and
+    pauses in between what's said are filled with silence, so the recording keeps time.
+    With WAV, hand it decoded audio by making voice_received the callback of a VoiceReceiver.
+    Mixed channels from a Mixer are always WAV, make add_mixed its callback.
+    Files are written by a background thread with large buffers, anything given to the recorder is queued until
+    it's written, however slow the disk is. Files are rotated once they reach max size bytes or max duration seconds.
+    """
+
+    # Pauses longer than this many seconds aren't filled with silence
+    MAX_PAUSE = 3600.0
+    # Items the writer handles before it looks at the queue again
+    BATCH_SIZE = 1024
+
+    def __init__(self, directory: Union[str, Path], state: Optional[ServerState] = None,
+                 recording_format: RecordingFormat = RecordingFormat.OGG, max_size: Optional[int] = None,
+                 max_duration: Optional[float] = None, buffer_size: int = 1024 * 1024):
+        """
+        Names and channels of users are taken from state, the one of the client when it's not given.
+        Buffer size is the size of the write buffer of every file, in bytes.
+        """
+        self._logger: logging.Logger = logging.getLogger('whisper')
+        self.directory: Path = Path(directory)
+        self.state: Optional[ServerState] = state
+        self.format: RecordingFormat = recording_format
+        self.max_size: Optional[int] = max_size
+        self.max_duration: Optional[float] = max_duration
+        self.buffer_size: int = buffer_size
+        # Recordings the writer has been told about, by kind and session or channel id
+        self._known: set = set()
+        # Created on first use, the recorder may be moved to another process first
+        self._queue: Optional[queue.SimpleQueue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock: threading.Lock = threading.Lock()
+        # Only touched by the writer
+        self._recordings: Dict[Tuple[str, int], Recording] = {}
+        self._tags: Dict[Tuple[str, int], Dict[str, str]] = {}
+        self._files: int = 0
+
+    def __getstate__(self):
+        """Locks can't be pickled."""
+        state = self.__dict__.copy()
+        del state['_start_lock']
+        return state
+
+    def __setstate__(self, state):
+        """"""
+        self.__dict__.update(state)
+        self._start_lock = threading.Lock()
+
+    @property
+    def backlog(self) -> int:
+        """Items waiting for the writer."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def __put(self, item: tuple) -> None:
+        """"""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self.directory.mkdir(parents=True, exist_ok=True)
+                    self._queue = queue.SimpleQueue()
+                    self._thread = threading.Thread(target=self.__write, name="whisper-recorder", daemon=True)
+                    self._thread.start()
+        self._queue.put(item)
+
+    def __announce(self, key: Tuple[str, int]) -> None:
+        """Tell the writer what to put in the metadata of a new recording, while we may still read the state."""
+        if key in self._known:
+            return
+        self._known.add(key)
+        kind, key_id = key
+        tags = {"DATE": datetime.datetime.now().isoformat(timespec="seconds")}
+        channel_id = key_id
+        if kind == "session":
+            tags["SESSION"] = str(key_id)
+            user = self.state.users.get(key_id) if self.state is not None else None
+            if user is not None:
+                if user.name is not None:
+                    tags["ARTIST"] = tags["TITLE"] = user.name
+                if user.user_id is not None:
+                    tags["USER_ID"] = str(user.user_id)
+            channel_id = user.channel_id if user is not None else None
+        if channel_id is not None:
+            tags["CHANNEL_ID"] = str(channel_id)
+            channel = self.state.channels.get(channel_id) if self.state is not None else None
+            if channel is not None and channel.name is not None:
+                tags["CHANNEL"] = channel.name
+                if kind == "channel":
+                    tags["TITLE"] = channel.name
+        self.__put(("tags", key, tags))
+
+    def add_packet(self, packet: bytes) -> None:
+        """Voice packet as sent by the server, tunnelled or over UDP. Only recorded with Ogg."""
+        if self.format != RecordingFormat.OGG:
+            return
+        try:
+            header = parse_voice_packet(packet)
+        except InvalidFormatError:
+            return
+        if header.type != VoiceType.OPUS:
+            return
+        key = ("session", header.session)
+        self.__announce(key)
+        frame = packet[header.offset:header.offset + header.length]
+        self.__put(("opus", key, header.sequence, frame, header.terminator, time.monotonic()))
+
+    def voice_received(self, event: VoiceReceivedEvent) -> None:
+        """Decoded audio of a session. Only recorded with WAV."""
+        if self.format != RecordingFormat.WAV:
+            return
+        key = ("session", event.session)
+        self.__announce(key)
+        self.__put(("pcm", key, event.pcm))
+
+    def add_mixed(self, channel_id: int, frame) -> None:
+        """Mixed audio of a channel, as 16 bit PCM bytes or array."""
+        key = ("channel", channel_id)
+        self.__announce(key)
+        self.__put(("pcm", key, bytes(frame)))
+
+    def remove(self, session: int) -> None:
+        """The user left, finish their recording."""
+        key = ("session", session)
+        if key in self._known:
+            self._known.discard(key)
+            self.__put(("close", key))
+
+    def clear(self) -> None:
+        """Called on every new connection, sessions don't survive the connection they belong to."""
+        if self._thread is not None:
+            self._known.clear()
+            self.__put(("clear", None))
+
+    def close(self) -> None:
+        """Write everything that's queued and close the files."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._known.clear()
+
+    def __write(self) -> None:
+        """Runs on the writer thread."""
+        running = True
+        while running:
+            items = [self._queue.get()]
+            while len(items) < self.BATCH_SIZE:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in items:
+                if item is None:
+                    running = False
+                    break
+                try:
+                    self.__handle(item)
+                except Exception as ex:
+                    # Keep recording everything else
+                    self._logger.exception(ex)
+        for recording in self._recordings.values():
+            recording.close()
+        self._recordings.clear()
+
+    def __handle(self, item: tuple) -> None:
+        """"""
+        kind, key = item[0], item[1]
+        if kind == "tags":
+            self._tags[key] = item[2]
+        elif kind == "clear":
+            for recording in self._recordings.values():
+                recording.close()
+            self._recordings.clear()
+            self._tags.clear()
+        elif kind == "close":
+            recording = self._recordings.pop(key, None)
+            if recording is not None:
+                recording.close()
+            self._tags.pop(key, None)
+        elif kind == "pcm":
+            self.__recording(key, RecordingFormat.WAV).writer.write(item[2])
+        elif kind == "opus":
+            self.__write_opus(self.__recording(key, RecordingFormat.OGG), *item[2:])
+
+    def __recording(self, key: Tuple[str, int], recording_format: RecordingFormat) -> Recording:
+        """Recording to write to, a new file when there is none or it's time to rotate."""
+        recording = self._recordings.get(key)
+        if recording is not None and self.__rotate(recording):
+            recording.close()
+            recording = None
+        if recording is None:
+            recording = self._recordings[key] = self.__open(key, recording_format)
+        return recording
+
+    def __rotate(self, recording: Recording) -> bool:
+        """"""
+        if self.max_size is not None and recording.writer.size >= self.max_size:
+            return True
+        return self.max_duration is not None and time.monotonic() - recording.opened >= self.max_duration
+
+    def __open(self, key: Tuple[str, int], recording_format: RecordingFormat) -> Recording:
+        """"""
+        kind, key_id = key
+        tags = self._tags.get(key, {})
+        self._files += 1
+        name = re.sub(r"[^\w.-]+", "_", tags.get("TITLE", ""))
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        parts = [kind, str(key_id)] + ([name] if name else []) + [timestamp, str(self._files)]
+        path = self.directory / "{}.{}".format("-".join(parts), recording_format.value)
+        self._logger.debug("Recording to %s", path)
+        stream = open(str(path), "wb", buffering=self.buffer_size)
+        if recording_format == RecordingFormat.OGG:
+            writer = OggOpusWriter(stream, hash(key) ^ self._files, tags)
+        else:
+            writer = WavWriter(stream, tags)
+        return Recording(path, stream, writer)
+
+    def __write_opus(self, recording: Recording, sequence: int, frame: bytes, terminator: bool,
+                     arrival: float) -> None:
+        """"""
+        writer = recording.writer
+        if recording.next_sequence is not None:
+            if recording.terminated or sequence - recording.next_sequence > self.MAX_PAUSE * 100:
+                # A new sentence, or a jump in sequence numbers too large to believe, keep the pause as it was timed
+                silence = min(max(arrival - recording.end, 0.0), self.MAX_PAUSE)
+                self.__silence(writer, int(silence * 100))
+            elif sequence < recording.next_sequence:
+                # Late or repeated, its place has already been filled
+                return
+            else:
+                self.__silence(writer, sequence - recording.next_sequence)
+        samples = packet_samples(frame)
+        if samples:
+            writer.write(frame, samples)
+        recording.next_sequence = sequence + max(samples // FRAME_SAMPLES, 1)
+        recording.end = arrival + samples / SAMPLE_RATE
+        recording.terminated = terminator
+
+    @staticmethod
+    def __silence(writer: OggOpusWriter, frames: int) -> None:
+        """Fill that many 10 ms frames with silence."""
+        for _ in range(frames // 2):
+            writer.write(SILENCE_20MS, 2 * FRAME_SAMPLES)
+        if frames % 2:
+            writer.write(SILENCE_10MS, FRAME_SAMPLES)
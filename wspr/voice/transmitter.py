@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from array import array
+from typing import Callable, Optional, Union
+
+from wspr.exceptions.client import InvalidSoundDataError
+from wspr.protocol.varint import encode_varint
+from wspr.voice.opus import (
+    CHANNELS,
+    FRAME_SAMPLES,
+    MAX_BITRATE,
+    MIN_BITRATE,
+    SAMPLE_RATE,
+    SAMPLE_SIZE,
+    OpusEncoder,
+)
+from wspr.voice.packet import OPUS_TERMINATOR, VoiceType
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Frame durations Mumble clients send, in seconds
+FRAME_DURATIONS = (0.01, 0.02, 0.04)
+# Bytes every voice packet costs besides its audio: IP and UDP headers, encryption, header byte, sequence and size
+UDP_OVERHEAD = 20 + 8 + 4 + 1 + 2 + 2
+# Tunnelled packets have TCP, TLS and control message headers instead of UDP and encryption
+TCP_OVERHEAD = 20 + 20 + 29 + 6 + 1 + 2 + 2
+
+
+def bitrate_for_bandwidth(bandwidth: int, frame_duration: float, tunnelled: bool = False) -> int:
+    """Opus bitrate which, with the overhead of every packet, stays within the bandwidth. All in bit/s."""
+    overhead = (TCP_OVERHEAD if tunnelled else UDP_OVERHEAD) * 8 / frame_duration
+    return int(min(max(bandwidth - overhead, MIN_BITRATE), MAX_BITRATE))
+
+
+class VoiceTransmitter:
+    """
+    Sends PCM as Opus voice packets, one frame at a time at the pace it was recorded at.
+    Frames are timed off the monotonic clock, so they keep their pace no matter how often poll is called.
+    The bitrate follows the bandwidth of the connection. When the producer calls flush, or no more audio comes in for
+    a while after we ran out, the last packet marks the end of what was said.
+    """
+
+    # Frames which are more than this many frames late are dropped instead of sent in a burst
+    MAX_LATE_FRAMES = 5
+    # Frames to wait for more audio once we ran out, before what was said is taken to be over
+    GRACE_FRAMES = 2
+
+    def __init__(self, frame_duration: float = 0.02, target: int = 0, encoder_factory: Callable = OpusEncoder,
+                 max_buffered: float = 10.0):
+        """
+        Frame duration is 0.01, 0.02 or 0.04 seconds. Target 0 talks to the current channel, 31 is server loopback.
+        At most max buffered seconds of audio wait to be sent, adding more raises InvalidSoundDataError.
+        """
+        if frame_duration not in FRAME_DURATIONS:
+            raise ValueError("Frame duration must be one of {}".format(FRAME_DURATIONS))
+        self._logger: logging.Logger = logging.getLogger('whisper')
+        self.frame_duration: float = frame_duration
+        self.frame_samples: int = int(SAMPLE_RATE * frame_duration)
+        self.frame_size: int = self.frame_samples * CHANNELS * SAMPLE_SIZE
+        self.target: int = target
+        self.max_buffered: float = max_buffered
+        self._encoder_factory: Callable = encoder_factory
+        # Created on first use, the transmitter may be moved to another process first
+        self._encoder = None
+        self._pcm: bytearray = bytearray()
+        # Counts frames of 10 ms, like the sequence numbers of other clients
+        self.sequence: int = 0
+        # When the next frame is due, None while we're silent
+        self._next: Optional[float] = None
+        # The producer is done, what's left ends what was said without waiting for more
+        self._flushing: bool = False
+        self._bandwidth: Optional[int] = None
+        self._tunnelled: bool = False
+
+    def __len__(self) -> int:
+        """Bytes of PCM waiting to be sent."""
+        return len(self._pcm)
+
+    def add(self, pcm: Union[bytes, bytearray, memoryview, array, 'numpy.ndarray']) -> None:
+        """
+        Queue 16 bit mono PCM at 48 kHz: bytes in native byte order, an array of type h or a NumPy array.
+        NumPy arrays of floats are taken to be between -1 and 1.
+        """
+        if numpy is not None and isinstance(pcm, numpy.ndarray):
+            if pcm.ndim != 1:
+                raise InvalidSoundDataError("PCM has to be mono, got shape {}".format(pcm.shape))
+            if pcm.dtype.kind == 'f':
+                pcm = (numpy.clip(pcm, -1.0, 1.0) * 32767).astype(numpy.int16)
+            elif pcm.dtype != numpy.int16:
+                raise InvalidSoundDataError("PCM has to be 16 bit, got {}".format(pcm.dtype))
+            data = pcm.tobytes()
+        elif isinstance(pcm, array):
+            if pcm.typecode != 'h':
+                raise InvalidSoundDataError("PCM has to be 16 bit, got array of type {}".format(pcm.typecode))
+            data = pcm.tobytes()
+        elif isinstance(pcm, (bytes, bytearray, memoryview)):
+            data = pcm
+        else:
+            raise InvalidSoundDataError("Unsupported PCM type {}".format(type(pcm).__name__))
+        if len(data) % SAMPLE_SIZE:
+            raise InvalidSoundDataError("PCM has to be whole 16 bit samples, got {} bytes".format(len(data)))
+        if len(self._pcm) + len(data) > self.max_buffered * SAMPLE_RATE * SAMPLE_SIZE * CHANNELS:
+            raise InvalidSoundDataError("More than {} seconds of PCM waiting to be sent".format(self.max_buffered))
+        self._pcm += data
+
+    def flush(self) -> None:
+        """No more audio follows for now, the last packet marks the end of what was said right away."""
+        if self._pcm or self._next is not None:
+            self._flushing = True
+
+    def __starved(self) -> bool:
+        """Less than a frame left, while more audio might still come."""
+        return len(self._pcm) < self.frame_size and not self._flushing
+
+    def time_until_send(self) -> Optional[float]:
+        """Seconds before the next frame is due, None when there's nothing to send."""
+        if self._next is None:
+            return 0.0 if self._pcm else None
+        due = self._next
+        if self.__starved():
+            due += self.GRACE_FRAMES * self.frame_duration
+        return max(due - time.monotonic(), 0.0)
+
+    def __update_bitrate(self, connection) -> None:
+        """Follow the bandwidth we may use and whether packets go over UDP."""
+        tunnelled = not connection.media.is_udp_available()
+        if connection.bandwidth != self._bandwidth or tunnelled != self._tunnelled:
+            self._bandwidth = connection.bandwidth
+            self._tunnelled = tunnelled
+            bitrate = bitrate_for_bandwidth(connection.bandwidth, self.frame_duration, tunnelled)
+            self._logger.debug("Voice bitrate set to %d bit/s", bitrate)
+            self._encoder.set_bitrate(bitrate)
+
+    def poll(self, connection) -> int:
+        """Send the frames which are due, returns the number of packets sent."""
+        if self._next is None and not self._pcm:
+            return 0
+        now = time.monotonic()
+        if self._next is None:
+            self._next = now
+        elif now - self._next > self.MAX_LATE_FRAMES * self.frame_duration:
+            # We weren't called for a while, don't make up for it all at once
+            late = int((now - self._next) / self.frame_duration)
+            self._logger.debug("Dropping %d late voice frames", late)
+            del self._pcm[:late * self.frame_size]
+            self.sequence += late * self.frame_samples // FRAME_SAMPLES
+            self._next += late * self.frame_duration
+        if self._encoder is None:
+            self._encoder = self._encoder_factory()
+        self.__update_bitrate(connection)
+        sent = 0
+        while self._next is not None and self._next <= now:
+            if len(self._pcm) >= self.frame_size:
+                frame = bytes(self._pcm[:self.frame_size])
+                del self._pcm[:self.frame_size]
+                terminator = False
+            elif self.__starved() and now - self._next < self.GRACE_FRAMES * self.frame_duration:
+                # Out of audio, but more may be on its way, the frame is sent late when it comes
+                break
+            else:
+                # Out of audio for good, pad what's left with silence and mark it as the end
+                frame = bytes(self._pcm).ljust(self.frame_size, b"\0")
+                self._pcm.clear()
+                terminator = True
+            connection.send_voice(self.__packet(self._encoder.encode(frame), terminator))
+            sent += 1
+            self.sequence += self.frame_samples // FRAME_SAMPLES
+            if terminator:
+                self._next = None
+                self._flushing = False
+                self._encoder.reset()
+            else:
+                self._next += self.frame_duration
+        return sent
+
+    def __packet(self, data: bytes, terminator: bool) -> bytes:
+        """Voice packet as clients send it: no session, the server adds that."""
+        return b"".join((
+            bytes((VoiceType.OPUS << 5 | self.target,)),
+            encode_varint(self.sequence),
+            encode_varint(len(data) | (OPUS_TERMINATOR if terminator else 0)),
+            data,
+        ))
+
+    def clear(self) -> None:
+        """Drop what wasn't sent yet."""
+        self._pcm.clear()
+        self._next = None
+        self._flushing = False
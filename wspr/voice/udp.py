@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import socket
+import time
+from typing import List, Optional
+
+from wspr.exceptions.exceptions import InvalidVarInt
+from wspr.protocol.mumble_pb2 import CryptSetup
+from wspr.protocol.packet_type import PacketType
+from wspr.protocol.packets import UDPTunnelPacket
+from wspr.protocol.varint import decode_varint, encode_varint
+from wspr.voice.crypt import CryptState
+from wspr.voice.packet import VoiceType
+
+
+class MediaChannel:
+    """
+    Voice packets over UDP, encrypted with the keys from CryptSetup.
+    Falls back to tunnelling them through the control connection while UDP doesn't work.
+    """
+
+    # Seconds in between UDP pings
+    PING_INTERVAL = 5.0
+    # Seconds without an answer to our pings before we give up on UDP
+    PING_TIMEOUT = 15.0
+    # Seconds without a packet we could decrypt before we ask the server to resynchronize its nonce
+    RESYNC_TIMEOUT = 5.0
+
+    def __init__(self, connection, sock: Optional[socket.socket] = None):
+        """Without socket every voice packet goes through the control connection."""
+        self._logger: logging.Logger = logging.getLogger('whisper')
+        self._connection = connection
+        self.socket: Optional[socket.socket] = sock
+        self.crypt: CryptState = CryptState()
+        self._ping_sent: float = 0.0
+        self._ping_received: float = 0.0
+        self._resync_requested: float = 0.0
+        # Round trip time of the last UDP ping, in seconds
+        self.round_trip: Optional[float] = None
+
+    def setup(self, message: CryptSetup) -> None:
+        """Handle CryptSetup from the server: new keys, a new server nonce, or a request for our nonce."""
+        if message.HasField('key') and message.HasField('client_nonce') and message.HasField('server_nonce'):
+            self._logger.debug("Voice encryption set up")
+            self.crypt.set_key(message.key, message.client_nonce, message.server_nonce)
+            # Find out whether UDP works right away
+            self._ping_sent = 0.0
+        elif message.HasField('server_nonce'):
+            self._logger.debug("Voice decryption resynchronized")
+            self.crypt.set_decrypt_iv(message.server_nonce)
+        elif self.crypt.is_valid():
+            # The server lost track of our nonce
+            self._connection.send(PacketType.CRYPTSETUP, CryptSetup(client_nonce=bytes(self.crypt.encrypt_iv)))
+
+    def is_udp_available(self) -> bool:
+        """Whether the server answered our UDP pings recently."""
+        return (self.socket is not None and self.crypt.is_valid()
+                and time.monotonic() - self._ping_received < self.PING_TIMEOUT)
+
+    def time_until_ping(self) -> Optional[float]:
+        """Seconds before the next UDP ping, None when UDP isn't used."""
+        if self.socket is None or not self.crypt.is_valid():
+            return None
+        return max(self._ping_sent + self.PING_INTERVAL - time.monotonic(), 0.0)
+
+    def send_ping(self) -> None:
+        """Send an UDP ping when one is due, the answers tell whether UDP works."""
+        if self.time_until_ping() != 0.0:
+            return
+        now = time.monotonic()
+        self._ping_sent = now
+        timestamp = encode_varint(int(now * 1000))
+        self.__send_udp(bytes((VoiceType.PING << 5,)) + timestamp)
+
+    def __send_udp(self, plain: bytes) -> None:
+        """"""
+        try:
+            self.socket.send(self.crypt.encrypt(plain))
+        except (BlockingIOError, InterruptedError):
+            # Voice is useless once it's late, drop the packet
+            pass
+        except OSError as ex:
+            # E.g. connection refused, the next pings tell whether UDP works again
+            self._logger.debug("UDP send failed: %s", ex)
+
+    def send(self, voice_packet: bytes) -> None:
+        """Send a voice packet, over UDP when we can."""
+        if self.is_udp_available():
+            self.__send_udp(voice_packet)
+        else:
+            self._connection.send_raw(PacketType.UDPTUNNEL, voice_packet)
+
+    def incoming_packets(self) -> List[UDPTunnelPacket]:
+        """Read and decrypt everything the server sent us over UDP, voice packets look like they came tunnelled."""
+        packets = []
+        while True:
+            try:
+                data = self.socket.recv(2048)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as ex:
+                self._logger.debug("UDP receive failed: %s", ex)
+                break
+            plain = self.crypt.decrypt(data)
+            if not plain:
+                self.__check_resync()
+                continue
+            if plain[0] >> 5 == VoiceType.PING:
+                self.__incoming_ping(plain)
+            else:
+                packets.append(UDPTunnelPacket(plain))
+        return packets
+
+    def __check_resync(self) -> None:
+        """Packets are coming in but we can't decrypt them, ask the server for its nonce once in a while."""
+        if not self.crypt.is_valid():
+            return
+        now = time.monotonic()
+        if now - self.crypt.last_good > self.RESYNC_TIMEOUT and now - self._resync_requested > self.RESYNC_TIMEOUT:
+            self._logger.debug("Requesting voice decryption resynchronization")
+            self._resync_requested = now
+            self._connection.send(PacketType.CRYPTSETUP, CryptSetup())
+
+    def __incoming_ping(self, plain: bytes) -> None:
+        """"""
+        now = time.monotonic()
+        if not self.is_udp_available():
+            self._logger.debug("Voice goes over UDP")
+        self._ping_received = now
+        try:
+            timestamp, _ = decode_varint(plain, 1)
+        except InvalidVarInt:
+            return
+        self.round_trip = max(now - timestamp / 1000, 0.0)
+
+    def close(self) -> None:
+        """"""
+        if self.socket is not None:
+            self.socket.close()
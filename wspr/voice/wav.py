@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import struct
+from typing import BinaryIO, Dict
+
+from wspr.voice.opus import CHANNELS, SAMPLE_RATE, SAMPLE_SIZE
+
+# Identifiers of LIST INFO chunks by the names used for Ogg tags
+INFO_IDS = {
+    "TITLE": b"INAM",
+    "ARTIST": b"IART",
+    "COMMENT": b"ICMT",
+    "DATE": b"ICRD",
+}
+
+
+class WavWriter:
+    """
+    Writes 16 bit PCM into a WAV file, the sizes in the header are filled in when it's closed.
+    Tags with a LIST INFO identifier are written as metadata, the rest ends up in the comment.
+    """
+
+    def __init__(self, stream: BinaryIO, tags: Dict[str, str], sample_rate: int = SAMPLE_RATE,
+                 channels: int = CHANNELS):
+        """The stream has to be seekable."""
+        self._stream: BinaryIO = stream
+        info = {INFO_IDS[key]: value for key, value in tags.items() if key in INFO_IDS}
+        extra = ", ".join("{}={}".format(key, value) for key, value in tags.items() if key not in INFO_IDS)
+        if extra:
+            info[b"ICMT"] = "; ".join(text for text in (info.get(b"ICMT"), extra) if text)
+        chunks = b""
+        for chunk_id, value in info.items():
+            data = value.encode("utf-8") + b"\0"
+            chunks += chunk_id + struct.pack("<I", len(data)) + data + (b"\0" if len(data) % 2 else b"")
+        header = b"RIFF" + bytes(4) + b"WAVE"
+        header += b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                                        sample_rate * channels * SAMPLE_SIZE, channels * SAMPLE_SIZE,
+                                        SAMPLE_SIZE * 8)
+        if chunks:
+            header += b"LIST" + struct.pack("<I", len(chunks) + 4) + b"INFO" + chunks
+        header += b"data" + bytes(4)
+        stream.write(header)
+        self._header_size: int = len(header)
+        # Bytes of PCM written
+        self.data_size: int = 0
+
+    @property
+    def size(self) -> int:
+        """Bytes written to the stream."""
+        return self._header_size + self.data_size
+
+    def write(self, pcm: bytes) -> None:
+        """"""
+        self._stream.write(pcm)
+        self.data_size += len(pcm)
+
+    def close(self) -> None:
+        """Fill in the sizes, the stream itself is left open."""
+        if self.data_size % 2:
+            self._stream.write(b"\0")
+        self._stream.seek(4)
+        self._stream.write(struct.pack("<I", self.size - 8 + self.data_size % 2))
+        self._stream.seek(self._header_size - 4)
+        self._stream.write(struct.pack("<I", self.data_size))
+        self._stream.seek(0, 2)